@@ -0,0 +1,126 @@
+import os
+import sys
+import asyncio
+import time
+import logging
+from tqdm import tqdm
+from inference_metrics import new_usage, record_cache_status
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from resilient_http import CircuitOpenError, backoff_delay, retry_after_from_exception
+
+
+def estimate_tokens(prompt, max_tokens):
+    """Rough token estimate for rate limiting: ~4 characters per token for the prompt plus the completion budget."""
+    return len(prompt) // 4 + max_tokens
+
+
+class TokenBucket:
+    """Token bucket that refills continuously at `rate_per_minute` and holds at most one minute of budget."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.fill_rate = rate_per_minute / 60.0
+        self.timestamp = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.fill_rate)
+        self.timestamp = now
+
+    async def acquire(self, amount=1):
+        # A single request larger than the bucket could never be served, so clamp it to the capacity
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.fill_rate)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits. A limit of None or 0 disables that bucket."""
+
+    def __init__(self, rpm=None, tpm=None):
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+
+    async def acquire(self, tokens):
+        if self.request_bucket is not None:
+            await self.request_bucket.acquire(1)
+        if self.token_bucket is not None:
+            await self.token_bucket.acquire(tokens)
+
+
+async def call_with_retry(request_fn, prompt, usage, tries=5, base_delay=2, max_delay=60, breaker=None):
+    """Async counterpart of resilient_http.call_with_backoff: jittered exponential backoff that honors Retry-After.
+    Requests are refused with CircuitOpenError while `breaker` is open; a request that used up its retries counts as
+    one failure of the breaker."""
+    for attempt in range(1, tries + 1):
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await request_fn(prompt, usage)
+        except Exception as e:
+            if isinstance(e, CircuitOpenError):
+                raise
+            if attempt == tries:
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay, retry_after_from_exception(e))
+            logging.warning(f'Request failed ({e}). Retrying in {delay:.1f} seconds (attempt {attempt}/{tries}).')
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+async def run_prompts_async(prompts, request_fn, concurrency=8, rpm=None, tpm=None, max_tokens=2000, desc='Inference', on_result=None,
+                            semaphore=None, limiter=None, progress=None, breaker=None, cache=None):
+    """Send all prompts through `request_fn` (an async callable taking a prompt and its usage dict) with at most
+    `concurrency` requests in flight and the given rpm/tpm limits.
+    A `semaphore`, `limiter` and `progress` bar can be passed in to share them between several prompt files, and a
+    resilient_http circuit breaker to stop sending requests to an endpoint that keeps failing.
+    With a response_cache.PromptCache, each prompt is looked up once; only misses are sent (with retries) and stored.
+    `on_result(i, output, usage)` is called as soon as each request completes, with the timing, attempts,
+    cache status and token usage of the request (see inference_metrics.new_usage).
+    Returns the outputs in the original prompt order."""
+    semaphore = semaphore or asyncio.Semaphore(concurrency)
+    limiter = limiter or RateLimiter(rpm=rpm, tpm=tpm)
+    outputs = [None] * len(prompts)
+    own_progress = progress is None
+    if own_progress:
+        progress = tqdm(total=len(prompts), desc=desc)
+
+    async def worker(i, prompt):
+        async with semaphore:
+            usage = new_usage()
+            usage['start'] = time.time()
+            output = None
+            if cache is not None:
+                output = cache.get(prompt)
+                record_cache_status(usage, output)
+            if output is None:
+                await limiter.acquire(estimate_tokens(prompt, max_tokens))
+                output = await call_with_retry(request_fn, prompt, usage, breaker=breaker)
+                if cache is not None:
+                    cache.put(prompt, output)
+            outputs[i] = output
+            usage['end'] = time.time()
+            if on_result is not None:
+                on_result(i, outputs[i], usage)
+            progress.update(1)
+
+    try:
+        await asyncio.gather(*(worker(i, prompt) for i, prompt in enumerate(prompts)))
+    finally:
+        if own_progress:
+            progress.close()
+
+    return outputs
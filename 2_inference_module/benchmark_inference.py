@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import argparse
+import logging
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from mock_llm_server import MockLLMState, load_canned_outputs, make_server
+from inference_metrics import percentile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from resilient_http import call_with_backoff, get_breaker
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_json(url, method='GET'):
+    request = urllib.request.Request(url, method=method, data=b'' if method == 'POST' else None)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def script_command(script, input_folder, out_dir, server_url, extra_args):
+    if script == 'openai':
+        command = [sys.executable, os.path.join(MODULE_DIR, 'run_inference_OpenAI.py'), '--api_base', f'{server_url}/v1']
+    else:
+        command = [sys.executable, os.path.join(MODULE_DIR, 'run_inference_LangChain_HF.py'), '--endpoint_url', f'{server_url}/generate']
+    # Keep the request metrics of the benchmark runs out of the working directory
+    metrics_dir = os.path.dirname(out_dir)
+    return command + ['--input_folder', input_folder, '--out_dir', out_dir, '--no_cache', '--overwrite',
+                      '--metrics_file', os.path.join(metrics_dir, 'metrics.jsonl'), '--metrics_summary', os.path.join(metrics_dir, 'metrics_summary.json')] + shlex.split(extra_args)
+
+
+def fixed_delay_post(url, payload, tries=3, delay=2):
+    """The policy resilient_http replaced: @retry(tries=3, delay=2) around a request without a timeout."""
+    for attempt in range(1, tries + 1):
+        try:
+            response = requests.post(url, json=payload)
+            response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException:
+            if attempt == tries:
+                raise
+            time.sleep(delay)
+
+
+def resilient_post(url, payload, timeout):
+    """resilient_get for POST: connect/read timeouts, jittered exponential backoff, Retry-After and a circuit breaker."""
+    def post():
+        response = requests.post(url, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response
+
+    return call_with_backoff(post, breaker=get_breaker(requests.utils.urlparse(url).netloc), retry_on=(requests.exceptions.RequestException,))
+
+
+def run_retry_benchmark(server_url, prompts, concurrency, timeout):
+    """Send the prompts to the mock HF endpoint with both retry policies and measure the end-to-end latency of every
+    request, retries and waits included."""
+    policies = {'fixed delay @retry': lambda payload: fixed_delay_post(f'{server_url}/generate', payload),
+                'resilient_http': lambda payload: resilient_post(f'{server_url}/generate', payload, timeout)}
+    results = []
+    for policy, send in policies.items():
+        get_json(f'{server_url}/reset', method='POST')
+
+        def timed(prompt):
+            start_time = time.time()
+            try:
+                send({'inputs': prompt})
+                failed = False
+            except requests.exceptions.RequestException:
+                failed = True
+            return time.time() - start_time, failed
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(timed, prompts))
+        wall_time = time.time() - start_time
+        latencies = [seconds for seconds, _ in outcomes]
+        stats = get_json(f'{server_url}/stats')
+        result = {'policy': policy,
+                  'requests': len(prompts),
+                  'failed': sum(failed for _, failed in outcomes),
+                  'requests throttled (429)': stats['throttled'],
+                  'wall time (s)': round(wall_time, 3),
+                  'p50 latency (s)': round(percentile(latencies, 50), 3),
+                  'p95 latency (s)': round(percentile(latencies, 95), 3),
+                  'p99 latency (s)': round(percentile(latencies, 99), 3)}
+        results.append(result)
+        print(f"{policy:20} {result['wall time (s)']:8.2f}s  p50 {result['p50 latency (s)']:.3f}s  p95 {result['p95 latency (s)']:.3f}s  "
+              f"p99 {result['p99 latency (s)']:.3f}s  failed {result['failed']}  throttled {result['requests throttled (429)']}")
+    return results
+
+
+def main():
+    """Drive the run_inference_* scripts against the local mock LLM server and report
+    requests/sec, p50/p95/p99 latency and wall time per prompt file.
+    With --mode retry, compare the tail latency of the fixed-delay @retry policy and resilient_http instead,
+    with 429s and stalled requests injected by the mock server."""
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('Start Logging')
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--input_folder', type=str, default='1_data_module/2_creating_prompts/data_with_prompts', help='Directory of prompt files')
+    parser.add_argument('--nr_of_prompts', type=int, default=50, help='Number of prompts taken from every prompt file')
+    parser.add_argument('--nr_of_files', type=int, default=None, help='Number of prompt files to benchmark (all by default)')
+    parser.add_argument('--scripts', type=str, default='openai,hf', help='Comma separated scripts to benchmark: openai, hf')
+    parser.add_argument('--openai_args', type=str, default='', help='Extra arguments for run_inference_OpenAI.py, e.g. "--async_mode --concurrency 16"')
+    parser.add_argument('--hf_args', type=str, default='', help='Extra arguments for run_inference_LangChain_HF.py')
+    parser.add_argument('--openai_outputs', type=str, default='2_inference_module/output_generated_by_models/generated_output_by_GPT4', help='Outputs replayed by the mock OpenAI endpoint')
+    parser.add_argument('--hf_outputs', type=str, default='2_inference_module/output_generated_by_models/generated_by_Llama', help='Outputs replayed by the mock HF endpoint')
+    parser.add_argument('--latency', type=float, default=0.2, help='Mean latency of the mock server in seconds')
+    parser.add_argument('--jitter', type=float, default=0.1, help='Latency jitter of the mock server in seconds')
+    parser.add_argument('--rate_429', type=float, default=0.0, help='Fraction of requests the mock server throttles with 429')
+    parser.add_argument('--rate_stall', type=float, default=0.0, help='Fraction of requests the mock server stalls')
+    parser.add_argument('--stall', type=float, default=10.0, help='Seconds a stalled request takes')
+    parser.add_argument('--mode', type=str, default='scripts', choices=['scripts', 'retry'], help='Benchmark the inference scripts, or the retry policies on their own')
+    parser.add_argument('--nr_of_requests', type=int, default=300, help='Requests per retry policy (--mode retry)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent requests (--mode retry)')
+    parser.add_argument('--timeout', type=float, default=2.0, help='Read timeout of resilient_http in seconds (--mode retry)')
+    parser.add_argument('--out_file', type=str, default='inference_benchmark.json', help='File to save the benchmark results')
+
+    args = parser.parse_args()
+
+    state = MockLLMState(load_canned_outputs(args.openai_outputs), load_canned_outputs(args.hf_outputs),
+                         latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+                         rate_stall=args.rate_stall, stall=args.stall)
+    server = make_server('127.0.0.1', 0, state)
+    server_url = f'http://127.0.0.1:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f'Mock LLM server running at {server_url}')
+
+    if args.mode == 'retry':
+        prompts = list(state.hf_outputs)[:args.nr_of_requests]
+        try:
+            results = run_retry_benchmark(server_url, prompts, args.concurrency, (5, args.timeout))
+        finally:
+            server.shutdown()
+        with open(args.out_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+        logging.info(f'Benchmark results saved to {args.out_file}')
+        return
+
+    work_dir = tempfile.mkdtemp()
+    file_names = sorted(os.listdir(args.input_folder))[:args.nr_of_files]
+    results = []
+
+    try:
+        for script in args.scripts.split(','):
+            extra_args = args.openai_args if script == 'openai' else args.hf_args
+            for file in file_names:
+                # Every file gets its own input folder, so the scripts process exactly one truncated prompt file per run
+                input_folder = os.path.join(work_dir, script, 'input', file.replace('.json', ''))
+                os.makedirs(input_folder)
+                with open(os.path.join(args.input_folder, file), 'r', encoding='utf-8') as f:
+                    prompts = json.load(f)[:args.nr_of_prompts]
+                with open(os.path.join(input_folder, file), 'w', encoding='utf-8') as f:
+                    json.dump(prompts, f, ensure_ascii=False)
+
+                get_json(f'{server_url}/reset', method='POST')
+                command = script_command(script, input_folder, os.path.join(work_dir, script, 'output'), server_url, extra_args)
+                start_time = time.time()
+                completed = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+                wall_time = time.time() - start_time
+                if completed.returncode != 0:
+                    logging.error(f'{script} failed on {file}:\n{completed.stderr[-2000:]}')
+
+                stats = get_json(f'{server_url}/stats')
+                latencies = [request['seconds'] for request in stats['served']]
+                result = {'script': script,
+                          'file': file,
+                          'prompts': len(prompts),
+                          'requests served': len(latencies),
+                          'requests throttled (429)': stats['throttled'],
+                          'wall time (s)': round(wall_time, 3),
+                          'requests/sec': round(len(latencies) / wall_time, 2),
+                          'p50 latency (s)': percentile(latencies, 50),
+                          'p95 latency (s)': percentile(latencies, 95),
+                          'p99 latency (s)': percentile(latencies, 99),
+                          'succeeded': completed.returncode == 0}
+                results.append(result)
+                print(f"{script:7} {file:55} {result['wall time (s)']:8.2f}s {result['requests/sec']:8.2f} req/s  "
+                      f"p50 {result['p50 latency (s)'] or 0:.3f}s  p95 {result['p95 latency (s)'] or 0:.3f}s  p99 {result['p99 latency (s)'] or 0:.3f}s")
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.out_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    logging.info(f'Benchmark results saved to {args.out_file}')
+
+
+if __name__ == '__main__':
+    main()
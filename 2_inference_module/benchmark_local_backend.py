@@ -0,0 +1,111 @@
+import json
+import time
+import argparse
+import logging
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, decoders
+from transformers import PreTrainedTokenizerFast, GPT2Config, GPT2LMHeadModel
+from local_hf_backend import load_local_model, generate_batched, generate_with_prefix_cache
+
+
+def read_prompts(input_file):
+
+    with open(input_file, 'r', encoding='utf-8') as prompt_file:
+        prompts = json.load(prompt_file)
+
+    return prompts
+
+
+def tiny_random_model(prompts, seed=0):
+    """A randomly initialised 2-layer GPT-2 with a word-level tokenizer over the words of the prompts, so the check
+    needs no download. Its generations are meaningless, but greedy decoding has to give the same tokens whatever
+    the batching, padding or prefix cache."""
+    vocab = {'<eos>': 0, '<unk>': 1}
+    for word in sorted({word for prompt in prompts for word in prompt.split()}):
+        vocab[word] = len(vocab)
+    word_tokenizer = Tokenizer(models.WordLevel(vocab, unk_token='<unk>'))
+    word_tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    word_tokenizer.decoder = decoders.WordPiece()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=word_tokenizer, eos_token='<eos>', unk_token='<unk>', pad_token='<eos>')
+    tokenizer.padding_side = 'left'
+    torch.manual_seed(seed)
+    model = GPT2LMHeadModel(GPT2Config(vocab_size=len(vocab), n_positions=2048, n_embd=32, n_layer=2, n_head=2, bos_token_id=0, eos_token_id=0))
+    model.eval()
+    return tokenizer, model
+
+
+def generate_one_at_a_time(prompts, tokenizer, model, max_new_tokens):
+    """Reference: plain greedy model.generate on every prompt on its own, without padding or cache reuse."""
+    outputs = []
+    for prompt in prompts:
+        inputs = tokenizer(prompt, return_tensors='pt').to(model.device)
+        with torch.no_grad():
+            generated = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tokenizer.pad_token_id)
+        outputs.append(tokenizer.decode(generated[0, inputs['input_ids'].shape[1]:], skip_special_tokens=True))
+    return outputs
+
+
+def check_greedy_equivalence(prompts, tokenizer, model, max_new_tokens, batch_sizes):
+    """Assert that generate_batched (every batch size) and generate_with_prefix_cache give the same greedy outputs
+    as generating one prompt at a time."""
+    reference = generate_one_at_a_time(prompts, tokenizer, model, max_new_tokens)
+    runs = {f'bucketed batches of {batch_size}': lambda batch_size=batch_size: generate_batched(prompts, tokenizer, model, batch_size=batch_size, max_new_tokens=max_new_tokens, temperature=0)
+            for batch_size in batch_sizes}
+    runs['shared prefix cache'] = lambda: generate_with_prefix_cache(prompts, tokenizer, model, max_new_tokens=max_new_tokens, temperature=0)
+    for name, run in runs.items():
+        outputs, _ = run()
+        different = [i for i, (output, expected) in enumerate(zip(outputs, reference)) if output != expected]
+        assert not different, f'{name}: greedy outputs of prompts {different} differ from one prompt at a time'
+        logging.info(f'{name}: same greedy outputs as one prompt at a time for all {len(prompts)} prompts')
+
+
+def main():
+    """Benchmark the local transformers backend on CPU: length-bucketed batches and shared-prefix KV cache reuse
+    against one prompt at a time.
+    The default tiny model keeps the benchmark runnable without a GPU (it only has to be downloaded once).
+    With --check, it asserts instead that both give the same greedy outputs as one prompt at a time, on a randomly
+    initialised tiny model (no download needed)."""
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('Start Logging')
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--prompt_file', type=str, default='1_data_module/2_creating_prompts/data_with_prompts/one_shot_prompts_test.json', help='Prompt file to sample from')
+    parser.add_argument('--model_name', type=str, default='sshleifer/tiny-gpt2', help='Huggingface model name')
+    parser.add_argument('--nr_of_prompts', type=int, default=32, help='Number of prompts to generate for')
+    parser.add_argument('--batch_size', type=int, default=8, help='Batch size of the bucketed run')
+    parser.add_argument('--max_new_tokens', type=int, default=64, help='Number of tokens to generate per prompt')
+    parser.add_argument('--device', type=str, default='cpu', help='Device')
+    parser.add_argument('--check', action='store_true', help='Only check batched and prefix-cached greedy generation against one prompt at a time on a random tiny model')
+
+    args = parser.parse_args()
+
+    prompts = read_prompts(args.prompt_file)[:args.nr_of_prompts]
+    if args.check:
+        tokenizer, model = tiny_random_model(prompts)
+        check_greedy_equivalence(prompts, tokenizer, model.to(args.device), args.max_new_tokens, [1, 4, args.batch_size])
+        return
+    tokenizer, model = load_local_model(args.model_name, device=args.device)
+
+    runs = {'one prompt at a time': lambda: generate_batched(prompts, tokenizer, model, batch_size=1, max_new_tokens=args.max_new_tokens, temperature=0.5),
+            f'bucketed batches of {args.batch_size}': lambda: generate_batched(prompts, tokenizer, model, batch_size=args.batch_size, max_new_tokens=args.max_new_tokens, temperature=0.5),
+            'shared prefix cache': lambda: generate_with_prefix_cache(prompts, tokenizer, model, max_new_tokens=args.max_new_tokens, temperature=0.5)}
+
+    results = {}
+    for name, run in runs.items():
+        start_time = time.time()
+        outputs, batch_stats = run()
+        elapsed_time = time.time() - start_time
+        assert all(output is not None for output in outputs)
+        total_tokens = sum(batch['new tokens'] for batch in batch_stats)
+        results[name] = {'wall time (s)': round(elapsed_time, 2), 'new tokens': total_tokens, 'tokens/sec': round(total_tokens / elapsed_time, 1)}
+
+    baseline = results['one prompt at a time']['wall time (s)']
+    for name in results:
+        results[name]['speedup'] = round(baseline / results[name]['wall time (s)'], 2) if results[name]['wall time (s)'] else None
+
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import random
+import argparse
+import logging
+import warnings
+import tracemalloc
+from collections import Counter
+from json_stream import iter_records
+from post_process_generated_string import EXTRACTORS, load_structure, detect_and_extract, parse_generated_text
+
+# model: (folder in output_generated_by_models, folder in postprocessed_outputs)
+MODELS = {
+    'Llama': ('generated_by_Llama', 'post_processed_Llama'),
+    'Mistral': ('generated_by_Mistral', 'post_processed_Mistral'),
+    'GPT4': ('generated_output_by_GPT4', 'post_processed_GPT4'),
+}
+
+
+def record_text(record):
+    # GPT-4 outputs store the generated text under 'extraction'
+    return record["generated_text"].strip() if "generated_text" in record else record["extraction"].strip()
+
+
+def build_corpus(outputs_dir, golden_dir, per_file, seed):
+    """Sample `per_file` records from every generated output file that has a post-processed counterpart
+    in `golden_dir`, together with the post-processed output as the golden reference."""
+    rng = random.Random(seed)
+    corpus = []
+    for model, (generated_folder, golden_folder) in MODELS.items():
+        for file in sorted(os.listdir(os.path.join(outputs_dir, generated_folder))):
+            golden_file = os.path.join(golden_dir, golden_folder, f'post_processed_{file}')
+            if not file.endswith('.json'):
+                continue
+            if not os.path.exists(golden_file):
+                logging.warning(f'No golden reference for {generated_folder}/{file}, skipped')
+                continue
+            records = list(iter_records(os.path.join(outputs_dir, generated_folder, file)))
+            golden = list(iter_records(golden_file))
+            for index in sorted(rng.sample(range(len(records)), min(per_file, len(records)))):
+                text = record_text(records[index])
+                if index >= len(golden) or record_text(golden[index]) != text:
+                    logging.warning(f'{golden_file} record {index} has a different text, skipped')
+                    continue
+                corpus.append({'model': model, 'file': file, 'index': index, 'text': text, 'golden': golden[index]['postprocessed']})
+    return corpus
+
+
+def best_time(function, texts, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for text in texts:
+            function(text)
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def peak_allocations(function, texts):
+    """Mean and max of the memory allocated at the peak of one call, in KiB."""
+    peaks = []
+    tracemalloc.start()
+    for text in texts:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function(text)
+        peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+    tracemalloc.stop()
+    return sum(peaks) / len(peaks), max(peaks)
+
+
+def check_golden(corpus):
+    """Per model: records whose parse equals the golden reference, and the shapes of the ones that differ."""
+    report = {}
+    for row in corpus:
+        shape, _ = detect_and_extract(row['text'])
+        entry = report.setdefault(row['model'], {'records': 0, 'equal to golden': 0, 'differing shapes': Counter()})
+        entry['records'] += 1
+        if parse_generated_text(row['text']) == row['golden']:
+            entry['equal to golden'] += 1
+        else:
+            entry['differing shapes'][shape] += 1
+    for entry in report.values():
+        entry['differing shapes'] = dict(entry['differing shapes'].most_common())
+    return report
+
+
+def main():
+    """Benchmark the post-processing on a fixed sample of the shipped model outputs: records/sec per model,
+    records/sec and allocations per extractor, and agreement with the shipped post-processed outputs."""
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('Start Logging')
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--outputs_dir', type=str, default='2_inference_module/output_generated_by_models', help='Directory with the generated outputs of the models')
+    parser.add_argument('--golden_dir', type=str, default='2_inference_module/postprocessed_outputs', help='Directory with the post-processed outputs used as golden reference')
+    parser.add_argument('--corpus_file', type=str, default='2_inference_module/parser_benchmark_corpus.jsonl', help='Benchmark corpus; it is sampled from the outputs if it does not exist')
+    parser.add_argument('--rebuild_corpus', action='store_true', help='Sample the corpus again even if the corpus file exists')
+    parser.add_argument('--per_file', type=int, default=20, help='Records sampled per generated output file')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the sample')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions; the best one is reported')
+    parser.add_argument('--out_file', type=str, default='parser_corpus_benchmark.json', help='File to save the benchmark results')
+
+    args = parser.parse_args()
+
+    # literal_eval on generated text raises SyntaxWarnings for things like "1st"
+    warnings.simplefilter('ignore', SyntaxWarning)
+
+    if args.rebuild_corpus or not os.path.exists(args.corpus_file):
+        corpus = build_corpus(args.outputs_dir, args.golden_dir, args.per_file, args.seed)
+        with open(args.corpus_file, 'w', encoding='utf-8') as f:
+            for row in corpus:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        logging.info(f'Sampled {len(corpus)} records into {args.corpus_file}')
+    corpus = list(iter_records(args.corpus_file))
+
+    golden = check_golden(corpus)
+    for model, entry in golden.items():
+        logging.info(f"{model}: {entry['equal to golden']}/{entry['records']} records equal to the golden reference, differing: {entry['differing shapes']}")
+
+    throughput = {}
+    for model in MODELS:
+        texts = [row['text'] for row in corpus if row['model'] == model]
+        seconds = best_time(parse_generated_text, texts, args.repeat)
+        throughput[model] = {'records': len(texts), 'records/sec': round(len(texts) / seconds, 1)}
+    seconds = best_time(parse_generated_text, [row['text'] for row in corpus], args.repeat)
+    throughput['all'] = {'records': len(corpus), 'records/sec': round(len(corpus) / seconds, 1)}
+    print(f"{'model':10} {'records':>8} {'records/sec':>12}")
+    for model, entry in throughput.items():
+        print(f"{model:10} {entry['records']:8} {entry['records/sec']:12.1f}")
+
+    # Every extractor is measured on the records that parse_generated_text actually runs it on
+    attempted = {}
+    for row in corpus:
+        profile = {}
+        detect_and_extract(row['text'], profile=profile)
+        for name in profile:
+            attempted.setdefault(name, []).append(row['text'])
+
+    extractors = [('load_structure', load_structure)] + [(name, extractor) for name, _, extractor, _ in EXTRACTORS]
+    per_extractor = []
+    print(f"{'extractor':35} {'records':>8} {'records/sec':>12} {'mean KiB':>9} {'max KiB':>9}")
+    for name, extractor in extractors:
+        texts = attempted.get(name)
+        if not texts:
+            continue
+        seconds = best_time(extractor, texts, args.repeat)
+        mean_peak, max_peak = peak_allocations(extractor, texts)
+        entry = {'extractor': name, 'records': len(texts), 'records/sec': round(len(texts) / seconds, 1),
+                 'mean peak KiB': round(mean_peak, 2), 'max peak KiB': round(max_peak, 2)}
+        per_extractor.append(entry)
+        print(f"{name:35} {entry['records']:8} {entry['records/sec']:12.1f} {entry['mean peak KiB']:9.2f} {entry['max peak KiB']:9.2f}")
+
+    with open(args.out_file, 'w', encoding='utf-8') as f:
+        json.dump({'golden check': golden, 'throughput': throughput, 'per extractor': per_extractor}, f, indent=4, ensure_ascii=False)
+    logging.info(f'Benchmark results saved to {args.out_file}')
+
+
+if __name__ == '__main__':
+    main()
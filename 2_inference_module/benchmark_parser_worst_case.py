@@ -0,0 +1,156 @@
+import re
+import json
+import math
+import time
+import random
+import argparse
+import logging
+import warnings
+import linear_patterns
+from post_process_generated_string import parse_generated_text
+
+# Inputs that made the original regexes backtrack: markers of a structure that is never closed, repeated many times.
+# Each family is a prefix, a unit repeated up to the requested length and a suffix.
+ADVERSARIAL = {
+    'subject without object': ('', "Subject: x\n\nPredicate: y\n\n", ''),
+    'subject line without object': ('', "Subject: a, Predicate: b, ", ''),
+    'open series of lists': ('', "['a', ", ''),
+    'open list of lists': ('[[', "['a', 'b', ", ']]'),
+    'brackets': ('', '[[', ''),
+    'open list of dicts': ('', "[{'a': 1}, {", ''),
+    'open code fences': ('', "```\nx", ''),
+    'open enumerated lists': ('', "1. [a, ", ''),
+    'open enumerated dicts': ('', "1. {a: ", ''),
+    'numbers without newline': ('', "1. a ", ''),
+    'open tuples': ('(', ', ', '\n)'),
+    'tuples across lines': ('', "(a, b, c\n", ')'),
+    'react loop': ('', "Thought: I need (a, b, c\nAction: Search[x, y]\n1. ['s', 'p', \n", ''),
+    'dash items': ('', "1. a - b - c ", ''),
+}
+SPECIAL_CHARACTERS = "[](){}'\",.:-` \n1aSubject: Predicate: Object: "
+
+
+def adversarial_text(family, length):
+    prefix, unit, suffix = ADVERSARIAL[family]
+    return prefix + unit * max(1, (length - len(prefix) - len(suffix)) // len(unit)) + suffix
+
+
+def random_text(length, seed):
+    rng = random.Random(seed)
+    return ''.join(rng.choice(SPECIAL_CHARACTERS) for _ in range(length))
+
+
+def time_parse(text, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        parse_generated_text(text)
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def growth_exponent(lengths, seconds):
+    """Slope of log(time) over log(length): ~1 for linear, ~2 for quadratic growth."""
+    xs = [math.log(length) for length in lengths]
+    ys = [math.log(max(second, 1e-9)) for second in seconds]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sum((x - x_mean) ** 2 for x in xs)
+
+
+# (scanner, the regex it replaces, characters to build random inputs from)
+REFERENCE_PATTERNS = [
+    (linear_patterns.find_dict_strings, lambda text: re.findall(r'Subject: (.*?), Predicate: (.*?), Object: (.*?)\n', text),
+     ['Subject: ', ', Predicate: ', ', Object: ', '\n', 'a', ' ', ',']),
+    (linear_patterns.find_dict_strings2, lambda text: re.findall(r'Subject: (.*?)\n\nPredicate: (.*?)\n\nObject: (.*?)\n\n', text, re.DOTALL),
+     ['Subject: ', '\n\nPredicate: ', '\n\nObject: ', '\n', '\n\n', 'a', 'Object: ']),
+    (linear_patterns.find_quoted_triples, lambda text: re.findall(r"\['(.*?)', '(.*?)', '(.*?)'\]", text),
+     ["['", "', '", "']", "'", '[', ']', ',', ' ', '\n', 'a']),
+    (linear_patterns.find_spaced_quoted_triples, lambda text: re.findall(r"\['(.*?)',\s*'(.*?)',\s*'(.*?)'\]", text),
+     ["['", "',", "']", "'", '[', ']', ',', ' ', '\n', 'a', '\t', '\x85']),
+    (linear_patterns.search_list_of_lists, lambda text: (lambda match: match and match.group(1))(re.search(r"(\[\[.*?\]\])", text, re.DOTALL)),
+     ['[[', ']]', '[', ']', 'a', '\n']),
+    (linear_patterns.search_list_of_dicts, lambda text: (lambda match: match and match.group(0))(re.search(r"\[\s*\{.*?\}\s*\]", text, re.DOTALL)),
+     ['[', '{', '}', ']', ' ', '\n', 'a']),
+    (linear_patterns.find_code_blocks, lambda text: re.findall(r"```(?:json)?\n([\s\S]*?)\n```", text),
+     ['```', 'json', '\n', '`', 'a', 'js']),
+    (lambda text: linear_patterns.find_numbered_brackets(text, '['), lambda text: re.findall(r'\d+\.\s+\[(.*?)\]', text),
+     ['1', '2', '.', ' ', '\n', '[', ']', 'a']),
+    (lambda text: linear_patterns.find_numbered_brackets(text, '{'), lambda text: re.findall(r'\d+\.\s+({.*?})', text),
+     ['1', '2', '.', ' ', '\n', '{', '}', 'a']),
+    (linear_patterns.find_numbered_lines, lambda text: re.findall(r'\d+\.\s+(.*?)\n', text),
+     ['1', '2', '.', ' ', '\n', 'a', '\t']),
+    (linear_patterns.find_numbered_line_rests, lambda text: re.findall(r"\d+\.\s*([^\n]+)", text),
+     ['1', '2', '.', ' ', '\n', 'a', '\t']),
+    (linear_patterns.find_tuples, lambda text: re.findall(r"\(\s*(.*?)\s*,\s*(.*?)\s*,\s*(.*?)\s*\)", text),
+     ['(', ')', ',', ' ', '\n', 'a', '\t', '\r', '\xa0', '\x85']),
+]
+
+
+def check_against_regexes(cases, max_length, seed):
+    """Compare every scanner with the regex it replaces on random short texts made of its delimiters.
+    Returns the number of texts on which they differ, per pattern."""
+    rng = random.Random(seed)
+    differences = {}
+    for k, (scanner, regex, pieces) in enumerate(REFERENCE_PATTERNS):
+        differences[k] = 0
+        for _ in range(cases):
+            text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, max_length)))
+            if scanner(text) != regex(text):
+                differences[k] += 1
+                logging.warning(f'Pattern {k} differs from its regex on {text!r}')
+    return differences
+
+
+def main():
+    """Time parse_generated_text on adversarial and random texts of growing length and report how the time grows
+    with the length. Before that, check the linear-time scanners against the regexes they replace."""
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('Start Logging')
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--min_length', type=int, default=1000, help='Length of the shortest texts in characters')
+    parser.add_argument('--max_length', type=int, default=64000, help='Length of the longest texts; lengths double from min_length')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions per text; the best one is reported')
+    parser.add_argument('--fuzz_cases', type=int, default=2000, help='Random texts per pattern for the check against the regexes')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the random texts')
+    parser.add_argument('--out_file', type=str, default='parser_worst_case_benchmark.json', help='File to save the benchmark results')
+
+    args = parser.parse_args()
+
+    # literal_eval on generated text raises SyntaxWarnings for things like "1st"
+    warnings.simplefilter('ignore', SyntaxWarning)
+
+    differences = check_against_regexes(args.fuzz_cases, 40, args.seed)
+    logging.info(f'{sum(differences.values())} differences from the original regexes in {args.fuzz_cases * len(differences)} random texts')
+
+    lengths = []
+    length = args.min_length
+    while length <= args.max_length:
+        lengths.append(length)
+        length *= 2
+
+    families = {family: (lambda length, family=family: adversarial_text(family, length)) for family in ADVERSARIAL}
+    families['random special characters'] = lambda length: random_text(length, args.seed)
+
+    results = []
+    print(f"{'family':30}" + ''.join(f'{length:>10}' for length in lengths) + '   exponent')
+    for family, make_text in families.items():
+        seconds = [time_parse(make_text(length), args.repeat) for length in lengths]
+        exponent = growth_exponent(lengths, seconds)
+        results.append({'family': family,
+                        'ms per length': {length: round(1000 * second, 3) for length, second in zip(lengths, seconds)},
+                        'growth exponent': round(exponent, 2)})
+        print(f'{family:30}' + ''.join(f'{1000 * second:10.2f}' for second in seconds) + f'   {exponent:8.2f}')
+
+    worst = max(results, key=lambda result: result['growth exponent'])
+    logging.info(f"Worst growth exponent: {worst['growth exponent']} ({worst['family']}); 1 is linear, 2 quadratic")
+
+    with open(args.out_file, 'w', encoding='utf-8') as f:
+        json.dump({'differences from the regexes': sum(differences.values()), 'results': results}, f, indent=4, ensure_ascii=False)
+    logging.info(f'Benchmark results saved to {args.out_file}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import os
+import json
+import time
+import argparse
+import logging
+import warnings
+from post_process_generated_string import parse_generated_text, run_cascade
+
+
+def read_generated_texts(outputs_dir):
+    """All generated texts under `outputs_dir` (including nested model folders), grouped by folder."""
+    texts = {}
+    for folder, _, files in sorted(os.walk(outputs_dir)):
+        for file in sorted(files):
+            if not file.endswith('.json'):
+                continue
+            with open(os.path.join(folder, file), 'r', encoding='utf-8') as f:
+                for record in json.load(f):
+                    text = record.get('generated_text', record.get('extraction'))
+                    texts.setdefault(os.path.relpath(folder, outputs_dir), []).append(text.strip())
+    return texts
+
+
+def time_parser(parse, texts):
+    start_time = time.perf_counter()
+    results = [parse(text) for text in texts]
+    return results, time.perf_counter() - start_time
+
+
+def main():
+    """Check that parse_generated_text gives the same output as the original cascade on every generated text
+    and compare their records/sec."""
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('Start Logging')
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--outputs_dir', type=str, default='2_inference_module/output_generated_by_models', help='Directory with the generated outputs of the models')
+    parser.add_argument('--out_file', type=str, default='post_processing_benchmark.json', help='File to save the benchmark results')
+
+    args = parser.parse_args()
+
+    # literal_eval on generated text raises SyntaxWarnings for things like "1st"
+    warnings.simplefilter('ignore', SyntaxWarning)
+
+    results = []
+    for folder, texts in read_generated_texts(args.outputs_dir).items():
+        # Both parsers run in the same process, so list(set) conversions come out in the same order
+        expected, cascade_time = time_parser(run_cascade, texts)
+        parsed, parser_time = time_parser(parse_generated_text, texts)
+        mismatches = [i for i, (a, b) in enumerate(zip(expected, parsed)) if repr(a) != repr(b)]
+        result = {'folder': folder,
+                  'records': len(texts),
+                  'cascade records/sec': round(len(texts) / cascade_time, 1),
+                  'parser records/sec': round(len(texts) / parser_time, 1),
+                  'speedup': round(cascade_time / parser_time, 2),
+                  'mismatches': len(mismatches)}
+        results.append(result)
+        print(f"{folder:45} {len(texts):6} records  cascade {result['cascade records/sec']:9.1f}/s  parser {result['parser records/sec']:9.1f}/s  "
+              f"x{result['speedup']:.2f}  mismatches: {len(mismatches)}")
+        for i in mismatches[:5]:
+            logging.warning(f'{folder} record {i}: cascade {expected[i]!r} != parser {parsed[i]!r}')
+
+    with open(args.out_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    logging.info(f'Benchmark results saved to {args.out_file}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import os
+import json
+import hashlib
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+
+
+def checkpoint_file(output_file):
+    """The append-only JSONL sidecar that sits next to an output file while it is being generated."""
+    return f'{output_file}.checkpoint.jsonl'
+
+
+def load_completed(output_file, prompts, output_key):
+    """Collect the outputs that are already done for `prompts`, from a previous final output file and from the sidecar.
+    Records whose prompt does not match the current prompt at the same index are ignored, so edited prompts are recomputed.
+    Returns a dict: index -> output."""
+    completed = {}
+    prompt_hashes = [prompt_hash(prompt) for prompt in prompts]
+
+    if os.path.exists(output_file):
+        with open(output_file, 'r', encoding='utf-8') as f:
+            try:
+                records = json.load(f)
+            except json.JSONDecodeError:
+                records = []
+        for record in records:
+            index = record.get('index')
+            if isinstance(index, int) and 0 <= index < len(prompts) and record.get('prompt') == prompts[index] and output_key in record:
+                completed[index] = record[output_key]
+
+    sidecar = checkpoint_file(output_file)
+    if os.path.exists(sidecar):
+        with open(sidecar, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line can be truncated if the process was killed while writing it
+                    continue
+                index = record.get('index')
+                if isinstance(index, int) and 0 <= index < len(prompts) and record.get('prompt_hash') == prompt_hashes[index]:
+                    completed[index] = record[output_key]
+
+    return completed
+
+
+def append_record(checkpoint, index, prompt, output, output_key):
+    """Append one finished record to the open sidecar file and flush it, so it survives a crash."""
+    record = {'index': index, 'prompt_hash': prompt_hash(prompt), output_key: output}
+    checkpoint.write(json.dumps(record, ensure_ascii=False) + '\n')
+    checkpoint.flush()
+
+
+def merge_records(prompts, completed, output_key):
+    """Build the final output layout: [{'index', 'prompt', output_key}] in prompt order."""
+    return [{'index': i, 'prompt': prompt, output_key: completed[i]} for i, prompt in enumerate(prompts) if i in completed]
+
+
+def write_output(output_file, generated_extractions):
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(generated_extractions, f, indent=4, ensure_ascii=False)
+
+    sidecar = checkpoint_file(output_file)
+    if os.path.exists(sidecar):
+        os.remove(sidecar)
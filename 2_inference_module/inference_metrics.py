@@ -0,0 +1,143 @@
+import json
+import math
+import argparse
+import threading
+
+# USD per 1K (prompt, completion) tokens. Models that are not listed (e.g. self-hosted Huggingface models) are counted as free.
+PRICES = {
+    'gpt-4': (0.03, 0.06),
+    'gpt-4-32k': (0.06, 0.12),
+    'gpt-4-turbo': (0.01, 0.03),
+    'gpt-4o': (0.005, 0.015),
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+}
+
+
+def count_tokens(text):
+    """Rough token count (~4 characters per token) for when neither the API nor a local tokenizer reports it."""
+    return len(text) // 4
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = PRICES.get(model, (0.0, 0.0))
+    return prompt_tokens / 1000 * prompt_price + completion_tokens / 1000 * completion_price
+
+
+def percentile(values, q):
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def new_usage():
+    """Per-request telemetry. The runners set the start/end time, the response functions count the attempts
+    and fill in the cache status and the token usage reported by the API or a local tokenizer."""
+    return {'start': None, 'end': None, 'attempts': 0, 'cache': 'off', 'prompt_tokens': None, 'completion_tokens': None, 'token_source': None}
+
+
+def record_cache_status(usage, cached_response):
+    if usage is not None:
+        usage['cache'] = 'miss' if cached_response is None else 'hit'
+
+
+class MetricsLogger:
+    """Appends one JSON line per completed request to `path` and keeps the records of this run for the summary."""
+
+    def __init__(self, path):
+        self.records = []
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def log(self, model, prompt_file, index, prompt, output, usage):
+        prompt_tokens = usage.get('prompt_tokens')
+        completion_tokens = usage.get('completion_tokens')
+        token_source = usage.get('token_source') or 'estimate'
+        if prompt_tokens is None:
+            prompt_tokens = count_tokens(prompt)
+        if completion_tokens is None:
+            completion_tokens = count_tokens(output)
+        billed = usage.get('cache') != 'hit'
+
+        record = {'model': model,
+                  'file': prompt_file,
+                  'index': index,
+                  'start': usage['start'],
+                  'end': usage['end'],
+                  'latency': usage['end'] - usage['start'],
+                  'prompt_tokens': prompt_tokens,
+                  'completion_tokens': completion_tokens,
+                  'token_source': token_source,
+                  'retries': max(0, usage.get('attempts', 0) - 1),
+                  'cache': usage.get('cache', 'off'),
+                  'cost': estimate_cost(model, prompt_tokens, completion_tokens) if billed else 0.0}
+        with self.lock:
+            self.records.append(record)
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def summarize_group(records):
+    latencies = [record['latency'] for record in records]
+    wall_time = max(record['end'] for record in records) - min(record['start'] for record in records)
+    prompt_tokens = sum(record['prompt_tokens'] for record in records)
+    completion_tokens = sum(record['completion_tokens'] for record in records)
+    return {'requests': len(records),
+            'wall time (s)': round(wall_time, 3),
+            'throughput (requests/sec)': round(len(records) / wall_time, 3) if wall_time > 0 else None,
+            'p50 latency (s)': round(percentile(latencies, 50), 3),
+            'p95 latency (s)': round(percentile(latencies, 95), 3),
+            'retries': sum(record['retries'] for record in records),
+            'cache hits': sum(record['cache'] == 'hit' for record in records),
+            'prompt tokens': prompt_tokens,
+            'completion tokens': completion_tokens,
+            'total tokens': prompt_tokens + completion_tokens,
+            'estimated cost (USD)': round(sum(record['cost'] for record in records), 4)}
+
+
+def summarize_metrics(records):
+    """Summary report per model and per (model, prompt file)."""
+    by_model = {}
+    by_file = {}
+    for record in records:
+        by_model.setdefault(record['model'], []).append(record)
+        by_file.setdefault((record['model'], record['file']), []).append(record)
+
+    return {'per model': {model: summarize_group(group) for model, group in sorted(by_model.items())},
+            'per prompt file': [dict({'model': model, 'file': file}, **summarize_group(group)) for (model, file), group in sorted(by_file.items())]}
+
+
+def read_metrics(metrics_file):
+    with open(metrics_file, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_summary(records, summary_file):
+    summary = summarize_metrics(records)
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=4, ensure_ascii=False)
+    for model, stats in summary['per model'].items():
+        print(f"{model}: {stats['requests']} requests, {stats['throughput (requests/sec)']} req/s, p95 {stats['p95 latency (s)']}s, "
+              f"{stats['total tokens']} tokens, ${stats['estimated cost (USD)']}")
+    return summary
+
+
+def main():
+    """Build the summary report from a metrics JSONL file written by the inference scripts."""
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--metrics_file', type=str, default='inference_metrics.jsonl', help='Metrics JSONL written by the inference scripts')
+    parser.add_argument('--summary_file', type=str, default='inference_metrics_summary.json', help='File to save the summary report')
+
+    args = parser.parse_args()
+
+    write_summary(read_metrics(args.metrics_file), args.summary_file)
+
+
+if __name__ == '__main__':
+    main()
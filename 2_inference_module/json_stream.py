@@ -0,0 +1,71 @@
+import os
+import re
+import json
+
+SEPARATOR = re.compile(r'[\s,]*')
+
+
+def iter_records(file_path, chunk_size=1 << 20):
+    """Yield the records of a JSON array file (or of a JSONL file) one at a time.
+    The file is read in chunks of `chunk_size` characters, so memory does not grow with the file size."""
+    if file_path.endswith('.jsonl'):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        eof = len(buffer) < chunk_size
+        position = SEPARATOR.match(buffer).end()
+        if not buffer.startswith('[', position):
+            raise ValueError(f'{file_path} does not contain a JSON array')
+        position += 1
+
+        while True:
+            position = SEPARATOR.match(buffer, position).end()
+            if buffer.startswith(']', position):
+                return
+            try:
+                if position == len(buffer):
+                    raise json.JSONDecodeError('Buffer exhausted', buffer, position)
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The record continues in the next chunk (or the file is broken)
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = len(chunk) < chunk_size
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield record
+
+
+class RecordWriter:
+    """Write records one at a time, either as JSONL or as a JSON array formatted exactly like
+    json.dump(records, f, indent=4, ensure_ascii=False). The file is written under a temporary name
+    and moved into place by close(), so an interrupted run never leaves a half-written output behind."""
+
+    def __init__(self, file_path, output_format='json'):
+        self.file_path = file_path
+        self.output_format = output_format
+        self.count = 0
+        self.file = open(file_path + '.tmp', 'w', encoding='utf-8')
+
+    def write(self, record):
+        if self.output_format == 'jsonl':
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        else:
+            self.file.write('[\n' if self.count == 0 else ',\n')
+            # json.dumps escapes newlines inside strings, so every '\n' here is a line break of the indentation
+            self.file.write('    ' + json.dumps(record, indent=4, ensure_ascii=False).replace('\n', '\n    '))
+        self.count += 1
+
+    def close(self):
+        if self.output_format == 'json':
+            self.file.write('[]' if self.count == 0 else '\n]')
+        self.file.close()
+        os.replace(self.file_path + '.tmp', self.file_path)
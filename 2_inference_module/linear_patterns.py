@@ -0,0 +1,345 @@
+"""Linear-time replacements for the backtracking regexes of the post-processing script.
+
+Every function returns exactly what the regex in its docstring returns with re.findall (or re.search), but never
+scans the same part of the text more than a bounded number of times. The lazy `(.*?)` groups of the original
+patterns made Python's backtracking engine retry every later start position on inputs without a closing
+delimiter, which is quadratic or worse in the length of the text.
+
+The results only depend on where the delimiters of the first successful match are, so they are found with
+str.find / bisect over the delimiter positions. Where a failed start position proves that all later ones on
+the same line (or in the text) fail too, the scan skips them.
+"""
+import re
+from bisect import bisect_left, bisect_right
+
+NON_SPACE = re.compile(r'\S')
+NUMBER_BEFORE_BRACKET = re.compile(r'\d\.\s+\[')
+NUMBER_BEFORE_BRACE = re.compile(r'\d\.\s+\{')
+NUMBER_BEFORE_SPACES = re.compile(r'\d\.(\s+)')
+NUMBER_BEFORE_OPTIONAL_SPACES = re.compile(r'\d\.(\s*)')
+
+
+def occurrences(text, sub):
+    """Start positions of all (possibly overlapping) occurrences of `sub` in `text`."""
+    found = []
+    position = text.find(sub)
+    while position != -1:
+        found.append(position)
+        position = text.find(sub, position + 1)
+    return found
+
+
+def first_at_or_after(positions, position):
+    """First of the sorted `positions` that is >= `position`, or None."""
+    k = bisect_left(positions, position)
+    return positions[k] if k < len(positions) else None
+
+
+def line_end(newlines, position, length):
+    """Position of the first newline at or after `position` (or the end of the text)."""
+    end = first_at_or_after(newlines, position)
+    return length if end is None else end
+
+
+def next_non_space(text, position):
+    match = NON_SPACE.search(text, position)
+    return len(text) if match is None else match.start()
+
+
+def find_dict_strings(text):
+    """re.findall(r'Subject: (.*?), Predicate: (.*?), Object: (.*?)\\n', text)"""
+    matches = []
+    position = 0
+    while True:
+        start = text.find('Subject: ', position)
+        if start == -1:
+            return matches
+        end = text.find('\n', start)
+        if end == -1:
+            return matches
+        subject_end = text.find(', Predicate: ', start + 9, end)
+        predicate_end = text.find(', Object: ', subject_end + 13, end) if subject_end != -1 else -1
+        if predicate_end != -1:
+            matches.append((text[start + 9:subject_end], text[subject_end + 13:predicate_end], text[predicate_end + 10:end]))
+        # A later start on the same line finds the same or later separators, so it cannot match either
+        position = end + 1
+
+
+def find_dict_strings2(text):
+    """re.findall(r'Subject: (.*?)\\n\\nPredicate: (.*?)\\n\\nObject: (.*?)\\n\\n', text, re.DOTALL)"""
+    matches = []
+    position = 0
+    while True:
+        start = text.find('Subject: ', position)
+        if start == -1:
+            return matches
+        subject_end = text.find('\n\nPredicate: ', start + 9)
+        predicate_end = text.find('\n\nObject: ', subject_end + 13) if subject_end != -1 else -1
+        object_end = text.find('\n\n', predicate_end + 10) if predicate_end != -1 else -1
+        if object_end == -1:
+            # The groups may span lines, so no later start can find a separator that this one did not
+            return matches
+        matches.append((text[start + 9:subject_end], text[subject_end + 13:predicate_end], text[predicate_end + 10:object_end]))
+        position = object_end + 2
+
+
+def find_quoted_triples(text):
+    """re.findall(r"\\['(.*?)', '(.*?)', '(.*?)'\\]", text)"""
+    matches = []
+    position = 0
+    while True:
+        start = text.find("['", position)
+        if start == -1:
+            return matches
+        end = text.find('\n', start)
+        if end == -1:
+            end = len(text)
+        first = text.find("', '", start + 2, end)
+        second = text.find("', '", first + 4, end) if first != -1 else -1
+        close = text.find("']", second + 4, end) if second != -1 else -1
+        if close == -1:
+            # A later start on the same line finds the same or later separators
+            position = end
+            continue
+        matches.append((text[start + 2:first], text[first + 4:second], text[second + 4:close]))
+        position = close + 2
+
+
+def find_spaced_quoted_triples(text):
+    """re.findall(r"\\['(.*?)',\\s*'(.*?)',\\s*'(.*?)'\\]", text)
+
+    The whitespace between the items may contain newlines, so the items of a triple can be on different lines.
+    For every "'," separator, it is precomputed whether a match can be completed after it, right to left, so every
+    start position is decided with a couple of binary searches."""
+    length = len(text)
+    newlines = occurrences(text, '\n')
+    closes = occurrences(text, "']")
+    separators = occurrences(text, "',")
+
+    # Start of the item that follows each separator, if the next non-space character is a quote
+    item_starts = []
+    for separator in separators:
+        quote = next_non_space(text, separator + 2)
+        item_starts.append(quote + 1 if text.startswith("'", quote) else None)
+
+    def first_ok(next_ok, item_start):
+        """The first separator after `item_start` on the same line that is marked in `next_ok`, or None."""
+        k = next_ok[bisect_left(separators, item_start)]
+        if k is None or separators[k] >= line_end(newlines, item_start, length):
+            return None
+        return k
+
+    def closes_on_line(item_start):
+        close = first_at_or_after(closes, item_start)
+        return close is not None and close < line_end(newlines, item_start, length)
+
+    # next_third[k]: first separator >= k after which the third item can be closed on its line
+    next_third = [None] * (len(separators) + 1)
+    for k in range(len(separators) - 1, -1, -1):
+        ok = item_starts[k] is not None and closes_on_line(item_starts[k])
+        next_third[k] = k if ok else next_third[k + 1]
+    # next_second[k]: first separator >= k after which the second item can be followed by a separator in next_third
+    next_second = [None] * (len(separators) + 1)
+    for k in range(len(separators) - 1, -1, -1):
+        ok = item_starts[k] is not None and first_ok(next_third, item_starts[k]) is not None
+        next_second[k] = k if ok else next_second[k + 1]
+
+    matches = []
+    position = 0
+    while True:
+        start = text.find("['", position)
+        if start == -1:
+            return matches
+        first = first_ok(next_second, start + 2)
+        if first is None:
+            position = start + 1
+            continue
+        second = first_ok(next_third, item_starts[first])
+        close = first_at_or_after(closes, item_starts[second])
+        matches.append((text[start + 2:separators[first]],
+                        text[item_starts[first]:separators[second]],
+                        text[item_starts[second]:close]))
+        position = close + 2
+
+
+def search_list_of_lists(text):
+    """re.search(r"(\\[\\[.*?\\]\\])", text, re.DOTALL).group(1), or None"""
+    start = text.find('[[')
+    if start == -1:
+        return None
+    end = text.find(']]', start + 2)
+    if end == -1:
+        return None
+    return text[start:end + 2]
+
+
+LIST_OF_DICTS_START = re.compile(r"\[\s*\{")
+LIST_OF_DICTS_END = re.compile(r"\}\s*\]")
+
+
+def search_list_of_dicts(text):
+    """re.search(r"\\[\\s*\\{.*?\\}\\s*\\]", text, re.DOTALL).group(0), or None"""
+    start = LIST_OF_DICTS_START.search(text)
+    if start is None:
+        return None
+    # If there is no end after the first start, there is none after a later one either
+    end = LIST_OF_DICTS_END.search(text, start.end())
+    if end is None:
+        return None
+    return text[start.start():end.end()]
+
+
+def find_code_blocks(text):
+    """re.findall(r"```(?:json)?\\n([\\s\\S]*?)\\n```", text)"""
+    matches = []
+    position = 0
+    while True:
+        start = text.find('```', position)
+        if start == -1:
+            return matches
+        if text.startswith('json\n', start + 3):
+            content = start + 8
+        elif text.startswith('\n', start + 3):
+            content = start + 4
+        else:
+            position = start + 1
+            continue
+        end = text.find('\n```', content)
+        if end == -1:
+            return matches
+        matches.append(text[content:end])
+        position = end + 4
+
+
+def find_numbered_brackets(text, opening='['):
+    """re.findall(r'\\d+\\.\\s+\\[(.*?)\\]', text) for opening='[' and
+    re.findall(r'\\d+\\.\\s+({.*?})', text) for opening='{' (this one keeps the braces)."""
+    candidates = NUMBER_BEFORE_BRACKET if opening == '[' else NUMBER_BEFORE_BRACE
+    length = len(text)
+    newlines = occurrences(text, '\n')
+    closes = occurrences(text, ']' if opening == '[' else '}')
+    matches = []
+    resume = 0
+    # A candidate is the last digit of a number followed by '.', whitespace and the opening bracket.
+    # The match the regex finds starts at the first digit, but the group only depends on what follows.
+    for candidate in candidates.finditer(text):
+        if candidate.start() < resume:
+            continue
+        item_start = candidate.end()
+        close = first_at_or_after(closes, item_start)
+        if close is None or close > line_end(newlines, item_start, length):
+            continue
+        matches.append(text[item_start:close] if opening == '[' else text[item_start - 1:close + 1])
+        resume = close + 1
+    return matches
+
+
+def find_numbered_lines(text):
+    """re.findall(r'\\d+\\.\\s+(.*?)\\n', text)"""
+    newlines = occurrences(text, '\n')
+    matches = []
+    resume = 0
+    for candidate in NUMBER_BEFORE_SPACES.finditer(text):
+        if candidate.start() < resume:
+            continue
+        spaces_start, spaces_end = candidate.span(1)
+        end = first_at_or_after(newlines, spaces_end)
+        if end is not None:
+            matches.append(text[spaces_end:end])
+            resume = end + 1
+            continue
+        # No newline after the whitespace: the regex backtracks into the whitespace and matches an empty item
+        # in front of its last newline, if that leaves at least one whitespace character before it
+        k = bisect_left(newlines, spaces_end) - 1
+        if k >= 0 and newlines[k] > spaces_start:
+            matches.append('')
+            resume = newlines[k] + 1
+    return matches
+
+
+def find_numbered_line_rests(text):
+    """re.findall(r"\\d+\\.\\s*([^\\n]+)", text)"""
+    length = len(text)
+    newlines = occurrences(text, '\n')
+    matches = []
+    resume = 0
+    for candidate in NUMBER_BEFORE_OPTIONAL_SPACES.finditer(text):
+        if candidate.start() < resume:
+            continue
+        spaces_start, spaces_end = candidate.span(1)
+        item_start = spaces_end
+        if item_start == length:
+            # Whitespace up to the end of the text: the regex backtracks until the item is the last
+            # whitespace character that is not a newline
+            rest = text[spaces_start:].rstrip('\n')
+            if not rest:
+                continue
+            item_start = spaces_start + len(rest) - 1
+        end = line_end(newlines, item_start, length)
+        matches.append(text[item_start:end])
+        resume = end
+    return matches
+
+
+def find_tuples(text):
+    """re.findall(r"\\(\\s*(.*?)\\s*,\\s*(.*?)\\s*,\\s*(.*?)\\s*\\)", text)
+
+    A match is '(' followed by three segments ended by ',', ',' and ')'. Each group is its segment without
+    the surrounding whitespace, which may contain newlines, while the group itself may not. The regex picks
+    the first comma, then the first second comma, then the first ')' that complete a match. So a segment that
+    starts at `a` can end at any position up to bound(a): the first non-space character after the first
+    newline that follows the segment's first non-space character. As for find_spaced_quoted_triples, it is
+    precomputed right to left for every comma whether a match can be completed after it."""
+    length = len(text)
+    newlines = occurrences(text, '\n')
+    commas = occurrences(text, ',')
+    closes = occurrences(text, ')')
+    after_newline = {}
+
+    def bound(segment_start):
+        first = next_non_space(text, segment_start)
+        if first == length:
+            return length
+        newline = first_at_or_after(newlines, first)
+        if newline is None:
+            return length
+        if newline not in after_newline:
+            after_newline[newline] = next_non_space(text, newline)
+        return after_newline[newline]
+
+    def first_ok(next_ok, segment_start):
+        """The first comma that can end the segment starting at `segment_start` and is marked in `next_ok`, or None."""
+        k = next_ok[bisect_left(commas, segment_start)]
+        if k is None or commas[k] > bound(segment_start):
+            return None
+        return k
+
+    def closes_segment(segment_start):
+        close = first_at_or_after(closes, segment_start)
+        return close is not None and close <= bound(segment_start)
+
+    # next_third[k]: first comma >= k after which the third segment can be closed
+    next_third = [None] * (len(commas) + 1)
+    for k in range(len(commas) - 1, -1, -1):
+        next_third[k] = k if closes_segment(commas[k] + 1) else next_third[k + 1]
+    # next_second[k]: first comma >= k after which the second segment can end at a comma in next_third
+    next_second = [None] * (len(commas) + 1)
+    for k in range(len(commas) - 1, -1, -1):
+        next_second[k] = k if first_ok(next_third, commas[k] + 1) is not None else next_second[k + 1]
+
+    matches = []
+    position = 0
+    while True:
+        start = text.find('(', position)
+        if start == -1:
+            return matches
+        first = first_ok(next_second, start + 1)
+        if first is None:
+            position = start + 1
+            continue
+        second = first_ok(next_third, commas[first] + 1)
+        close = first_at_or_after(closes, commas[second] + 1)
+        matches.append((text[start + 1:commas[first]].strip(),
+                        text[commas[first] + 1:commas[second]].strip(),
+                        text[commas[second] + 1:close].strip()))
+        position = close + 1
@@ -0,0 +1,126 @@
+import copy
+import time
+import logging
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, DynamicCache
+
+
+def load_local_model(model_name, device='cpu'):
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    # Decoder-only models have to be padded on the left for batched generation
+    tokenizer.padding_side = 'left'
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.to(device)
+    model.eval()
+    return tokenizer, model
+
+
+def sampling_args(temperature):
+    """Arguments of model.generate: sampling at `temperature`, or greedy decoding for a temperature of 0."""
+    if temperature > 0:
+        return {'do_sample': True, 'temperature': temperature}
+    return {'do_sample': False}
+
+
+def make_length_buckets(prompts, tokenizer, batch_size):
+    """Sort the prompt indices by token length and cut them into batches of similar length,
+    so that dynamic padding only pads up to the longest prompt of each batch."""
+    lengths = [len(ids) for ids in tokenizer(prompts, add_special_tokens=True)['input_ids']]
+    order = sorted(range(len(prompts)), key=lambda i: lengths[i])
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def generate_batched(prompts, tokenizer, model, batch_size=8, max_new_tokens=512, temperature=0.5, on_result=None):
+    """Generate a completion for every prompt with length-bucketed batches.
+    `on_result(i, text, usage)` is called for every prompt as soon as its batch is done, with the token counts
+    of that prompt and the start/end time of its batch.
+    Returns the generated texts in the original prompt order and the per-batch statistics."""
+    outputs = [None] * len(prompts)
+    batch_stats = []
+
+    for batch_number, batch in enumerate(make_length_buckets(prompts, tokenizer, batch_size)):
+        # padding=True pads to the longest prompt in the batch only (dynamic padding)
+        inputs = tokenizer([prompts[i] for i in batch], padding=True, return_tensors='pt').to(model.device)
+        prompt_length = inputs['input_ids'].shape[1]
+
+        start_time = time.time()
+        with torch.no_grad():
+            generated = model.generate(**inputs, max_new_tokens=max_new_tokens, pad_token_id=tokenizer.pad_token_id,
+                                       **sampling_args(temperature))
+        end_time = time.time()
+        elapsed_time = end_time - start_time
+
+        new_tokens = generated[:, prompt_length:]
+        nr_of_new_tokens = int((new_tokens != tokenizer.pad_token_id).sum())
+        tokens_per_second = nr_of_new_tokens / elapsed_time if elapsed_time > 0 else 0
+        batch_stats.append({'batch': batch_number, 'size': len(batch), 'prompt length': prompt_length,
+                            'new tokens': nr_of_new_tokens, 'seconds': elapsed_time, 'tokens/sec': tokens_per_second})
+        logging.info(f'Batch {batch_number}: {len(batch)} prompts padded to {prompt_length} tokens, {nr_of_new_tokens} new tokens, {tokens_per_second:.1f} tokens/sec')
+
+        texts = tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        prompt_tokens = inputs['attention_mask'].sum(dim=1).tolist()
+        completion_tokens = (new_tokens != tokenizer.pad_token_id).sum(dim=1).tolist()
+        for row, (i, text) in enumerate(zip(batch, texts)):
+            outputs[i] = text
+            if on_result is not None:
+                usage = {'start': start_time, 'end': end_time, 'attempts': 1, 'cache': 'miss',
+                         'prompt_tokens': prompt_tokens[row], 'completion_tokens': completion_tokens[row], 'token_source': 'tokenizer'}
+                on_result(i, text, usage)
+
+    return outputs, batch_stats
+
+
+def longest_common_prefix_length(token_id_lists):
+    shortest = min(token_id_lists, key=len)
+    for position, token_id in enumerate(shortest):
+        if any(ids[position] != token_id for ids in token_id_lists):
+            return position
+    return len(shortest)
+
+
+def generate_with_prefix_cache(prompts, tokenizer, model, max_new_tokens=512, temperature=0.5, on_result=None):
+    """Generate a completion for every prompt, reusing the KV cache of the longest token prefix shared by all prompts.
+    The prefix (instruction and fixed demonstrations of a prompt template) is run through the model once;
+    each prompt then only computes attention for its own continuation.
+    Prompts are generated one at a time, since left padding would shift the shared prefix.
+    `on_result(i, text, usage)` is called as in generate_batched.
+    Returns the generated texts in prompt order and per-prompt statistics."""
+    token_id_lists = tokenizer(prompts, add_special_tokens=True)['input_ids']
+    # Keep at least one token of every prompt outside the prefix, generate needs a token to start from
+    prefix_length = min(longest_common_prefix_length(token_id_lists), min(len(ids) for ids in token_id_lists) - 1)
+    logging.info(f'Shared prefix: {prefix_length} tokens')
+
+    prefix_cache = None
+    if prefix_length > 0:
+        prefix_ids = torch.tensor([token_id_lists[0][:prefix_length]], device=model.device)
+        with torch.no_grad():
+            prefix_cache = model(input_ids=prefix_ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+
+    outputs = [None] * len(prompts)
+    prompt_stats = []
+    for i, ids in enumerate(token_id_lists):
+        input_ids = torch.tensor([ids], device=model.device)
+        # generate extends the cache in place, so every prompt continues from its own copy of the prefix cache
+        past_key_values = copy.deepcopy(prefix_cache) if prefix_cache is not None else None
+
+        start_time = time.time()
+        with torch.no_grad():
+            generated = model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids), past_key_values=past_key_values,
+                                       max_new_tokens=max_new_tokens, pad_token_id=tokenizer.pad_token_id, **sampling_args(temperature))
+        end_time = time.time()
+        elapsed_time = end_time - start_time
+
+        new_tokens = generated[0, len(ids):]
+        nr_of_new_tokens = int((new_tokens != tokenizer.pad_token_id).sum())
+        prompt_stats.append({'batch': i, 'size': 1, 'prompt length': len(ids) - prefix_length, 'new tokens': nr_of_new_tokens,
+                             'seconds': elapsed_time, 'tokens/sec': nr_of_new_tokens / elapsed_time if elapsed_time > 0 else 0})
+
+        outputs[i] = tokenizer.decode(new_tokens, skip_special_tokens=True)
+        if on_result is not None:
+            usage = {'start': start_time, 'end': end_time, 'attempts': 1, 'cache': 'miss',
+                     'prompt_tokens': len(ids), 'completion_tokens': nr_of_new_tokens, 'token_source': 'tokenizer'}
+            on_result(i, outputs[i], usage)
+
+    return outputs, prompt_stats
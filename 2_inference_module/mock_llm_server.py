@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import random
+import argparse
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def load_canned_outputs(outputs_dir):
+    """Map every prompt in the generated output files of `outputs_dir` to the output the model gave for it."""
+    canned = {}
+    for file in sorted(os.listdir(outputs_dir)):
+        file_path = os.path.join(outputs_dir, file)
+        if not file.endswith('.json') or not os.path.isfile(file_path):
+            continue
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for record in json.load(f):
+                output = record.get('extraction', record.get('generated_text'))
+                if output is not None:
+                    canned[record['prompt']] = output
+    return canned
+
+
+class MockLLMState:
+    """Canned outputs, fault injection settings and the log of served requests shared by all handler threads."""
+
+    def __init__(self, openai_outputs, hf_outputs, latency=0.5, jitter=0.2, rate_429=0.0, retry_after=1, rate_stall=0.0, stall=30.0):
+        self.openai_outputs = openai_outputs
+        self.hf_outputs = hf_outputs
+        self.openai_fallback = list(openai_outputs.values()) or ['[]']
+        self.hf_fallback = list(hf_outputs.values()) or ['[]']
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rate_stall = rate_stall
+        self.stall = stall
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.served = []
+            self.throttled = 0
+
+    def record(self, route, seconds, status):
+        with self.lock:
+            if status == 429:
+                self.throttled += 1
+            else:
+                self.served.append({'route': route, 'seconds': seconds})
+
+    def stats(self):
+        with self.lock:
+            return {'served': list(self.served), 'throttled': self.throttled}
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.send_json(200, self.state.stats())
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        start_time = time.time()
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        if self.path == '/reset':
+            self.state.reset()
+            self.send_json(200, {'reset': True})
+            return
+
+        route = 'openai' if self.path.endswith('/chat/completions') else 'hf'
+
+        if random.random() < self.state.rate_429:
+            self.state.record(route, time.time() - start_time, 429)
+            self.send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}}, headers={'Retry-After': str(self.state.retry_after)})
+            return
+
+        if random.random() < self.state.rate_stall:
+            # A stalled request: the server only answers after `stall` seconds
+            time.sleep(self.state.stall)
+        else:
+            time.sleep(max(0.0, self.state.latency + random.uniform(-self.state.jitter, self.state.jitter)))
+
+        if route == 'openai':
+            prompt = request['messages'][-1]['content']
+            output = self.state.openai_outputs.get(prompt) or random.choice(self.state.openai_fallback)
+            body = {'id': 'chatcmpl-mock',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': request.get('model', 'mock'),
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': output}, 'finish_reason': 'stop'}],
+                    'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(output) // 4,
+                              'total_tokens': len(prompt) // 4 + len(output) // 4}}
+        else:
+            prompt = request.get('inputs', '')
+            output = self.state.hf_outputs.get(prompt) or random.choice(self.state.hf_fallback)
+            body = [{'generated_text': output}]
+
+        try:
+            self.send_json(200, body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a slow request (read timeout)
+            pass
+        self.state.record(route, time.time() - start_time, 200)
+
+
+def make_server(host, port, state):
+    handler = type('BoundMockLLMHandler', (MockLLMHandler,), {'state': state})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    """Local stand-in for the OpenAI chat completions endpoint and a Huggingface text-generation endpoint.
+    It replays the outputs stored in output_generated_by_models for known prompts."""
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('Start Logging')
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host to bind')
+    parser.add_argument('--port', type=int, default=8000, help='Port to bind')
+    parser.add_argument('--openai_outputs', type=str, default='2_inference_module/output_generated_by_models/generated_output_by_GPT4', help='Outputs replayed on /v1/chat/completions')
+    parser.add_argument('--hf_outputs', type=str, default='2_inference_module/output_generated_by_models/generated_by_Llama', help='Outputs replayed on any other POST path')
+    parser.add_argument('--latency', type=float, default=0.5, help='Mean response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Latency varies uniformly by +/- this many seconds')
+    parser.add_argument('--rate_429', type=float, default=0.0, help='Fraction of requests answered with 429 Too Many Requests')
+    parser.add_argument('--retry_after', type=int, default=1, help='Retry-After header of 429 responses in seconds')
+    parser.add_argument('--rate_stall', type=float, default=0.0, help='Fraction of requests that stall before they are answered')
+    parser.add_argument('--stall', type=float, default=30.0, help='Seconds a stalled request takes')
+
+    args = parser.parse_args()
+
+    state = MockLLMState(load_canned_outputs(args.openai_outputs), load_canned_outputs(args.hf_outputs),
+                         latency=args.latency, jitter=args.jitter, rate_429=args.rate_429, retry_after=args.retry_after,
+                         rate_stall=args.rate_stall, stall=args.stall)
+    server = make_server(args.host, args.port, state)
+    logging.info(f'Mock LLM server listening on http://{args.host}:{args.port} (OpenAI: /v1/chat/completions, HF: any other path)')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
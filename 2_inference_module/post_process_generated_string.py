@@ -2,9 +2,20 @@ import json
 import os
 import re
 import ast
+import time
+import signal
 import argparse
 import logging
+import threading
+from contextlib import contextmanager
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
+from json_stream import iter_records, RecordWriter
+from post_processing_manifest import file_hash, text_hash, parser_version, load_manifest, save_manifest, is_up_to_date, reusable_extractions
+from linear_patterns import (LIST_OF_DICTS_START, find_code_blocks, find_dict_strings, find_dict_strings2, find_numbered_brackets,
+                             find_numbered_line_rests, find_numbered_lines, find_quoted_triples, find_spaced_quoted_triples,
+                             find_tuples, search_list_of_dicts, search_list_of_lists)
 
 
 
@@ -15,15 +26,24 @@ def read_extraction_file(file_path):
         print(len(data))
     return data
 
+# json.loads can only succeed on text that starts with a JSON value
+JSON_START = re.compile(r'\s*[\[{"\-0-9tfnNI]')
+# The literal_eval branch of load_structure only succeeds for a Python string literal or a dict with a "triple(s)" key
+# (possibly parenthesized or after a comment). A list literal always ends in json.loads(list), which fails.
+PYTHON_LITERAL_START = re.compile(r'[ \t]*(?:[rRuUbBfF]{0,2}["\']|[({#\\])')
+
+
 def load_structure(text):
     """	treat the text as a data structure such as list, dict or JSON string, try to load the structure. If it fails, return Try REGEX."""
 
-    try:
-        extraction = json.loads(text)
-    except:
-        extraction = "Structure may be in the text. Try REGEX."
+    extraction = "Structure may be in the text. Try REGEX."
+    if JSON_START.match(text):
+        try:
+            extraction = json.loads(text)
+        except Exception:
+            extraction = "Structure may be in the text. Try REGEX."
 
-    if extraction == "Structure may be in the text. Try REGEX.":   
+    if extraction == "Structure may be in the text. Try REGEX." and PYTHON_LITERAL_START.match(text):
         try:
             extraction = ast.literal_eval(text)
             if "triples" in extraction:
@@ -31,45 +51,42 @@ def load_structure(text):
             elif "triple" in extraction:
                 extraction = extraction["triple"]
             extraction = json.loads(extraction)
-        except:
+        except Exception:
             extraction = "Structure may be in the text. Try REGEX."
 
     return extraction
 
+# The list of tuples pattern is linear as it is: every group stops at the next quote.
+# All other patterns are replaced by the scanners in linear_patterns.py, see there.
+LIST_OF_TUPLES = re.compile(r'\("([^"]+)", "([^"]+)", "([^"]+)"\)')
+
+
 def extract_series_of_lists(text):
-    pattern = r"\['(.*?)', '(.*?)', '(.*?)'\]"
-    matches = re.findall(pattern, text)
+    matches = find_quoted_triples(text)
     extraction = [list(match) for match in matches]
     if extraction == []:
         extraction = "No series of lists found in the text."
     return extraction
 
 def extract_list_of_lists(text):
-    try:
-        pattern = re.compile(r"(\[\[.*?\]\])", re.DOTALL)
-        triples_part = pattern.search(text).group(1)
-        # Regex to extract each triple
-        triple_pattern = re.compile(r"\['(.*?)',\s*'(.*?)',\s*'(.*?)'\]")
-        # Find all triples
-        triples = triple_pattern.findall(triples_part)
-        # Convert to list of lists
-        extraction = [list(triple) for triple in triples]
-    except:
-        extraction = "No list of lists found in the text."
+    triples_part = search_list_of_lists(text)
+    if triples_part is None:
+        return "No list of lists found in the text."
+    # Find all triples
+    triples = find_spaced_quoted_triples(triples_part)
+    # Convert to list of lists
+    extraction = [list(triple) for triple in triples]
 
     return extraction
     
 def extract_list_of_dicts(text):
-    # Define regex to extract the list of dictionaries
-    pattern = re.compile(r"\[\s*\{.*?\}\s*\]", re.DOTALL)
     # Extract the list of dictionaries
-    match = pattern.search(text)
-    if match:
-        list_of_dicts_string = match.group(0)
+    list_of_dicts_string = search_list_of_dicts(text)
+    if list_of_dicts_string is not None:
         # Parse the text into a list of lists
         try:
             extraction = ast.literal_eval(list_of_dicts_string)
-        except:
+        except Exception:
             extraction = "List of dictionaries not found in the text."
     else:
         extraction = "List of dictionaries not found in the text."
@@ -77,94 +94,74 @@ def extract_list_of_dicts(text):
     return extraction
     
 def extract_json_string(text):
-    # Define the regex pattern to match the JSON string
-    pattern = r"```(?:json)?\n([\s\S]*?)\n```"
-    match = re.findall(pattern, text)
+    match = find_code_blocks(text)
     try:
         extraction = json.loads(match[-1])  
-    except:
+    except Exception:
         extraction = "JSON string not found in the text."
     
     return extraction
 
 def extract_list_of_tuples(text):
-    try:
-        # Regular expression to match the tuples
-        pattern = r'\("([^"]+)", "([^"]+)", "([^"]+)"\)'
-        # Find all matches
-        matches = re.findall(pattern, text)
-        #Convert to list of lists
-        extraction = [list(match) for match in matches]
-        if extraction == []:
-            extraction = "No list of tuples found in the text." 
-    except:
-        extraction = "No list of tuples found in the text."
+    # Find all matches
+    matches = LIST_OF_TUPLES.findall(text)
+    #Convert to list of lists
+    extraction = [list(match) for match in matches]
+    if extraction == []:
+        extraction = "No list of tuples found in the text." 
     return extraction
 
 
 def extract_enumerated_lists(text):
-    try:
-        items = re.findall(r'\d+\.\s+\[(.*?)\]', text)
-        # Splitting each item into its components
-        extraction = [item.replace("'","").split(', ') for item in items]
-        if extraction == []:
-            extraction = "No enumerated list found in the text."
-    except:
+    items = find_numbered_brackets(text, '[')
+    # Splitting each item into its components
+    extraction = [item.replace("'","").split(', ') for item in items]
+    if extraction == []:
         extraction = "No enumerated list found in the text."
     
     return extraction
 
 def extract_enumerated_dicts(text):
+    items = find_numbered_brackets(text, '{')
     try:
-        items = re.findall(r'\d+\.\s+({.*?})', text)
-        try:
-            extraction = [json.loads(item) for item in items]
-        except:
-            extraction = []
-        if extraction == []:
-            extraction = "No enumerated dicts found in the text."
-    except:
+        extraction = [json.loads(item) for item in items]
+    except Exception:
+        extraction = []
+    if extraction == []:
         extraction = "No enumerated dicts found in the text."
         
     return extraction
 
 def extract_enumerated_list_of_tuples(text):
-    items = re.findall(r'\d+\.\s+\[(.*?)\]', text)
+    items = find_numbered_brackets(text, '[')
     extraction = [ast.literal_eval(item) for item in items]
     if extraction == []:
         extraction = "No enumerated list of tuples found in the text."
     return extraction
 
 def extract_enumerated_tuples(text):
-    pattern = re.compile(r"\(\s*(.*?)\s*,\s*(.*?)\s*,\s*(.*?)\s*\)")
     # Find all matches
-    matches = pattern.findall(text)
+    matches = find_tuples(text)
     extraction = [list(match) for match in matches]
     if extraction == []:
         extraction = "No enumerated tuples found in the text."
     return extraction
 
 def extract_dash_separeted_tuples(text):
-    try:
-        items = re.findall(r'\d+\.\s+(.*?)\n', text)
-        extraction = [item.replace('\"', '').split(' - ') for item in items]
-        if extraction == []:
-            extraction = "No enumerated tuples seperated by - found in the text."
-    except: 
+    items = find_numbered_lines(text)
+    extraction = [item.replace('\"', '').split(' - ') for item in items]
+    if extraction == []:
         extraction = "No enumerated tuples seperated by - found in the text."
     return extraction
 
 def extract_enumerated_dash_separated_strings(text):
-    try:
-        pattern = re.compile(r"\d+\.\s*([^\n]+)")
-        matches = pattern.findall(text)
-        matches = matches[-1].split(".")
-        extraction = []
-        for i in matches:
-            if " - " in i:
-                extraction.append(i.split(" - "))
-    except:
-        extraction = "No enumerated items separated by - found in the text."
+    matches = find_numbered_line_rests(text)
+    if matches == []:
+        return "No enumerated items separated by - found in the text."
+    extraction = []
+    for i in matches[-1].split("."):
+        if " - " in i:
+            extraction.append(i.split(" - "))
     
     if extraction == []:
         extraction = "No enumerated items separated by - found in the text."
@@ -172,144 +169,341 @@ def extract_enumerated_dash_separated_strings(text):
     return extraction
 
 def extract_enumerated_dict_strings(text):
-    #text = text.replace('\n', '')
-    try:
-        pattern = r'Subject: (.*?), Predicate: (.*?), Object: (.*?)\n'
-        matches = re.findall(pattern, text)
-        triples = []
-        for match in matches:
-            triple = {'subject': match[0], 'predicate': match[1], 'object': match[2]}
-            triples.append(triple)
-        if triples == []:
-            triples = "No enumerated dict strings found in the text."
-    except:
+    matches = find_dict_strings(text)
+    triples = []
+    for match in matches:
+        triple = {'subject': match[0], 'predicate': match[1], 'object': match[2]}
+        triples.append(triple)
+    if triples == []:
         triples = "No enumerated dict strings found in the text."
     return triples
 
 def extract_enumerated_dict_strings2(text):
+    # Find all matches
+    matches = find_dict_strings2(text)
+    if matches == []:
+        return "No enumerated dict strings found in the text."
+    # Only the last match is kept, as in the original script
+    match = matches[-1]
+    triple = {
+        "Subject": match[0].strip(),
+        "Predicate": match[1].strip(),
+        "Object": match[2].strip()
+        }
+    return [triple]
+
+
+
+# Markers an extractor cannot match without. They are cheap substring tests or anchored regexes
+# that stop at the first hit, so a record is scanned for markers instead of being run through every extractor.
+NUMBERED = re.compile(r"\d\.")
+NUMBERED_LIST = re.compile(r"\d\.\s+\[")
+NUMBERED_DICT = re.compile(r"\d\.\s+\{")
+NUMBERED_ITEM = re.compile(r"\d\.\s")
+
+
+def may_contain_tuple(text):
+    """extract_enumerated_tuples needs a '(' followed by two commas and a ')'."""
+    start = text.find('(')
+    if start == -1:
+        return False
+    first_comma = text.find(',', start + 1)
+    if first_comma == -1:
+        return False
+    second_comma = text.find(',', first_comma + 1)
+    if second_comma == -1:
+        return False
+    return text.find(')', second_comma + 1) != -1
+
+
+# (name, marker test, extractor, value the extractor returns when it finds nothing), in the order of the original cascade.
+# extract_enumerated_list_of_tuples uses the same pattern as extract_enumerated_lists, which always succeeds first,
+# it is kept so that the order matches run_cascade.
+EXTRACTORS = [
+    ('enumerated_dict_strings', lambda text: 'Subject: ' in text, extract_enumerated_dict_strings, "No enumerated dict strings found in the text."),
+    ('enumerated_dict_strings2', lambda text: 'Subject: ' in text, extract_enumerated_dict_strings2, "No enumerated dict strings found in the text."),
+    ('series_of_lists', lambda text: "['" in text, extract_series_of_lists, "No series of lists found in the text."),
+    ('list_of_lists', lambda text: '[[' in text, extract_list_of_lists, "No list of lists found in the text."),
+    ('list_of_dicts', lambda text: LIST_OF_DICTS_START.search(text) is not None, extract_list_of_dicts, "List of dictionaries not found in the text."),
+    ('json_string', lambda text: '```' in text, extract_json_string, "JSON string not found in the text."),
+    ('list_of_tuples', lambda text: '("' in text, extract_list_of_tuples, "No list of tuples found in the text."),
+    ('enumerated_lists', lambda text: NUMBERED_LIST.search(text) is not None, extract_enumerated_lists, "No enumerated list found in the text."),
+    ('enumerated_dash_separated_strings', lambda text: ' - ' in text and NUMBERED.search(text) is not None, extract_enumerated_dash_separated_strings, "No enumerated items separated by - found in the text."),
+    ('enumerated_dicts', lambda text: NUMBERED_DICT.search(text) is not None, extract_enumerated_dicts, "No enumerated dicts found in the text."),
+    ('enumerated_list_of_tuples', lambda text: NUMBERED_LIST.search(text) is not None, extract_enumerated_list_of_tuples, "No enumerated list of tuples found in the text."),
+    ('enumerated_tuples', may_contain_tuple, extract_enumerated_tuples, "No enumerated tuples found in the text."),
+    ('dash_separeted_tuples', lambda text: '\n' in text and NUMBERED_ITEM.search(text) is not None, extract_dash_separeted_tuples, "No enumerated tuples seperated by - found in the text."),
+]
+
+
+def finalize_extraction(extraction):
+    """Convert sets to lists and an unstructured answer to an empty list, as the original cascade did."""
+    if type(extraction) == list:
+        new_extraction = []
+        for item in extraction:
+            if type(item) == set:
+                item = list(item)
+                new_extraction.append(item) 
+                extraction = new_extraction
+
+    if extraction == "No structure found in the text.":
+        extraction = []
+
+    return extraction
+
+
+def record_attempt(profile, name, hit, seconds):
+    entry = profile.setdefault(name, {'attempts': 0, 'hits': 0, 'seconds': 0.0})
+    entry['attempts'] += 1
+    entry['hits'] += hit
+    entry['seconds'] += seconds
+
+
+def detect_and_extract(text, profile=None):
+    """Return (name of the shape found, raw extraction). Only the extractors whose marker occurs in the text are run,
+    in the cascade order, so the result is the same as running all of them one after the other.
+    If a `profile` dict is given, attempts, hits and seconds are added up per extractor."""
+    start_time = time.perf_counter()
+    extraction = load_structure(text)
+    found = extraction != "Structure may be in the text. Try REGEX."
+    if profile is not None:
+        record_attempt(profile, 'load_structure', found, time.perf_counter() - start_time)
+    if found:
+        return 'load_structure', extraction
+
+    for name, has_marker, extractor, not_found in EXTRACTORS:
+        if has_marker(text):
+            start_time = time.perf_counter()
+            extraction = extractor(text)
+            found = extraction != not_found
+            if profile is not None:
+                record_attempt(profile, name, found, time.perf_counter() - start_time)
+            if found:
+                return name, extraction
+
+    return 'no_structure', "No structure found in the text."
+
+
+class ParseTimeout(BaseException):
+    """Raised while parsing a record that used up its time budget. It is not an Exception,
+    so the try/except blocks of the extractors let it through."""
+
+
+def raise_parse_timeout(signum, frame):
+    raise ParseTimeout()
+
+
+@contextmanager
+def time_budget(seconds):
+    """Raise ParseTimeout in the with block once it has run for `seconds`. This uses SIGALRM, so the budget
+    only applies on Unix and in the main thread of a process (which is where the pool workers run tasks);
+    elsewhere, or with seconds=None/0, the block runs without a budget."""
+    if not seconds or not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    previous = signal.signal(signal.SIGALRM, raise_parse_timeout)
     try:
-        # Regular expression pattern to match Subject, Predicate, and Object
-        pattern = r'Subject: (.*?)\n\nPredicate: (.*?)\n\nObject: (.*?)\n\n'
-        # Find all matches
-        matches = re.findall(pattern, text, re.DOTALL)
-        # Convert matches to a list of dictionaries
-        triples = []
-        for match in matches:
-            triple = {
-                "Subject": match[0].strip(),
-                "Predicate": match[1].strip(),
-                "Object": match[2].strip()
-                }
-        triples.append(triple)
-        if triples == []:
-            triples = "No enumerated dict strings found in the text."
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    finally:
+        signal.signal(signal.SIGALRM, previous)
 
-    except:
-        triples = "No enumerated dict strings found in the text."
 
-    return triples
+def parse_generated_text(text):
+    """Parse the triples out of a generated text. Gives the same result as run_cascade."""
+    return finalize_extraction(detect_and_extract(text)[1])
+
+
+def run_cascade(text):
+    """The original post-processing: try load_structure and then every extractor on the whole text until one succeeds.
+    Kept as the reference for parse_generated_text."""
+    extraction = load_structure(text)
+    not_found = "Structure may be in the text. Try REGEX."
+    for name, has_marker, extractor, extractor_not_found in EXTRACTORS:
+        if extraction == not_found:
+            extraction = extractor(text)
+        not_found = extractor_not_found
+    if extraction == not_found:
+        extraction = "No structure found in the text."
+    return finalize_extraction(extraction)
+
 
-        
-    
-    
+
+def post_process_file(input_file, output_file, output_format='json', parse_budget=None, previous=None, version=None):
+    """Stream the records of a generated output file through the parser and write the post-processed records
+    as they come. A record whose parsing takes longer than `parse_budget` seconds gets no triples and the shape 'timeout'.
+    `previous` is the manifest entry of the last run for this input file (see post_processing_manifest.py): if the file
+    has not changed it is skipped, otherwise records whose text has not changed keep their previous extraction.
+    Returns the per-file counters: number of records, empty extractions, the shapes found, the indices of the
+    records that timed out, the number of reused records, the extractor profile and the new manifest entry."""
+    start_time = time.perf_counter()
+    input_hash = file_hash(input_file)
+    if is_up_to_date(previous, input_hash, output_file, output_format, version):
+        return {'file': input_file, 'records': len(previous['records']), 'empty': previous['empty'], 'shapes': previous['shapes'],
+                'timeouts': [], 'skipped': True, 'reused': len(previous['records']), 'profile': {},
+                'seconds': time.perf_counter() - start_time, 'manifest': previous}
+
+    reusable = reusable_extractions(previous, output_file, version)
+    shapes = Counter()
+    profile = {}
+    empty = 0
+    timeouts = []
+    reused = 0
+    record_shapes = []
+    writer = RecordWriter(output_file, output_format)
+    try:
+        for index, d in enumerate(iter_records(input_file)):
+            # GPT-4 outputs store the generated text under 'extraction'
+            text = d["generated_text"].strip() if "generated_text" in d else d["extraction"].strip()
+            record_hash = text_hash(text)
+            if record_hash in reusable:
+                shape, extraction = reusable[record_hash]
+                reused += 1
+            else:
+                try:
+                    with time_budget(parse_budget):
+                        shape, extraction = detect_and_extract(text, profile=profile)
+                except ParseTimeout:
+                    shape, extraction = 'timeout', []
+                    timeouts.append(index)
+                    logging.warning(f'{input_file} record {index}: parsing took longer than {parse_budget} seconds, no triples extracted')
+                extraction = finalize_extraction(extraction)
+            shapes[shape] += 1
+            record_shapes.append([record_hash, shape])
+            if extraction == []:
+                empty += 1
+            d['postprocessed'] = extraction
+            writer.write(d)
+    finally:
+        writer.close()
+
+    manifest = {'sha256': input_hash, 'parser': version, 'output_file': output_file, 'output_format': output_format,
+                'records': record_shapes, 'empty': empty, 'shapes': dict(shapes)}
+    return {'file': input_file, 'records': writer.count, 'empty': empty, 'shapes': dict(shapes), 'timeouts': timeouts,
+            'skipped': False, 'reused': reused, 'profile': profile, 'seconds': time.perf_counter() - start_time, 'manifest': manifest}
+
+
+def extractor_profile(results):
+    """Hit rate and time per extractor, per file and over all files."""
+    def summarize(entry):
+        return {'attempts': entry['attempts'],
+                'hits': entry['hits'],
+                'hit rate': round(entry['hits'] / entry['attempts'], 4),
+                'seconds': round(entry['seconds'], 4),
+                'ms per attempt': round(1000 * entry['seconds'] / entry['attempts'], 4)}
+
+    total = {}
+    per_file = {}
+    for result in sorted(results, key=lambda result: result['file']):
+        per_file[result['file']] = {name: summarize(entry) for name, entry in sorted(result['profile'].items(), key=lambda item: -item[1]['seconds'])}
+        for name, entry in result['profile'].items():
+            total_entry = total.setdefault(name, {'attempts': 0, 'hits': 0, 'seconds': 0.0})
+            for key in total_entry:
+                total_entry[key] += entry[key]
+
+    return {'total': {name: summarize(entry) for name, entry in sorted(total.items(), key=lambda item: -item[1]['seconds'])},
+            'per file': per_file}
+
+
+def list_input_files(input_folder, out_dir, recursive=False, output_format='json'):
+    """(input file, output file) pairs. With `recursive`, sub folders (e.g. generated_by_Mistral/generated_by_Phi)
+    are processed too and mirrored in `out_dir`. Checkpoint sidecars of unfinished inference runs are skipped."""
+    jobs = []
+    for folder, sub_folders, files in os.walk(input_folder):
+        sub_folders.sort()
+        out_folder = os.path.join(out_dir, os.path.relpath(folder, input_folder))
+        for file in sorted(files):
+            if not file.endswith(('.json', '.jsonl')) or file.endswith('.checkpoint.jsonl'):
+                continue
+            # The extension follows the output format, not the input, because the output is read back by its extension
+            outfile = re.sub(r'\.jsonl?$', f'.{output_format}', f'post_processed_{file}')
+            jobs.append((os.path.join(folder, file), os.path.normpath(os.path.join(out_folder, outfile))))
+        if not recursive:
+            break
+    return jobs
 
     
 def main():
     
     logging.basicConfig(level=logging.INFO)
     logging.info('Start Logging')
+    start_time = time.time()
     
     parser = argparse.ArgumentParser()
     
     parser.add_argument('--input_folder', type=str, default='generated_by_Mistral', help='Input directory')
     parser.add_argument('--out_dir', type=str, default='post_processed_Mistral', help='Output directory')
+    parser.add_argument('--recursive', action='store_true', help='Also process the sub folders of the input directory, e.g. the whole output_generated_by_models tree')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes; every process post-processes one file at a time')
+    parser.add_argument('--profile_file', type=str, default=None, help='File to save the hit rate and time per extractor and input file')
+    parser.add_argument('--output_format', type=str, default='json', choices=['json', 'jsonl'], help='Write the post-processed records as a JSON array or as JSONL')
+    parser.add_argument('--parse_budget', type=float, default=1.0, help='Seconds a single record may take to parse before it is recorded as a timeout (0 for no limit)')
+    parser.add_argument('--overwrite', action='store_true', help='Post-process every file again, even if it has not changed since the last run')
     
     args = parser.parse_args()
     
-    if os.path.exists(args.input_folder) and os.path.isdir(args.input_folder):
-        file_names = os.listdir(args.input_folder)
-    else:
+    if not (os.path.exists(args.input_folder) and os.path.isdir(args.input_folder)):
         print(f"The folder '{args.input_folder}' does not exist or is not a directory.")
-        
-    if not os.path.exists(args.out_dir):
-        os.makedirs(args.out_dir)
+        return
     
+    jobs = list_input_files(args.input_folder, args.out_dir, recursive=args.recursive, output_format=args.output_format)
+    for out_folder in {os.path.dirname(output_file) for _, output_file in jobs}:
+        os.makedirs(out_folder, exist_ok=True)
     
-    for file in tqdm(file_names):
-        print(file + '----------------')
-        post_processed_data = []
-        logging.info(f'Read the input file: {file}. Postprocessing started.')
-        filepath = os.path.join(args.input_folder, file)
-        outfile = f'post_processed_{file}'
-        data = read_extraction_file(filepath)
-        for i, d in enumerate(data):
-            print(i)
-            text =  d["generated_text"].strip() #d["extraction"].strip() #
-            extraction = load_structure(text)
-            print(extraction)
-
-            if extraction == "Structure may be in the text. Try REGEX.":
-                extraction = extract_enumerated_dict_strings(text)
-                print(extraction)
-            if extraction == "No enumerated dict strings found in the text.":
-                extraction = extract_enumerated_dict_strings2(text)
-                print(extraction)
-            if extraction == "No enumerated dict strings found in the text.":
-                extraction = extract_series_of_lists(text)
-                print(extraction)
-            if extraction == "No series of lists found in the text.":
-                extraction = extract_list_of_lists(text)
-                print(extraction)
-            if extraction == "No list of lists found in the text.":
-                extraction = extract_list_of_dicts(text)
-                print(extraction)
-            if extraction == "List of dictionaries not found in the text.":
-                extraction = extract_json_string(text)
-                print(extraction)
-            if extraction == "JSON string not found in the text.":
-                extraction = extract_list_of_tuples(text)
-                print(extraction)
-            if extraction == "No list of tuples found in the text.":
-                extraction = extract_enumerated_lists(text)
-                print(extraction)
-            if extraction == "No enumerated list found in the text.":
-                extraction = extract_enumerated_dash_separated_strings(text)
-                print(extraction)
-            if extraction == "No enumerated items separated by - found in the text.":
-                extraction = extract_enumerated_dicts(text)
-                print(extraction)
-            if extraction == "No enumerated dicts found in the text.":
-                extraction = extract_enumerated_list_of_tuples(text)
-                print(extraction)
-            if extraction == "No enumerated list of tuples found in the text.":
-                extraction = extract_enumerated_tuples(text)
-                print(extraction)
-            if extraction == "No enumerated tuples found in the text.":
-                extraction = extract_dash_separeted_tuples(text)
-                print(extraction)
-            if extraction == "No enumerated tuples seperated by - found in the text.":
-                extraction = "No structure found in the text."
-                print(extraction)
-            
-            if type(extraction) == list:
-                new_extraction = []
-                for item in extraction:
-                    if type(item) == set:
-                        item = list(item)
-                        new_extraction.append(item) 
-                        extraction = new_extraction
-
-            if extraction == "No structure found in the text.":
-                extraction = []
-                print(extraction)
-            
-            d['postprocessed'] = extraction
-            post_processed_data.append(d)
-            #print(d['postprocessed'])
-            
-        with open(os.path.join(args.out_dir, outfile), 'w', encoding='utf-8') as f:
-            json.dump(post_processed_data, f, indent=4, ensure_ascii=False) 
-            logging.info(f'Postprocessed output is written to {outfile}.')
+    # Files that have not changed since the last run into out_dir are skipped, and in changed files only the
+    # records whose text changed are parsed again. With --overwrite the files of this run are parsed again from
+    # scratch, but the manifest entries of the other files in out_dir are kept
+    manifest = load_manifest(args.out_dir)
+    version = parser_version()
+    keys = {input_file: os.path.relpath(input_file, args.input_folder) for input_file, _ in jobs}
+    previous = {input_file: None if args.overwrite else manifest.get(key) for input_file, key in keys.items()}
+    
+    results = []
+    try:
+        if args.workers > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                futures = [executor.submit(post_process_file, input_file, output_file, args.output_format, args.parse_budget, previous[input_file], version)
+                           for input_file, output_file in jobs]
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    results.append(future.result())
+                    manifest[keys[results[-1]['file']]] = results[-1]['manifest']
+        else:
+            for input_file, output_file in tqdm(jobs):
+                results.append(post_process_file(input_file, output_file, args.output_format, args.parse_budget, previous[input_file], version))
+                manifest[keys[input_file]] = results[-1]['manifest']
+    finally:
+        save_manifest(args.out_dir, manifest)
+    
+    shapes = Counter()
+    for result in sorted(results, key=lambda result: result['file']):
+        shapes.update(result['shapes'])
+        main_shape = max(result['shapes'], key=result['shapes'].get) if result['shapes'] else None
+        if result['skipped']:
+            continue
+        logging.info(f"{result['file']}: {result['records']} records, {result['empty']} without triples, mostly {main_shape}, "
+                     f"{result['reused']} unchanged records reused, {result['seconds']:.2f} seconds")
+    
+    total_records = sum(result['records'] for result in results)
+    elapsed_time = time.time() - start_time
+    logging.info(f'Post-processed {total_records} records in {len(results)} files in {elapsed_time:.2f} seconds ({total_records / elapsed_time:.0f} records/sec)')
+    skipped = sum(result['skipped'] for result in results)
+    reparsed = sum(result['records'] - result['reused'] for result in results)
+    logging.info(f'{skipped} unchanged files skipped, {reparsed} records parsed')
+    logging.info(f'Shapes found: {dict(shapes.most_common())}')
+    timeouts = sum(len(result['timeouts']) for result in results)
+    if timeouts:
+        logging.warning(f'{timeouts} records took longer than {args.parse_budget} seconds to parse and were left without triples')
+    
+    if args.profile_file:
+        profile = extractor_profile(results)
+        with open(args.profile_file, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, indent=4, ensure_ascii=False)
+        for name, entry in profile['total'].items():
+            logging.info(f"{name:35} {entry['attempts']:7} attempts  hit rate {entry['hit rate']:.2%}  {entry['seconds']:.3f} seconds")
+        logging.info(f'Extractor profile saved to {args.profile_file}')
     
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
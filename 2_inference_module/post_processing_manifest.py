@@ -0,0 +1,78 @@
+import os
+import json
+import hashlib
+from json_stream import iter_records
+
+MANIFEST_NAME = 'post_processing_manifest.json'
+# The code whose changes can change the post-processed output
+PARSER_SOURCES = ['post_process_generated_string.py', 'linear_patterns.py', 'json_stream.py']
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parser_version():
+    """Hash of the post-processing code, so that outputs written by another version of the parser are not reused."""
+    digest = hashlib.sha256()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for source in PARSER_SOURCES:
+        with open(os.path.join(folder, source), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def manifest_file(out_dir):
+    return os.path.join(out_dir, MANIFEST_NAME)
+
+
+def load_manifest(out_dir):
+    """input file -> {'sha256', 'parser', 'output_file', 'output_format', 'records': [[text hash, shape], ...], 'empty', 'shapes'}"""
+    path = manifest_file(out_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return {}
+
+
+def save_manifest(out_dir, manifest):
+    path = manifest_file(out_dir)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def is_up_to_date(entry, input_hash, output_file, output_format, version):
+    """The output of a previous run can be kept as it is: same input, same parser and the output is still there."""
+    return (entry is not None
+            and entry['sha256'] == input_hash
+            and entry['parser'] == version
+            and entry['output_file'] == output_file
+            and entry['output_format'] == output_format
+            and os.path.exists(output_file))
+
+
+def reusable_extractions(entry, output_file, version):
+    """text hash -> (shape, post-processed extraction) from the output a previous run wrote for this input file.
+    Nothing is reused if the parser changed; records that timed out are parsed again."""
+    if entry is None or entry['parser'] != version or entry['output_file'] != output_file or not os.path.exists(output_file):
+        return {}
+    shapes = {record_hash: shape for record_hash, shape in entry['records'] if shape != 'timeout'}
+    reusable = {}
+    for record in iter_records(output_file):
+        text = record["generated_text"] if "generated_text" in record else record["extraction"]
+        record_hash = text_hash(text.strip())
+        if record_hash in shapes and 'postprocessed' in record:
+            reusable[record_hash] = (shapes[record_hash], record['postprocessed'])
+    return reusable
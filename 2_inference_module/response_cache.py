@@ -0,0 +1,82 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def cache_key(backend, model_name, prompt, temperature, max_tokens, endpoint=None):
+    """Key of a response. The responses of a non-default endpoint (an --api_base or --endpoint_url, e.g. the mock
+    server) are kept apart from those of the real API; keys of the default endpoint are the same as before."""
+    fields = [backend, model_name, prompt, temperature, max_tokens]
+    if endpoint:
+        fields.append(endpoint)
+    key = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed cache of LLM responses keyed by (backend, model_name, prompt, temperature, max_tokens, endpoint).
+    Holds at most `max_entries` responses and evicts the least recently used ones beyond that. The number of rows
+    is counted once on open and then kept in memory, so a put does not count the table."""
+
+    def __init__(self, path='llm_response_cache.sqlite', max_entries=100000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, last_access REAL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        self.connection.commit()
+        self.count = self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def get(self, backend, model_name, prompt, temperature, max_tokens, endpoint=None):
+        key = cache_key(backend, model_name, prompt, temperature, max_tokens, endpoint)
+        with self.lock:
+            row = self.connection.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+            self.connection.commit()
+        return row[0]
+
+    def put(self, backend, model_name, prompt, temperature, max_tokens, response, endpoint=None):
+        key = cache_key(backend, model_name, prompt, temperature, max_tokens, endpoint)
+        with self.lock:
+            updated = self.connection.execute('UPDATE responses SET response = ?, last_access = ? WHERE key = ?', (response, time.time(), key))
+            if updated.rowcount == 0:
+                self.connection.execute('INSERT INTO responses (key, response, last_access) VALUES (?, ?, ?)', (key, response, time.time()))
+                self.count += 1
+            if self.count > self.max_entries:
+                deleted = self.connection.execute('DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)', (self.count - self.max_entries,))
+                self.count -= deleted.rowcount
+            self.connection.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0
+        return {'hits': self.hits, 'misses': self.misses, 'hit rate': round(hit_rate, 4)}
+
+    def close(self):
+        self.connection.close()
+
+
+class PromptCache:
+    """The responses of one model (backend, model_name, temperature, max_tokens, endpoint) in a ResponseCache,
+    looked up by prompt. Used by run_prompts_async, which checks the cache once per prompt before the retried call."""
+
+    def __init__(self, cache, backend, model_name, temperature, max_tokens, endpoint=None):
+        self.cache = cache
+        self.key_fields = (backend, model_name, temperature, max_tokens)
+        self.endpoint = endpoint
+
+    def get(self, prompt):
+        backend, model_name, temperature, max_tokens = self.key_fields
+        return self.cache.get(backend, model_name, prompt, temperature, max_tokens, self.endpoint)
+
+    def put(self, prompt, response):
+        backend, model_name, temperature, max_tokens = self.key_fields
+        self.cache.put(backend, model_name, prompt, temperature, max_tokens, response, self.endpoint)
@@ -1,15 +1,18 @@
 from langchain_huggingface import HuggingFaceEndpoint
 from getpass import getpass
 import os
+import sys
 import json
-from retry import retry
 import argparse
 import logging
 import time
 from tqdm import tqdm
+from checkpoint import load_completed, append_record, merge_records, write_output, checkpoint_file
+from response_cache import ResponseCache
+from inference_metrics import MetricsLogger, new_usage, record_cache_status, write_summary
 
-HUGGINGFACEHUB_API_TOKEN = getpass()
-os.environ["HUGGINGFACEHUB_API_TOKEN"] = "your_HF_API_token_here"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from resilient_http import resilient, LLM_TIMEOUT
 
 def read_prompts(input_file): 
     
@@ -18,6 +21,29 @@ def read_prompts(input_file):
         
     return prompts
 
+# Get an answer from the Huggingface endpoint. Only the request is retried, the cache is checked once in HF_response
+@resilient(tries=5, base_delay=2, max_delay=60, breaker_name='huggingface')
+def HF_request(llm, prompt, usage=None):
+    if usage is not None:
+        usage['attempts'] += 1
+    return str(llm.invoke(prompt))
+
+
+# Get an answer from the response cache or, on a miss, from the Huggingface endpoint
+def HF_response(llm, prompt, model_name, temperature, max_tokens, cache=None, usage=None, endpoint=None):
+    if cache is not None:
+        response = cache.get('huggingface', model_name, prompt, temperature, max_tokens, endpoint)
+        record_cache_status(usage, response)
+        if response is not None:
+            return response
+    
+    response = HF_request(llm, prompt, usage=usage)
+    
+    if cache is not None:
+        cache.put('huggingface', model_name, prompt, temperature, max_tokens, response, endpoint)
+    
+    return response
+
 #repo_id = "mistralai/Mistral-7B-Instruct-v0.3"
 #repo_id = "microsoft/Phi-3-mini-4k-instruct"
 #repo_id = "meta-llama/Meta-Llama-3-8B-Instruct"
@@ -35,6 +61,17 @@ def main():
     parser.add_argument('--input_folder', type=str, default='data_with_prompts', help='Input directory')
     parser.add_argument('--model_name', type=str, default="meta-llama/Meta-Llama-3-8B-Instruct", help='Huggingface model name')
     parser.add_argument('--out_dir', type=str, default='generated_by_Llama', help='Output directory')
+    parser.add_argument('--overwrite', action='store_true', help='Ignore existing outputs and checkpoints and regenerate everything')
+    parser.add_argument('--cache_file', type=str, default='llm_response_cache.sqlite', help='SQLite file of the LLM response cache')
+    parser.add_argument('--cache_size', type=int, default=100000, help='Maximum number of cached responses (least recently used are evicted)')
+    parser.add_argument('--no_cache', action='store_true', help='Bypass the response cache, e.g. for sampling runs')
+    parser.add_argument('--backend', type=str, default='endpoint', choices=['endpoint', 'local'], help='endpoint: HuggingFaceEndpoint API, local: in-process transformers model')
+    parser.add_argument('--batch_size', type=int, default=8, help='Batch size for the local backend')
+    parser.add_argument('--device', type=str, default='cpu', help='Device for the local backend')
+    parser.add_argument('--endpoint_url', type=str, default=None, help='Text-generation endpoint URL to use instead of the Huggingface hub repo, e.g. a local mock endpoint')
+    parser.add_argument('--metrics_file', type=str, default='inference_metrics.jsonl', help='JSONL file the per-request latency, token usage, retries and cache status are appended to')
+    parser.add_argument('--metrics_summary', type=str, default='inference_metrics_summary.json', help='File to save the per-file/per-model summary of this run')
+    parser.add_argument('--prefix_cache', action='store_true', help='Local backend: compute the KV cache of the prefix shared by all prompts of a file once and reuse it')
 
     args = parser.parse_args()
     
@@ -47,8 +84,22 @@ def main():
     if not os.path.exists(args.out_dir):
         os.makedirs(args.out_dir)
 
-    llm = HuggingFaceEndpoint(
-    repo_id=args.model_name, max_new_tokens=512, temperature=0.5, huggingfacehub_api_token=os.environ["HUGGINGFACEHUB_API_TOKEN"])
+    if args.backend == 'local':
+        # Imported here so that the endpoint backend (and the scheduler, which imports this module) runs without torch
+        from local_hf_backend import load_local_model, generate_batched, generate_with_prefix_cache
+        tokenizer, model = load_local_model(args.model_name, device=args.device)
+    elif args.endpoint_url:
+        llm = HuggingFaceEndpoint(
+        endpoint_url=args.endpoint_url, max_new_tokens=512, temperature=0.5, timeout=LLM_TIMEOUT)
+    else:
+        HUGGINGFACEHUB_API_TOKEN = getpass()
+        os.environ["HUGGINGFACEHUB_API_TOKEN"] = "your_HF_API_token_here"
+        
+        llm = HuggingFaceEndpoint(
+        repo_id=args.model_name, max_new_tokens=512, temperature=0.5, timeout=LLM_TIMEOUT, huggingfacehub_api_token=os.environ["HUGGINGFACEHUB_API_TOKEN"])
+    
+    cache = None if args.no_cache else ResponseCache(args.cache_file, max_entries=args.cache_size)
+    metrics = MetricsLogger(args.metrics_file)
     
     for file in file_names:
         prompt_file = f'{args.input_folder}/{file}'
@@ -58,19 +109,78 @@ def main():
     
         logging.info(f'Read the input file: {prompt_file}. Number of instances: {total_instances}. Extraction started.')
     
-        generated_extractions = []
+        outfile = prompt_file.split('/')[-1]
+        output_file = f'{args.out_dir}/{outfile}'
+        
+        completed = {} if args.overwrite else load_completed(output_file, prompts, 'generated_text')
+        pending = [i for i in range(total_instances) if i not in completed]
+        logging.info(f'{len(completed)} instances already done, {len(pending)} left.')
     
-        for i, prompt in enumerate(tqdm(prompts, desc=f"Passing inputs through {args.model_name} for inference", total=total_instances)):
-            generated_text = llm.invoke(prompt)
-            #print(generated_text)
-            generated_extractions.append({"index": i, "prompt": prompt, "generated_text": str(generated_text)})
+        with open(checkpoint_file(output_file), 'w' if args.overwrite else 'a', encoding='utf-8') as checkpoint:
+            if args.backend == 'local':
+                # Serve what we can from the cache and batch the rest through the local model
+                to_generate = []
+                for i in pending:
+                    usage = new_usage()
+                    usage['start'] = time.time()
+                    generated_text = cache.get('local_hf', args.model_name, prompts[i], 0.5, 512) if cache is not None else None
+                    if generated_text is None:
+                        to_generate.append(i)
+                    else:
+                        usage['end'] = time.time()
+                        usage['attempts'] = 1
+                        record_cache_status(usage, generated_text)
+                        completed[i] = generated_text
+                        append_record(checkpoint, i, prompts[i], generated_text, 'generated_text')
+                        metrics.log(args.model_name, file, i, prompts[i], generated_text, usage)
+                
+                def on_result(position, generated_text, usage):
+                    i = to_generate[position]
+                    completed[i] = generated_text
+                    append_record(checkpoint, i, prompts[i], generated_text, 'generated_text')
+                    if cache is not None:
+                        cache.put('local_hf', args.model_name, prompts[i], 0.5, 512, generated_text)
+                    else:
+                        usage['cache'] = 'off'
+                    metrics.log(args.model_name, file, i, prompts[i], generated_text, usage)
+                
+                if not to_generate:
+                    batch_stats = []
+                elif args.prefix_cache:
+                    _, batch_stats = generate_with_prefix_cache([prompts[i] for i in to_generate], tokenizer, model,
+                                                                max_new_tokens=512, temperature=0.5, on_result=on_result)
+                else:
+                    _, batch_stats = generate_batched([prompts[i] for i in to_generate], tokenizer, model, batch_size=args.batch_size,
+                                                      max_new_tokens=512, temperature=0.5, on_result=on_result)
+                if batch_stats:
+                    total_tokens = sum(batch['new tokens'] for batch in batch_stats)
+                    total_seconds = sum(batch['seconds'] for batch in batch_stats)
+                    logging.info(f'Local generation: {total_tokens} tokens in {total_seconds:.1f} seconds ({total_tokens / total_seconds:.1f} tokens/sec)')
+            else:
+                for i in tqdm(pending, desc=f"Passing inputs through {args.model_name} for inference", total=len(pending)):
+                    usage = new_usage()
+                    usage['start'] = time.time()
+                    generated_text = HF_response(llm, prompts[i], args.model_name, temperature=0.5, max_tokens=512, cache=cache, usage=usage, endpoint=args.endpoint_url)
+                    usage['end'] = time.time()
+                    #print(generated_text)
+                    completed[i] = generated_text
+                    append_record(checkpoint, i, prompts[i], generated_text, 'generated_text')
+                    metrics.log(args.model_name, file, i, prompts[i], generated_text, usage)
 
-        outfile = prompt_file.split('/')[-1]
+        generated_extractions = merge_records(prompts, completed, 'generated_text')
+    
+        logging.info(f'Extraction finished. Saved the results to {output_file}')
+    
+        write_output(output_file, generated_extractions)
     
-        logging.info(f'Extraction finished. Saved the results to {args.out_dir}/{outfile}')
+    if cache is not None:
+        logging.info(f'Response cache: {cache.stats()}')
+        cache.close()
     
-        with open(f'{args.out_dir}/{outfile}', 'w', encoding='utf-8') as output_file:
-            json.dump(generated_extractions, output_file, indent=4, ensure_ascii=False)
+    metrics.close()
+    if metrics.records:
+        write_summary(metrics.records, args.metrics_summary)
+        logging.info(f'Request metrics appended to {args.metrics_file}, summary saved to {args.metrics_summary}')
         
     end_time = time.time()
     
@@ -1,11 +1,19 @@
 import os
+import sys
 import json
 import openai
-from retry import retry
 import argparse
+import asyncio
 import logging
 import time
 from tqdm import tqdm
+from async_inference import run_prompts_async
+from checkpoint import load_completed, append_record, merge_records, write_output, checkpoint_file
+from response_cache import ResponseCache, PromptCache
+from inference_metrics import MetricsLogger, new_usage, record_cache_status, write_summary
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from resilient_http import resilient, get_breaker, LLM_TIMEOUT
 
 os.environ["OPENAI_API_KEY"] = 'your_OpenAI_api_key'
 openai.api_key = os.environ["OPENAI_API_KEY"]
@@ -19,21 +27,135 @@ def read_prompts(input_file):
     return prompts
 
 
-# Get an answer from the OpenAI-API
-@retry(tries=3, delay=5, max_delay=25)
-def GPT_repsonse(prompt, model, temperature, max_tokens ): 
+def record_api_usage(usage, completion):
+    """Copy the token counts the API reports into the request's usage dict."""
+    if usage is None or not completion.get('usage'):
+        return
+    usage['prompt_tokens'] = completion['usage']['prompt_tokens']
+    usage['completion_tokens'] = completion['usage']['completion_tokens']
+    usage['token_source'] = 'api'
+
+
+# Get an answer from the OpenAI-API. Only the request is retried, the cache is checked once in GPT_repsonse
+@resilient(tries=5, base_delay=2, max_delay=60, breaker_name='openai')
+def GPT_request(prompt, model, temperature, max_tokens, usage=None):
+    if usage is not None:
+        usage['attempts'] += 1
+    
+    message=[{"role": "user", "content": prompt}]
+    completion = openai.ChatCompletion.create(
+                                            model=model,
+                                            messages=message,
+                                            temperature=temperature,
+                                            max_tokens=max_tokens,
+                                            request_timeout=LLM_TIMEOUT,
+    )
+    response = completion.choices[0]["message"]["content"]
+    record_api_usage(usage, completion)
+    
+    return response
+
+
+# Get an answer from the response cache or, on a miss, from the OpenAI-API
+def GPT_repsonse(prompt, model, temperature, max_tokens, cache=None, usage=None, endpoint=None): 
+    if cache is not None:
+        response = cache.get('openai', model, prompt, temperature, max_tokens, endpoint)
+        record_cache_status(usage, response)
+        if response is not None:
+            return response
+    
+    response = GPT_request(prompt, model, temperature, max_tokens, usage=usage)
+    
+    if cache is not None:
+        cache.put('openai', model, prompt, temperature, max_tokens, response, endpoint)
+    
+    return response
+
+
+# Async version of GPT_request, used with --async_mode. Retries and the response cache are handled by run_prompts_async
+async def GPT_response_async(prompt, model, temperature, max_tokens, usage=None):
+    if usage is not None:
+        usage['attempts'] += 1
+    
     message=[{"role": "user", "content": prompt}]
-    response = openai.ChatCompletion.create(
+    completion = await openai.ChatCompletion.acreate(
                                             model=model,
                                             messages=message,
                                             temperature=temperature,
                                             max_tokens=max_tokens,
+                                            request_timeout=LLM_TIMEOUT,
     )
-    response = response.choices[0]["message"]["content"]
+    response = completion.choices[0]["message"]["content"]
+    record_api_usage(usage, completion)
     
     return response
 
 
+def batch_custom_id(file, index):
+    return f'{file}|{index}'
+
+
+def export_batch_requests(input_folder, file_names, batch_dir, model, temperature, max_tokens):
+    """Write one OpenAI Batch API request JSONL per prompt file. custom_id is '<prompt file>|<index>'."""
+    if not os.path.exists(batch_dir):
+        os.makedirs(batch_dir)
+    
+    for file in file_names:
+        prompts = read_prompts(f'{input_folder}/{file}')
+        batch_file = os.path.join(batch_dir, file.replace('.json', '.batch.jsonl'))
+        with open(batch_file, 'w', encoding='utf-8') as f:
+            for i, prompt in enumerate(prompts):
+                request = {'custom_id': batch_custom_id(file, i),
+                           'method': 'POST',
+                           'url': '/v1/chat/completions',
+                           'body': {'model': model,
+                                    'messages': [{'role': 'user', 'content': prompt}],
+                                    'temperature': temperature,
+                                    'max_tokens': max_tokens}}
+                f.write(json.dumps(request, ensure_ascii=False) + '\n')
+        logging.info(f'Wrote {len(prompts)} batch requests to {batch_file}')
+
+
+def ingest_batch_results(input_folder, file_names, batch_results, out_dir, overwrite=False):
+    """Read Batch API result JSONL files (a single file or a directory of them) and write the usual
+    [{'index', 'prompt', 'extraction'}] output file per prompt file. Records that are already in the output file or
+    its sidecar are kept (unless `overwrite`), so a retry batch of failed requests adds to an earlier ingest or run.
+    Failed requests are left out and logged, a later normal run fills them in because it skips the indices that are
+    already in the output file."""
+    if os.path.isdir(batch_results):
+        result_files = [os.path.join(batch_results, file) for file in sorted(os.listdir(batch_results)) if file.endswith('.jsonl')]
+    else:
+        result_files = [batch_results]
+    
+    extractions = {}
+    for result_file in result_files:
+        with open(result_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                file, index = result['custom_id'].rsplit('|', 1)
+                response = result.get('response') or {}
+                if result.get('error') or response.get('status_code') != 200:
+                    logging.warning(f"Request {result['custom_id']} failed: {result.get('error') or response.get('status_code')}")
+                    continue
+                extractions.setdefault(file, {})[int(index)] = response['body']['choices'][0]['message']['content']
+    
+    for file in file_names:
+        if file not in extractions:
+            continue
+        prompts = read_prompts(f'{input_folder}/{file}')
+        # Keep what an earlier run or ingest already completed (output file and sidecar), the batch results win
+        completed = {} if overwrite else load_completed(f'{out_dir}/{file}', prompts, 'extraction')
+        kept = len(completed.keys() - extractions[file].keys())
+        completed.update(extractions[file])
+        generated_extractions = merge_records(prompts, completed, 'extraction')
+        if len(generated_extractions) < len(prompts):
+            logging.warning(f'{len(prompts) - len(generated_extractions)} of {len(prompts)} results are missing for {file}')
+        write_output(f'{out_dir}/{file}', generated_extractions)
+        logging.info(f'Saved {len(extractions[file])} batch results and {kept} earlier results to {out_dir}/{file}')
+
+
 def main(): 
     
     logging.basicConfig(level=logging.INFO)
@@ -42,22 +164,53 @@ def main():
     start_time = time.time()
     parser = argparse.ArgumentParser()
     
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'export_batch', 'ingest_batch'],
+                        help='run: call the API, export_batch: write Batch API request files, ingest_batch: convert Batch API results into output files')
     parser.add_argument('--input_folder', type=str, default='data_with_prompts', help='Input directory')
     parser.add_argument('--model_name', type=str, default='gpt-4', help='OpenAI model name')
     parser.add_argument('--out_dir', type=str, default='generated_output_by_GPT4', help='Output directory')
+    parser.add_argument('--start_file', type=int, default=None, help='Index of the first prompt file to process (sorted by name)')
+    parser.add_argument('--end_file', type=int, default=None, help='Index after the last prompt file to process (sorted by name)')
+    parser.add_argument('--async_mode', action='store_true', help='Send requests concurrently with asyncio')
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum number of requests in flight in async mode')
+    parser.add_argument('--rpm', type=int, default=None, help='Requests per minute limit in async mode')
+    parser.add_argument('--tpm', type=int, default=None, help='Tokens per minute limit in async mode')
+    parser.add_argument('--api_base', type=str, default=None, help='Alternative API base URL, e.g. a local mock endpoint')
+    parser.add_argument('--overwrite', action='store_true', help='Ignore existing outputs and checkpoints and regenerate everything')
+    parser.add_argument('--cache_file', type=str, default='llm_response_cache.sqlite', help='SQLite file of the LLM response cache')
+    parser.add_argument('--cache_size', type=int, default=100000, help='Maximum number of cached responses (least recently used are evicted)')
+    parser.add_argument('--no_cache', action='store_true', help='Bypass the response cache, e.g. for sampling runs')
+    parser.add_argument('--metrics_file', type=str, default='inference_metrics.jsonl', help='JSONL file the per-request latency, token usage, retries and cache status are appended to')
+    parser.add_argument('--metrics_summary', type=str, default='inference_metrics_summary.json', help='File to save the per-file/per-model summary of this run')
+    parser.add_argument('--batch_dir', type=str, default='batch_requests', help='Output directory of export_batch')
+    parser.add_argument('--batch_results', type=str, default='batch_results', help='Batch API result JSONL file or directory for ingest_batch')
     
     args = parser.parse_args()
     
+    if args.api_base:
+        openai.api_base = args.api_base
+    
     if os.path.exists(args.input_folder) and os.path.isdir(args.input_folder):
        
-        file_names = os.listdir(args.input_folder)
+        file_names = sorted(os.listdir(args.input_folder))[args.start_file:args.end_file]
     else:
         print(f"The folder '{args.input_folder}' does not exist or is not a directory.")
+    
+    if args.command == 'export_batch':
+        export_batch_requests(args.input_folder, file_names, args.batch_dir, args.model_name, temperature=0.5, max_tokens=2000)
+        return
         
     if not os.path.exists(args.out_dir):
         os.makedirs(args.out_dir)
     
-    for file in file_names[5:11]:
+    if args.command == 'ingest_batch':
+        ingest_batch_results(args.input_folder, file_names, args.batch_results, args.out_dir, overwrite=args.overwrite)
+        return
+    
+    cache = None if args.no_cache else ResponseCache(args.cache_file, max_entries=args.cache_size)
+    metrics = MetricsLogger(args.metrics_file)
+    
+    for file in file_names:
         prompt_file = f'{args.input_folder}/{file}'
         prompts = read_prompts(prompt_file)
         #prompts = prompts[:3]
@@ -65,18 +218,52 @@ def main():
     
         logging.info(f'Read the input file: {prompt_file}. Number of instances: {total_instances}. Extraction started.')
     
-        generated_extractions = []
+        outfile = prompt_file.split('/')[-1]
+        output_file = f'{args.out_dir}/{outfile}'
+        
+        completed = {} if args.overwrite else load_completed(output_file, prompts, 'extraction')
+        pending = [i for i in range(total_instances) if i not in completed]
+        logging.info(f'{len(completed)} instances already done, {len(pending)} left.')
     
-        for i, prompt in enumerate(tqdm(prompts, desc=f"Passing inputs through {args.model_name} for inference", total=total_instances)):
-            extraction = GPT_repsonse(prompt, args.model_name, temperature=0.5,  max_tokens=2000)
-            generated_extractions.append({'index': i, 'prompt': prompt, 'extraction': extraction})
+        with open(checkpoint_file(output_file), 'w' if args.overwrite else 'a', encoding='utf-8') as checkpoint:
+            if args.async_mode:
+                async def request_fn(prompt, usage):
+                    return await GPT_response_async(prompt, args.model_name, temperature=0.5, max_tokens=2000, usage=usage)
+                
+                def on_result(position, extraction, usage):
+                    i = pending[position]
+                    completed[i] = extraction
+                    append_record(checkpoint, i, prompts[i], extraction, 'extraction')
+                    metrics.log(args.model_name, file, i, prompts[i], extraction, usage)
+                
+                asyncio.run(run_prompts_async([prompts[i] for i in pending], request_fn, concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm, max_tokens=2000,
+                                              desc=f"Passing inputs through {args.model_name} for inference", on_result=on_result,
+                                              breaker=get_breaker('openai'),
+                                              cache=PromptCache(cache, 'openai', args.model_name, 0.5, 2000, args.api_base) if cache is not None else None))
+            else:
+                for i in tqdm(pending, desc=f"Passing inputs through {args.model_name} for inference", total=len(pending)):
+                    usage = new_usage()
+                    usage['start'] = time.time()
+                    extraction = GPT_repsonse(prompts[i], args.model_name, temperature=0.5,  max_tokens=2000, cache=cache, usage=usage, endpoint=args.api_base)
+                    usage['end'] = time.time()
+                    completed[i] = extraction
+                    append_record(checkpoint, i, prompts[i], extraction, 'extraction')
+                    metrics.log(args.model_name, file, i, prompts[i], extraction, usage)
     
-        outfile = prompt_file.split('/')[-1]
+        generated_extractions = merge_records(prompts, completed, 'extraction')
+    
+        logging.info(f'Extraction finished. Saved the results to {output_file}')
+    
+        write_output(output_file, generated_extractions)
     
-        logging.info(f'Extraction finished. Saved the results to {args.out_dir}/{outfile}')
+    if cache is not None:
+        logging.info(f'Response cache: {cache.stats()}')
+        cache.close()
     
-        with open(f'{args.out_dir}/{outfile}', 'w', encoding='utf-8') as output_file:
-            json.dump(generated_extractions, output_file, indent=4, ensure_ascii=False)
+    metrics.close()
+    if metrics.records:
+        write_summary(metrics.records, args.metrics_summary)
+        logging.info(f'Request metrics appended to {args.metrics_file}, summary saved to {args.metrics_summary}')
         
     end_time = time.time()
     
@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+import logging
+import time
+import openai
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from async_inference import RateLimiter, run_prompts_async
+from checkpoint import load_completed, append_record, merge_records, write_output, checkpoint_file
+from response_cache import ResponseCache, PromptCache
+from inference_metrics import MetricsLogger, write_summary
+from run_inference_OpenAI import read_prompts, GPT_response_async
+from run_inference_LangChain_HF import HF_request
+from langchain_huggingface import HuggingFaceEndpoint
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from resilient_http import get_breaker, LLM_TIMEOUT
+
+
+def read_matrix(matrix_file):
+    """Read the (model, prompt file) matrix. Every job needs a backend ('openai' or 'huggingface'), a model_name and an out_dir,
+    and can set concurrency, rpm, tpm, endpoint_url (huggingface) and files (all prompt files by default)."""
+    with open(matrix_file, 'r', encoding='utf-8') as f:
+        matrix = json.load(f)
+    return matrix
+
+
+def make_request_fn(job, cache, api_base=None):
+    """The request function of a job, its max tokens, the view of the response cache for its model (None without a
+    cache) and the thread pool its requests run in (None for OpenAI)."""
+    if job['backend'] == 'openai':
+        async def request_fn(prompt, usage):
+            return await GPT_response_async(prompt, job['model_name'], temperature=0.5, max_tokens=2000, usage=usage)
+        prompt_cache = PromptCache(cache, 'openai', job['model_name'], 0.5, 2000, api_base) if cache is not None else None
+        return request_fn, 2000, prompt_cache, None
+
+    if job['backend'] == 'huggingface':
+        if job.get('endpoint_url'):
+            llm = HuggingFaceEndpoint(endpoint_url=job['endpoint_url'], max_new_tokens=512, temperature=0.5, timeout=LLM_TIMEOUT)
+        else:
+            llm = HuggingFaceEndpoint(repo_id=job['model_name'], max_new_tokens=512, temperature=0.5, timeout=LLM_TIMEOUT, huggingfacehub_api_token=os.environ.get("HUGGINGFACEHUB_API_TOKEN"))
+
+        # The endpoint client is synchronous, so each request runs in a worker thread of the job's own pool, sized to its
+        # concurrency so that one model cannot take the threads of another. Retries are handled by run_prompts_async,
+        # so the undecorated HF_request is used.
+        executor = ThreadPoolExecutor(max_workers=job.get('concurrency', 4), thread_name_prefix=job['model_name'])
+
+        async def request_fn(prompt, usage):
+            return await asyncio.get_running_loop().run_in_executor(executor, partial(HF_request.__wrapped__, llm, prompt, usage))
+        prompt_cache = PromptCache(cache, 'huggingface', job['model_name'], 0.5, 512, job.get('endpoint_url')) if cache is not None else None
+        return request_fn, 512, prompt_cache, executor
+
+    raise ValueError(f"Unknown backend: {job['backend']}")
+
+
+async def run_job_file(job, prompt_file, request_fn, max_tokens, prompt_cache, semaphore, limiter, breaker, progress, overwrite, metrics):
+    output_key = 'extraction' if job['backend'] == 'openai' else 'generated_text'
+    prompts = read_prompts(prompt_file)
+    output_file = os.path.join(job['out_dir'], os.path.basename(prompt_file))
+
+    completed = {} if overwrite else load_completed(output_file, prompts, output_key)
+    pending = [i for i in range(len(prompts)) if i not in completed]
+    progress.total += len(pending)
+    progress.refresh()
+
+    with open(checkpoint_file(output_file), 'w' if overwrite else 'a', encoding='utf-8') as checkpoint:
+        def on_result(position, output, usage):
+            i = pending[position]
+            completed[i] = output
+            append_record(checkpoint, i, prompts[i], output, output_key)
+            metrics.log(job['model_name'], os.path.basename(prompt_file), i, prompts[i], output, usage)
+
+        await run_prompts_async([prompts[i] for i in pending], request_fn, max_tokens=max_tokens, on_result=on_result,
+                                semaphore=semaphore, limiter=limiter, progress=progress, breaker=breaker, cache=prompt_cache)
+
+    write_output(output_file, merge_records(prompts, completed, output_key))
+    logging.info(f"{job['model_name']}: saved {len(completed)} results to {output_file}")
+
+
+async def run_matrix(matrix, input_folder, cache, overwrite, metrics, api_base=None):
+    file_names = sorted(os.listdir(input_folder))
+    tasks = []
+    task_names = []
+    progress_bars = []
+    executors = []
+
+    for position, job in enumerate(matrix['jobs']):
+        if not os.path.exists(job['out_dir']):
+            os.makedirs(job['out_dir'])
+
+        # Every model gets its own concurrency cap, rate limits and progress bar, shared by all of its prompt files
+        semaphore = asyncio.Semaphore(job.get('concurrency', 4))
+        limiter = RateLimiter(rpm=job.get('rpm'), tpm=job.get('tpm'))
+        # A model whose endpoint keeps failing is stopped by its own circuit breaker without stopping the others
+        breaker = get_breaker(f"{job['backend']}:{job['model_name']}")
+        progress = tqdm(total=0, desc=job['model_name'], position=position, dynamic_ncols=True)
+        progress_bars.append(progress)
+        request_fn, max_tokens, prompt_cache, executor = make_request_fn(job, cache, api_base)
+        if executor is not None:
+            executors.append(executor)
+
+        for file in job.get('files') or file_names:
+            tasks.append(run_job_file(job, os.path.join(input_folder, file), request_fn, max_tokens, prompt_cache, semaphore, limiter, breaker, progress, overwrite, metrics))
+            task_names.append(f"{job['model_name']} on {file}")
+
+    try:
+        # A failed (model, prompt file) job does not stop the others; its finished records stay in its checkpoint
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        for progress in progress_bars:
+            progress.close()
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    failed = [(name, result) for name, result in zip(task_names, results) if isinstance(result, BaseException)]
+    for name, error in failed:
+        logging.error(f'Job {name} failed: {error!r}', exc_info=error)
+    if failed:
+        logging.error(f'{len(failed)} of {len(tasks)} jobs failed; run the matrix again to resume them')
+
+
+def main():
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('Start Logging')
+    # Record the start time
+    start_time = time.time()
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--matrix', type=str, default='inference_matrix.json', help='JSON file with the (model, prompt file) jobs')
+    parser.add_argument('--input_folder', type=str, default='data_with_prompts', help='Input directory')
+    parser.add_argument('--api_base', type=str, default=None, help='Alternative OpenAI API base URL, e.g. a local mock endpoint')
+    parser.add_argument('--overwrite', action='store_true', help='Ignore existing outputs and checkpoints and regenerate everything')
+    parser.add_argument('--cache_file', type=str, default='llm_response_cache.sqlite', help='SQLite file of the LLM response cache')
+    parser.add_argument('--cache_size', type=int, default=100000, help='Maximum number of cached responses (least recently used are evicted)')
+    parser.add_argument('--no_cache', action='store_true', help='Bypass the response cache, e.g. for sampling runs')
+    parser.add_argument('--metrics_file', type=str, default='inference_metrics.jsonl', help='JSONL file the per-request latency, token usage, retries and cache status are appended to')
+    parser.add_argument('--metrics_summary', type=str, default='inference_metrics_summary.json', help='File to save the per-file/per-model summary of this run')
+
+    args = parser.parse_args()
+
+    if args.api_base:
+        openai.api_base = args.api_base
+
+    matrix = read_matrix(args.matrix)
+    cache = None if args.no_cache else ResponseCache(args.cache_file, max_entries=args.cache_size)
+    metrics = MetricsLogger(args.metrics_file)
+
+    asyncio.run(run_matrix(matrix, args.input_folder, cache, args.overwrite, metrics, args.api_base))
+
+    if cache is not None:
+        logging.info(f'Response cache: {cache.stats()}')
+        cache.close()
+
+    metrics.close()
+    if metrics.records:
+        write_summary(metrics.records, args.metrics_summary)
+        logging.info(f'Request metrics appended to {args.metrics_file}, summary saved to {args.metrics_summary}')
+
+    end_time = time.time()
+
+    # Calculate the elapsed time
+    elapsed_time = (end_time - start_time) / 60
+    print(f"Elapsed time: {elapsed_time:.2f} minutes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import argparse
+import logging
+from collections import Counter
+from triple_utils import read_triples
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_triples_seven_passes(data):
+    """The original read_triples of evaluate.py: one full all(...) pass over the data per candidate shape.
+    Kept as the reference for triple_utils.read_triples."""
+    if isinstance(data, list) and all(isinstance(item, list) for item in data):
+        return data
+    if isinstance(data, list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'predicate', 'object']) for item in data):
+        return [[item['subject'], item['predicate'], item['object']] for item in data]
+    if isinstance(data, list) and all(isinstance(item, dict) and all(key in item for key in ['Subject', 'Predicate', 'Object']) for item in data):
+        return [[item['Subject'], item['Predicate'], item['Object']] for item in data]
+    if isinstance(data, list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'relation', 'object']) for item in data):
+        return [[item['subject'], item['relation'], item['object']] for item in data]
+    for container in ['Triples', 'triples', 'knowledge_triples']:
+        if isinstance(data, dict) and container in data and isinstance(data[container], list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'predicate', 'object']) for item in data[container]):
+            return [[item['subject'], item['predicate'], item['object']] for item in data[container]]
+    return None
+
+
+def compare(old, new):
+    if old is None:
+        return 'not read by either' if new is None else 'only read by the single pass'
+    if new is not None and [tuple(triple) for triple in old] == [tuple(triple) for triple in new]:
+        return 'same triples'
+    return 'different triples'
+
+
+def best_times(functions, records, repeat):
+    """Best time of each function over all records. The functions take turns in every repetition, so a slower
+    stretch of the machine affects all of them alike."""
+    best = [float('inf')] * len(functions)
+    for _ in range(repeat):
+        for position, function in enumerate(functions):
+            start_time = time.perf_counter()
+            for record in records:
+                function(record)
+            best[position] = min(best[position], time.perf_counter() - start_time)
+    return best
+
+
+def main():
+    """Read the triples of every shipped post-processed output with the seven-pass reader and with the single-pass
+    normalizer: compare what they read and their records/sec per model."""
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('Start Logging')
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--input_dir', type=str, default='2_inference_module/postprocessed_outputs', help='Directory with one folder of post-processed outputs per model')
+    parser.add_argument('--repeat', type=int, default=100, help='Timing repetitions; the best one is reported')
+    parser.add_argument('--out_file', type=str, default=os.path.join(MODULE_DIR, 'read_triples_benchmark.json'), help='File to save the benchmark results (default: next to this script)')
+
+    args = parser.parse_args()
+
+    results = []
+    agreement = Counter()
+    print(f"{'model':25} {'records':>8} {'seven passes/s':>15} {'single pass/s':>15} {'speedup':>8}")
+    for model in sorted(os.listdir(args.input_dir)):
+        folder = os.path.join(args.input_dir, model)
+        if not os.path.isdir(folder):
+            continue
+        records = []
+        for file in sorted(os.listdir(folder)):
+            if file.endswith('.json'):
+                with open(os.path.join(folder, file), 'r', encoding='utf-8') as f:
+                    records.extend(item['postprocessed'] for item in json.load(f))
+
+        model_agreement = Counter(compare(read_triples_seven_passes(record), read_triples(record)) for record in records)
+        agreement.update(model_agreement)
+        old_time, new_time = best_times([read_triples_seven_passes, read_triples], records, args.repeat)
+        result = {'model': model, 'records': len(records),
+                  'seven passes records/sec': round(len(records) / old_time, 1),
+                  'single pass records/sec': round(len(records) / new_time, 1),
+                  'speedup': round(old_time / new_time, 2),
+                  'agreement': dict(model_agreement.most_common())}
+        results.append(result)
+        print(f"{model:25} {len(records):8} {result['seven passes records/sec']:15.1f} {result['single pass records/sec']:15.1f} {result['speedup']:8.2f}")
+
+    logging.info(f'Agreement over all records: {dict(agreement.most_common())}')
+    with open(args.out_file, 'w', encoding='utf-8') as f:
+        json.dump({'agreement': dict(agreement.most_common()), 'results': results}, f, indent=4, ensure_ascii=False)
+    logging.info(f'Benchmark results saved to {args.out_file}')
+
+
+if __name__ == '__main__':
+    main()
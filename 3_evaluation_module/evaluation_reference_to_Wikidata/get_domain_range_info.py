@@ -1,10 +1,13 @@
 import json
 import os
 import argparse
-from string import Template
-from retry import retry
 import requests_cache
 import requests
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from resilient_http import resilient_get
+from property_constraints import PropertyConstraints
 
 
 def read_json_file(file_path):
@@ -12,7 +15,6 @@ def read_json_file(file_path):
         data = json.load(f)
     return data
 
-@retry(tries=3, delay=2, max_delay=5)
 def execute_sparql_query(query):
     endpoint_url = "https://query.wikidata.org/sparql"
     headers = {
@@ -23,7 +25,7 @@ def execute_sparql_query(query):
     }
 
     try:
-        response = requests.get(endpoint_url, headers=headers, params=params)
+        response = resilient_get(endpoint_url, headers=headers, params=params)
         response.raise_for_status()
         data = response.json()
         return data
@@ -35,97 +37,27 @@ def execute_sparql_query(query):
         print("Timeout Error:", errt)
     except requests.exceptions.RequestException as err:
         print("Something went wrong:", err)
-        
-def get_bindings_from_sparql_query(query, query_type='instanceOf'):
-    
-    response = execute_sparql_query(query)
-    bindings = response['results']['bindings']
-    zero_hop_dict = {}
-    one_hop_dict = {}
-    two_hop_dict = {}
-    three_hop_dict = {}
-    
-    if query_type == 'instanceOf' or query_type == 'subclassOf':
-        hop1 = 'superClass'
-        hop2 = 'superSuperClass'
-        hop3 = 'superSuperSuperClass'
-
-        for i in bindings:
-            #print(i)
-            if query_type in i:
-                query_type_uri = i[query_type]['value'].split('/')[-1]
-                query_type_label = i[f'{query_type}Label']['value']
-                zero_hop_dict[query_type_label] = query_type_uri
-
-            if hop1 in i:
-                hop1_uri = i[hop1]['value'].split('/')[-1]
-                hop1_label = i[f'{hop1}Label']['value']
-                one_hop_dict[hop1_label] = hop1_uri
-            
-            if hop2 in i:
-                hop2_uri = i[hop2]['value'].split('/')[-1]
-                hop2_label = i[f'{hop2}Label']['value']
-                two_hop_dict[hop2_label] = hop2_uri
-                
-            if hop3 in i:
-                hop3_uri = i[hop3]['value'].split('/')[-1]
-                hop3_label = i[f'{hop3}Label']['value']
-                three_hop_dict[hop3_label] = hop3_uri
-                
-        results_dict = {'zero_hop': zero_hop_dict, 'one_hop': one_hop_dict, 'two_hop': two_hop_dict, 'three_hop': three_hop_dict}
-            
-    if query_type == 'domain' or query_type == 'range':
-        for i in bindings:
-            #print(i)
-            if query_type in i:
-                query_type_uri = i[query_type]['value'].split('/')[-1]
-                query_type_label = i[f'{query_type}Label']['value']
-                zero_hop_dict[query_type_label] = query_type_uri
-        results_dict = zero_hop_dict
-        
-    return results_dict
 
 
 def main():
     parser = argparse.ArgumentParser()
     
     parser.add_argument('--input_dir', type=str, default='3_evaluation_module/evaluation_reference_to_Wikidata/14_Jun_24_evaluation_Llama/extracted_relations_and_entities', help='Directory to read extraction files')
+    parser.add_argument('--batch_size', type=int, default=200, help='Properties per SPARQL query when prefetching domain and range constraints')
 
     args = parser.parse_args()
     
     if not os.path.exists(args.input_dir):
         print(f"'{args.input_dir}' does not exist. Please check the folder name and try again.")
 
-    endpoint_url = "https://query.wikidata.org/sparql"
-
-    domain_check = Template("""
-        PREFIX wd: <http://www.wikidata.org/entity/>
-        PREFIX p: <http://www.wikidata.org/prop/>
-        PREFIX ps: <http://www.wikidata.org/prop/statement/>
-
-        SELECT ?domain ?domainLabel 
-        WHERE {
-        wd:$item p:P2302 [ps:P2302 wd:Q21503250; pq:P2308 ?domain].
-        
-        SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
-        }
-        """)
-
-    range_check = Template("""
-        PREFIX wd: <http://www.wikidata.org/entity/>
-        PREFIX p: <http://www.wikidata.org/prop/>
-        PREFIX ps: <http://www.wikidata.org/prop/statement/>
+    relation_files = sorted(file for file in os.listdir(args.input_dir) if file.startswith("relations"))
 
-        SELECT ?range ?rangeLabel 
-        WHERE {
+    # Domain and range of all relations of all files, fetched with batched queries before they are counted
+    property_constraints = PropertyConstraints(execute_sparql_query, batch_size=args.batch_size)
+    property_constraints.prefetch(relation[1] for file in relation_files for relation in read_json_file(os.path.join(args.input_dir, file)))
 
-        wd:$item  p:P2302 [ps:P2302 wd:Q21510865; pq:P2308 ?range].
-        
-        SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
-        }
-        """)
     all_stats = []
-    for file in os.listdir(args.input_dir):
+    for file in relation_files:
         if file.startswith("relations"):
             print(file)
             has_domain = 0
@@ -137,8 +69,7 @@ def main():
                 if relation == "no-wikiID":
                     continue
                 else: 
-                    domain_query = domain_check.substitute(item=relation)
-                    domain_results = get_bindings_from_sparql_query(domain_query, query_type='domain')
+                    domain_results = property_constraints.get(relation, 'domain')
                     if domain_results == {}:
                         #print(f"{relation} has no domain information")
                         domain_info = False
@@ -147,8 +78,7 @@ def main():
                         domain_info = True
                         has_domain += 1
                     
-                    range_query = range_check.substitute(item=relation)
-                    range_results = get_bindings_from_sparql_query(range_query, query_type='range')
+                    range_results = property_constraints.get(relation, 'range')
                     if range_results == {}:
                         #print(f"{relation} has no range information")
                         range_info = False
@@ -163,6 +93,7 @@ def main():
                               "relations with range": has_range, 
                               "relations with domain and range": has_domain_and_range})
             
+    print(f"Domain and range lookups: {property_constraints.stats()}")
     sorted_by_file = sorted(all_stats, key=lambda x: x['file'])
 
     with open(f'{args.input_dir}/domain_range_stats.json', "w", encoding="utf-8") as f:
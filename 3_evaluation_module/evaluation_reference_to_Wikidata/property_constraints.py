@@ -0,0 +1,69 @@
+import logging
+from string import Template
+
+# Property constraint types (P2302) whose class qualifiers (P2308) are read as the domain and the range of a property
+CONSTRAINT_TYPES = {'Q21503250': 'domain', 'Q21510865': 'range'}
+
+constraints_query = Template("""
+        PREFIX wd: <http://www.wikidata.org/entity/>
+        PREFIX p: <http://www.wikidata.org/prop/>
+        PREFIX ps: <http://www.wikidata.org/prop/statement/>
+        PREFIX pq: <http://www.wikidata.org/prop/qualifier/>
+
+        SELECT ?property ?constraint ?class ?classLabel
+        WHERE {
+        VALUES ?property { $properties }
+        VALUES ?constraint { wd:Q21503250 wd:Q21510865 }
+        ?property p:P2302 [ps:P2302 ?constraint; pq:P2308 ?class].
+
+        SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
+        }
+        """)
+
+
+class PropertyConstraints:
+    """In-memory table of the domain and range classes ({label: ID}) of Wikidata properties. `prefetch` fetches
+    the constraints of all given properties with one SPARQL query per `batch_size` properties (a VALUES clause)
+    instead of a domain and a range query per lookup. Properties that were not prefetched are fetched on their
+    first lookup. Properties of a failed query are not stored, so they are tried again on their next lookup; until
+    then they have no domain and range."""
+
+    def __init__(self, execute_sparql_query, batch_size=200):
+        self.execute_sparql_query = execute_sparql_query
+        self.batch_size = batch_size
+        self.table = {}
+        self.queries = 0
+        self.failed_queries = 0
+        self.lookups = 0
+
+    def fetch(self, properties):
+        query = constraints_query.substitute(properties=' '.join(f'wd:{item}' for item in properties))
+        self.queries += 1
+        response = self.execute_sparql_query(query)
+        if response is None:
+            self.failed_queries += 1
+            logging.warning(f'Domain and range query of {len(properties)} properties failed')
+            return
+        for item in properties:
+            self.table[item] = {'domain': {}, 'range': {}}
+        for binding in response['results']['bindings']:
+            item = binding['property']['value'].split('/')[-1]
+            kind = CONSTRAINT_TYPES[binding['constraint']['value'].split('/')[-1]]
+            self.table[item][kind][binding['classLabel']['value']] = binding['class']['value'].split('/')[-1]
+
+    def prefetch(self, properties):
+        new = sorted({item for item in properties if item != 'no-wikiID' and item not in self.table})
+        for start in range(0, len(new), self.batch_size):
+            self.fetch(new[start:start + self.batch_size])
+        logging.info(f'Prefetched the domain and range of {len(new)} properties: {self.stats()}')
+
+    def get(self, item, kind):
+        """Domain (kind='domain') or range (kind='range') classes of a property."""
+        self.lookups += 1
+        if item not in self.table:
+            self.fetch([item])
+        return self.table.get(item, {}).get(kind, {})
+
+    def stats(self):
+        return {'properties': len(self.table), 'lookups': self.lookups, 'SPARQL queries': self.queries,
+                'failed queries': self.failed_queries}
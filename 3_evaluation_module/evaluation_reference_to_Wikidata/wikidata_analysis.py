@@ -2,12 +2,19 @@ import requests
 import requests_cache
 import json
 import os
-from retry import retry
 from string import Template
 from tqdm import tqdm
 import argparse
 import logging
 import time 
+import sys
+import unicodedata
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from resilient_http import resilient_get
+from triple_utils import read_triples, instance_key
+from property_constraints import PropertyConstraints
 
 # Enable cache and specify the cache name (it will be stored in a file with this name)
 requests_cache.install_cache('wikidata_cache', backend='sqlite', expire_after=172800)  # Cache expires after 48 hours (in seconds)
@@ -24,57 +31,76 @@ def read_jsonlines(gold_file_path):
     return data
 
 
-def read_triples(data):
-    # Try reading from a list of lists
-    if isinstance(data, list) and all(isinstance(item, list) for item in data):
-        return data
-    
-    # Try reading from a list of dicts with keys: subject, predicate, object
-    if isinstance(data, list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'predicate', 'object']) for item in data):
-        lists_data = [[item['subject'], item['predicate'], item['object']] for item in data]
-        return lists_data
-    
-        # Try reading from a list of dicts with keys: subject, predicate, object
-    if isinstance(data, list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'relation', 'object']) for item in data):
-        lists_data = [[item['subject'], item['relation'], item['object']] for item in data]
-        return lists_data
-    
-    # Try reading from a dict with key "Triples" and value as a list of dicts
-    if isinstance(data, dict) and 'Triples' in data and isinstance(data['Triples'], list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'predicate', 'object']) for item in data['Triples']):
-        lists_data = [[item['subject'], item['predicate'], item['object']] for item in data['Triples']]
-        return lists_data
-    
-        # Try reading from a dict with key "Triples" and value as a list of dicts
-    if isinstance(data, dict) and 'triples' in data and isinstance(data['triples'], list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'predicate', 'object']) for item in data['triples']):
-        lists_data = [[item['subject'], item['predicate'], item['object']] for item in data['triples']]
-        return lists_data
-    
-    if isinstance(data, dict) and 'knowledge_triples' in data and isinstance(data['knowledge_triples'], list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'predicate', 'object']) for item in data['knowledge_triples']):
-        lists_data = [[item['subject'], item['predicate'], item['object']] for item in data['knowledge_triples']]
-        return lists_data
-    
-    # If none of the above conditions match
-    #print("Invalid data structure format.")
-    return None  # Return None for invalid data structures
-
 # Get an answer from Wikidata API
-@retry(tries=3, delay=2, max_delay=25)
-def get_wiki_ID(query, query_type='entity'):
+def search_wiki_ID(query, query_type='entity'):
+  """First Wikidata ID the search API returns for the query, or 'no-wikiID' if it finds nothing.
+  Raises if the API cannot be reached or does not answer with JSON."""
   if query_type == 'entity':
     url = f"https://www.wikidata.org/w/api.php?action=wbsearchentities&search={query}&language=en&format=json"
   if query_type == 'property':
     url = f"https://www.wikidata.org/w/api.php?action=wbsearchentities&search={query}&type=property&language=en&format=json"
-  try:
-    data = requests.get(url).json()
-    # Return the first id (Could upgrade this in the future)
+  data = resilient_get(url).json()
+  # Return the first id (Could upgrade this in the future)
+  if isinstance(data, dict) and data.get('search'):
     return data['search'][0]['id']
-  except:
-    return 'no-wikiID'
+  return 'no-wikiID'
+
+
+class WikidataLookupError(Exception):
+    """A Wikidata ID search failed (the API could not be reached, its circuit breaker is open, or it did not answer
+    with JSON). Unlike 'no-wikiID', this says nothing about whether the surface form is in Wikidata."""
+
+
+class WikiIDMemo:
+    """Process-level memo of Wikidata ID searches in front of requests_cache, keyed on the NFKC-normalized,
+    case-folded surface form and the query type, so 'United States' and 'united states' are searched once per run.
+    Searches that find nothing are memoized too ('no-wikiID'). Failed searches are not memoized and raise
+    WikidataLookupError, so they are tried again on the next lookup and never counted as 'no-wikiID'."""
+
+    def __init__(self):
+        self.ids = {}
+        self.hits = 0
+        self.negative_hits = 0
+        self.searches = 0
+        self.failures = 0
+
+    @staticmethod
+    def key(query, query_type):
+        return unicodedata.normalize('NFKC', str(query)).casefold().strip(), query_type
+
+    def get(self, query, query_type='entity'):
+        key = self.key(query, query_type)
+        if key in self.ids:
+            self.hits += 1
+            if self.ids[key] == 'no-wikiID':
+                self.negative_hits += 1
+            return self.ids[key]
+        self.searches += 1
+        try:
+            wiki_ID = search_wiki_ID(query, query_type)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.failures += 1
+            logging.warning(f'Wikidata ID search for {query!r} failed: {e}')
+            raise WikidataLookupError(f'Wikidata ID search for {query!r} failed') from e
+        self.ids[key] = wiki_ID
+        return wiki_ID
+
+    def stats(self):
+        lookups = self.hits + self.searches
+        return {'lookups': lookups, 'memo hits (HTTP round trips avoided)': self.hits, 'memo hits of no-wikiID': self.negative_hits,
+                'searches': self.searches, 'failed searches': self.failures, 'distinct surface forms': len(self.ids),
+                'hit rate': round(self.hits / lookups, 4) if lookups else 0}
+
+
+WIKI_IDS = WikiIDMemo()
+
+
+def get_wiki_ID(query, query_type='entity'):
+  return WIKI_IDS.get(query, query_type)
 
-@retry(tries=3, delay=2, max_delay=25)
 def check_triple_exists(sparql_query_template, endpoint_url, triple):
     sparql_query = sparql_query_template.format(subject=triple[0], predicate=triple[1], object=triple[2])
-    response = requests.get(endpoint_url, params={'query': sparql_query, 'format': 'json'})
+    response = resilient_get(endpoint_url, params={'query': sparql_query, 'format': 'json'})
     #print(response)
     data = response.json()
     #print(data)
@@ -82,7 +108,6 @@ def check_triple_exists(sparql_query_template, endpoint_url, triple):
     
     return result
 
-@retry(tries=3, delay=2, max_delay=5)
 def execute_sparql_query(query):
     endpoint_url = "https://query.wikidata.org/sparql"
     headers = {
@@ -93,7 +118,7 @@ def execute_sparql_query(query):
     }
 
     try:
-        response = requests.get(endpoint_url, headers=headers, params=params)
+        response = resilient_get(endpoint_url, headers=headers, params=params)
         response.raise_for_status()
         data = response.json()
         return data
@@ -143,18 +168,45 @@ def get_bindings_from_sparql_query(query, query_type='instanceOf'):
                 three_hop_dict[hop3_label] = hop3_uri
                 
         results_dict = {'zero_hop': zero_hop_dict, 'one_hop': one_hop_dict, 'two_hop': two_hop_dict, 'three_hop': three_hop_dict}
-            
-    if query_type == 'domain' or query_type == 'range':
-        for i in bindings:
-            #print(i)
-            if query_type in i:
-                query_type_uri = i[query_type]['value'].split('/')[-1]
-                query_type_label = i[f'{query_type}Label']['value']
-                zero_hop_dict[query_type_label] = query_type_uri
-        results_dict = zero_hop_dict
         
     return results_dict
     
+def fallback_predicate(relation, complicated_relations):
+    """Wikidata property ID of a relation without its leading auxiliary ('is a ', 'has been ', ...), for relations
+    that have no ID themselves."""
+    predicate = 'no-wikiID'
+    try: 
+        for i in complicated_relations:
+            if relation.startswith(i):
+                predicate = relation.split(i)[-1]
+                predicate = get_wiki_ID(predicate, query_type='property')
+
+    except (AttributeError, TypeError):
+        predicate = 'no-wikiID'
+    return predicate
+
+
+def prefetch_property_constraints(input_dir, files, complicated_relations, property_constraints):
+    """Resolve the predicates of all extraction files and fetch the domain and range of the distinct properties
+    in a few batched SPARQL queries, before the files are evaluated."""
+    properties = set()
+    for file in tqdm(files, desc='Collecting predicates', total=len(files)):
+        extractions = read_json_file(os.path.join(input_dir, file))
+        for item in extractions:
+            for triple in read_triples(item["postprocessed"]) or []:
+                if len(triple) != 3:
+                    continue
+                try:
+                    predicate = get_wiki_ID(triple[1], query_type='property')
+                    if predicate == 'no-wikiID':
+                        predicate = fallback_predicate(triple[1], complicated_relations)
+                except WikidataLookupError:
+                    # Looked up again when the file is evaluated, its constraints are then fetched on first use
+                    continue
+                properties.add(predicate)
+    property_constraints.prefetch(properties)
+
+
 def find_matching_classes(entity_dict, relation_dict):
     match_exists = False
     matching_level = None
@@ -206,6 +258,7 @@ def evaluate():
     parser.add_argument('--input_dir', type=str, default='2_inference_module/postprocessed_outputs/post_processed_Llama', help='Directory to read extraction files')
     parser.add_argument('--gold_file', type=str, default= '1_data_module/1_data_preprocessing/RED-fm/test.jsonl', help='File to get the text from which the extractions were made')
     parser.add_argument('--out_dir', type=str, default='3_evaluation_module/evaluation_reference_to_Wikidata/14_Jun_24_evaluation_Llama', help='Directory to save evaluation results')
+    parser.add_argument('--constraints_batch_size', type=int, default=200, help='Properties per SPARQL query when prefetching domain and range constraints')
     
     args = parser.parse_args()
     
@@ -264,38 +317,17 @@ def evaluate():
                 }
         """)
 
-    domain_check = Template("""
-        PREFIX wd: <http://www.wikidata.org/entity/>
-        PREFIX p: <http://www.wikidata.org/prop/>
-        PREFIX ps: <http://www.wikidata.org/prop/statement/>
-
-        SELECT ?domain ?domainLabel 
-        WHERE {
-        wd:$item p:P2302 [ps:P2302 wd:Q21503250; pq:P2308 ?domain].
-        
-        SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
-        }
-        """)
-
-    range_check = Template("""
-        PREFIX wd: <http://www.wikidata.org/entity/>
-        PREFIX p: <http://www.wikidata.org/prop/>
-        PREFIX ps: <http://www.wikidata.org/prop/statement/>
-
-        SELECT ?range ?rangeLabel 
-        WHERE {
-
-        wd:$item  p:P2302 [ps:P2302 wd:Q21510865; pq:P2308 ?range].
-        
-        SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
-        }
-        """)
-
     ##########################################################################################################################
     gold_data = read_jsonlines(args.gold_file)
+    # Records are joined to their gold instance on their instance key, whatever their order in the file
+    gold_text = {line: instance['Text'] for line, instance in enumerate(gold_data)}
     
     files = os.listdir(args.input_dir)
 
+    # Domain and range of every predicate come from one table, filled with batched queries before the evaluation
+    property_constraints = PropertyConstraints(execute_sparql_query, batch_size=args.constraints_batch_size)
+    prefetch_property_constraints(args.input_dir, files, complicated_relations, property_constraints)
+
     for file in tqdm(files, desc='Reading extraction files', total=len(files)):
         print(file)
         start_time = time.time()
@@ -306,6 +338,7 @@ def evaluate():
         extraction_reading_problems = []
         all_triples = []
         malformed_triples = []
+        failed_lookup_triples = []
         all_relations = set()
         all_entities = set()
         
@@ -332,8 +365,12 @@ def evaluate():
 
         has_domain_range_both_subject_and_object_has_wikiId = 0
 
-        for index, item in tqdm(enumerate(extractions), desc=f"Evaluating triples from: {file}", total=len(extractions)):
-            input_text = gold_data[index]['Text']
+        for position, item in tqdm(enumerate(extractions), desc=f"Evaluating triples from: {file}", total=len(extractions)):
+            index = instance_key(item, position)
+            if index not in gold_text:
+                logging.warning(f'{file}: record {position} has the instance key {index}, which is not in the gold file')
+                continue
+            input_text = gold_text[index]
             triples =read_triples(item["postprocessed"])
             
             if triples == None:
@@ -354,23 +391,22 @@ def evaluate():
                 triple_dict[triple_as_key] = {"Extracted from": input_text, 
                                             "String triple": triple}
                 
-                subject = get_wiki_ID(triple[0], query_type='entity')
-                object = get_wiki_ID(triple[2], query_type='entity')
-                predicate = get_wiki_ID(triple[1], query_type='property')
+                try:
+                    subject = get_wiki_ID(triple[0], query_type='entity')
+                    object = get_wiki_ID(triple[2], query_type='entity')
+                    predicate = get_wiki_ID(triple[1], query_type='property')
+                    linked_predicate = fallback_predicate(triple[1], complicated_relations) if predicate == 'no-wikiID' else predicate
+                except WikidataLookupError:
+                    # A failed search is not 'no-wikiID', so the triple is left out of the counts instead
+                    failed_lookup_triples.append(triple)
+                    del triple_dict[triple_as_key]
+                    continue
                 
                 all_relations.add((str(triple[1]), predicate))
                 all_entities.add((str(triple[0]), subject))
                 all_entities.add((str(triple[2]), object))
                 
-                if predicate == 'no-wikiID':
-                        try: 
-                            for i in complicated_relations:
-                                if triple[1].startswith(i):
-                                    predicate = triple[1].split(i)[-1]
-                                    predicate = get_wiki_ID(predicate, query_type='property')
-
-                        except:
-                            predicate = 'no-wikiID'
+                predicate = linked_predicate
 
                 wiki_triple = [subject, predicate, object]
                 #print(wiki_triple)
@@ -382,9 +418,7 @@ def evaluate():
                     triple_dict[triple_as_key]["has Range"] = False
                     continue
                 else:
-                    domain_query = domain_check.substitute(item=predicate)
-                    #print(domain_query)
-                    domain_results = get_bindings_from_sparql_query(domain_query, query_type='domain')
+                    domain_results = property_constraints.get(predicate, 'domain')
                     #print(f"domain res: {domain_results}")
                         
                     if domain_results == {}:
@@ -393,9 +427,7 @@ def evaluate():
                         triple_dict[triple_as_key]["has Domain"] = True
                         triple_dict[triple_as_key]["Domain"] = domain_results
                         
-                    range_query = range_check.substitute(item=predicate)
-                    #print(range_query)
-                    range_results = get_bindings_from_sparql_query(range_query, query_type='range')
+                    range_results = property_constraints.get(predicate, 'range')
                     #print(f"range res: {range_results}")
                         
                     if range_results == {}:
@@ -510,6 +542,7 @@ def evaluate():
         
         print(f'Number of triples: {len(all_triples)} from {file}')
         print(f'Number of malformed triples: {len(malformed_triples)} from {file}')  
+        print(f'Number of triples left out because a Wikidata ID search failed: {len(failed_lookup_triples)} from {file}')
         print(f'Number of triples all components in Wikidata: {triples_with_all_components_in_wikidata} from {file}')
         print(f'Number of statements in Wikidata: {statement_matches} from {file}')
         print(f'Number of triples with matching domain&range: {domain_range_matches} from {file}')
@@ -518,11 +551,13 @@ def evaluate():
         end_time = time.time()
         elapsed_time = (end_time - start_time) / 60
         logging.info(f"Evaluation time: {elapsed_time:.2f} minutes")
+        logging.info(f"Wikidata ID lookups so far: {WIKI_IDS.stats()}")
         
         results_dict = { "Evaluated file": file,
                         "Evaluation time": f"{elapsed_time:.2f} minutes",
                         'Number of extracted triples': len(all_triples), 
                         'Number of malformed triples': len(malformed_triples), 
+                        'Number of triples left out because a Wikidata ID search failed': len(failed_lookup_triples),
                         'Number of triples has domain&range in Wikidata': has_domain_range,
                         'Number of triples with matching domain&range in Wikidata': domain_range_matches,
                         'Number of triples with zero hop match': zero_hop_matches,
@@ -570,6 +605,8 @@ def evaluate():
             json.dump(list(all_entities), f, indent=4, ensure_ascii=False)
     
     logging.info(f"Evaluation of {file} finished. Results saved to {args.out_dir}/results_{file}")
+    logging.info(f"Wikidata ID lookups of this run: {WIKI_IDS.stats()}")
+    logging.info(f"Domain and range lookups of this run: {property_constraints.stats()}")
     
 if __name__ == "__main__":
     evaluate()
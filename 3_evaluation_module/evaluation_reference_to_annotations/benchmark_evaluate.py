@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import argparse
+import logging
+from evaluate import read_json_file, read_jsonlines, read_triples, build_gold_index, evaluate_file
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def evaluate_file_list_scan(extractions, gold_data):
+    """The original scoring loop: gold triples lower-cased again for every record and matched by list scans.
+    Kept as the reference for evaluate_file."""
+    precision = []
+    recall = []
+    nr_of_gold_matches = 0
+    for index, item in enumerate(extractions):
+        gold_triples = [[element.lower() for element in triple] for triple in gold_data[index]["Triples"]]
+        triples = read_triples(item["postprocessed"])
+        if triples is None:
+            precision.append(0)
+            recall.append(0)
+            continue
+        extracted_triples = [[element.lower() for element in triple if type(element) == str] for triple in triples if len(triple) == 3]
+        if len(extracted_triples) == 0:
+            precision.append(0)
+            recall.append(0)
+            continue
+        tp = fp = fn = 0
+        for triple in extracted_triples:
+            if triple in gold_triples:
+                tp += 1
+                nr_of_gold_matches += 1
+            else:
+                fp += 1
+        for triple in gold_triples:
+            if triple not in extracted_triples:
+                fn += 1
+        precision.append(0 if tp + fp == 0 else tp / (tp + fp))
+        recall.append(0 if tp + fn == 0 else tp / (tp + fn))
+    precision = sum(precision) / len(precision)
+    recall = sum(recall) / len(recall)
+    f1 = 0 if precision + recall == 0 else 2 * (precision * recall) / (precision + recall)
+    return {"precision": precision, "recall": recall, "f1": f1}, nr_of_gold_matches
+
+
+def best_time(score, files, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        results = [score(extractions) for extractions in files]
+        best = min(best, time.perf_counter() - start_time)
+    return results, best
+
+
+def main():
+    """Score every extraction file of every model with the list-scan loop and with the gold index,
+    check that the results are identical and compare records/sec."""
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('Start Logging')
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--input_dirs', type=str, nargs='+', default=['2_inference_module/postprocessed_outputs/post_processed_GPT4',
+                                                                       '2_inference_module/postprocessed_outputs/post_processed_Llama',
+                                                                       '2_inference_module/postprocessed_outputs/post_processed_Mistral'], help='Directories with extraction files')
+    parser.add_argument('--gold_file', type=str, default='1_data_module/1_data_preprocessing/RED-fm/test.jsonl', help='Gold standard file')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions; the best one is reported')
+    parser.add_argument('--out_file', type=str, default=os.path.join(MODULE_DIR, 'evaluation_benchmark.json'), help='File to save the benchmark results (default: next to this script)')
+
+    args = parser.parse_args()
+
+    gold_data = read_jsonlines(args.gold_file)
+    start_time = time.perf_counter()
+    gold_index = build_gold_index(gold_data)
+    index_time = time.perf_counter() - start_time
+
+    results = []
+    for input_dir in args.input_dirs:
+        files = [read_json_file(os.path.join(input_dir, file)) for file in sorted(os.listdir(input_dir))]
+        records = sum(len(extractions) for extractions in files)
+
+        expected, list_scan_time = best_time(lambda extractions: evaluate_file_list_scan(extractions, gold_data), files, args.repeat)
+        scored, index_scan_time = best_time(lambda extractions: evaluate_file(extractions, gold_index), files, args.repeat)
+
+        result = {'input_dir': input_dir,
+                  'files': len(files),
+                  'records': records,
+                  'list scan records/sec': round(records / list_scan_time, 1),
+                  'gold index records/sec': round(records / index_scan_time, 1),
+                  'speedup': round(list_scan_time / index_scan_time, 2),
+                  'identical results': expected == scored}
+        results.append(result)
+        print(f"{os.path.basename(input_dir):25} {records:6} records  list scan {result['list scan records/sec']:10.1f}/s  "
+              f"gold index {result['gold index records/sec']:10.1f}/s  x{result['speedup']:.2f}  identical: {result['identical results']}")
+
+    logging.info(f'Gold index built once in {index_time:.3f} seconds')
+    with open(args.out_file, 'w', encoding='utf-8') as f:
+        json.dump({'gold index seconds': round(index_time, 4), 'results': results}, f, indent=4, ensure_ascii=False)
+    logging.info(f'Benchmark results saved to {args.out_file}')
+
+
+if __name__ == '__main__':
+    main()
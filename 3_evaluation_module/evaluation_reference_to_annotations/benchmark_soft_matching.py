@@ -0,0 +1,87 @@
+import os
+import json
+import time
+import argparse
+import logging
+from evaluate import read_json_file, read_jsonlines, build_gold_index, score_file
+from soft_matching import SoftMatcher, component_grams
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def best_time(make_score, files, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        # Every repetition starts without the trigrams of the extracted texts and with a new matcher
+        component_grams.cache_clear()
+        score = make_score()
+        start_time = time.perf_counter()
+        results = [score(extractions) for extractions in files]
+        best = min(best, time.perf_counter() - start_time)
+    return results, best
+
+
+def main():
+    """Score every extraction file of every model with exact matching, with soft matching through the blocking index
+    and with soft matching of all pairs. Check that blocking finds the same matches as all pairs and compare the time
+    of soft to exact scoring and the gold matches both find."""
+
+    logging.basicConfig(level=logging.INFO)
+    logging.info('Start Logging')
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--input_dirs', type=str, nargs='+', default=['2_inference_module/postprocessed_outputs/post_processed_GPT4',
+                                                                       '2_inference_module/postprocessed_outputs/post_processed_Llama',
+                                                                       '2_inference_module/postprocessed_outputs/post_processed_Mistral'], help='Directories with extraction files')
+    parser.add_argument('--gold_file', type=str, default='1_data_module/1_data_preprocessing/RED-fm/test.jsonl', help='Gold standard file')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.6, 0.8], help='Soft matching thresholds to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions; the best one is reported')
+    parser.add_argument('--out_file', type=str, default=os.path.join(MODULE_DIR, 'soft_matching_benchmark.json'), help='File to save the benchmark results (default: next to this script)')
+
+    args = parser.parse_args()
+
+    gold_index = build_gold_index(read_jsonlines(args.gold_file))
+
+    results = []
+    for input_dir in args.input_dirs:
+        files = [read_json_file(os.path.join(input_dir, file)) for file in sorted(os.listdir(input_dir))]
+        records = sum(len(extractions) for extractions in files)
+        exact, exact_time = best_time(lambda: lambda extractions: score_file(extractions, gold_index), files, args.repeat)
+        exact_matches = sum(accumulator.averaged_results()[1] for accumulator in exact)
+
+        for threshold in args.thresholds:
+            component_grams.cache_clear()
+            start_time = time.perf_counter()
+            SoftMatcher(gold_index, threshold)
+            index_time = time.perf_counter() - start_time
+
+            def soft_score(blocking):
+                matcher = SoftMatcher(gold_index, threshold, blocking=blocking)
+                return lambda extractions: score_file(extractions, gold_index, matcher=matcher)
+
+            blocked, blocked_time = best_time(lambda: soft_score(True), files, args.repeat)
+            all_pairs, all_pairs_time = best_time(lambda: soft_score(False), files, args.repeat)
+
+            result = {'input_dir': input_dir,
+                      'threshold': threshold,
+                      'records': records,
+                      'exact seconds': round(exact_time, 4),
+                      'soft seconds': round(blocked_time, 4),
+                      'soft all pairs seconds': round(all_pairs_time, 4),
+                      'blocking index seconds': round(index_time, 4),
+                      'soft / exact time': round(blocked_time / exact_time, 2),
+                      'exact gold matches': exact_matches,
+                      'soft gold matches': sum(accumulator.averaged_results()[1] for accumulator in blocked),
+                      'blocking identical to all pairs': [accumulator.instances for accumulator in blocked] == [accumulator.instances for accumulator in all_pairs]}
+            results.append(result)
+            print(f"{os.path.basename(input_dir):25} threshold {threshold:4.2f}  exact {exact_time:7.3f}s  soft {blocked_time:7.3f}s "
+                  f"(x{result['soft / exact time']:.2f})  all pairs {all_pairs_time:7.3f}s  gold matches {exact_matches} -> {result['soft gold matches']}  "
+                  f"identical to all pairs: {result['blocking identical to all pairs']}")
+
+    with open(args.out_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    logging.info(f'Benchmark results saved to {args.out_file}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import json
+import numpy as np
+
+# Outcome of a triple: an extracted triple that is (not) in the gold triples, or a gold triple that was not extracted
+TRUE_POSITIVE, FALSE_POSITIVE, FALSE_NEGATIVE = range(3)
+GROUPS = ['relation', 'subject type', 'object type']
+OTHER_RELATION = 'other'
+UNTYPED = 'untyped'
+
+
+class BreakdownCodes:
+    """Integer codes of the gold relations and entity types, and the codes of the triples and entities of every gold
+    instance. Extracted predicates that are not a gold relation get the code of 'other', and entities that the gold
+    instance does not give a type (it only types entities whose name starts in lower case) the code of 'untyped'.
+    The outcome of a triple is packed into one integer: ((relation * types + subject type) * types + object type) * 3 + outcome."""
+
+    def __init__(self, relations, entity_types, gold_data):
+        self.relations = relations + [OTHER_RELATION]
+        self.entity_types = entity_types + [UNTYPED]
+        self.relation_codes = {relation.lower(): code for code, relation in enumerate(relations)}
+        self.other = len(relations)
+        self.untyped = len(entity_types)
+        self.types = len(self.entity_types)
+        type_codes = {entity_type.lower(): code for code, entity_type in enumerate(entity_types)}
+        self.instances = [self.instance_codes(instance, type_codes) for instance in gold_data]
+
+    def pack(self, relation, subject_type, object_type):
+        return ((relation * self.types + subject_type) * self.types + object_type) * 3
+
+    def instance_codes(self, instance, type_codes):
+        """(lower-cased gold triple -> packed codes, lower-cased entity -> type)"""
+        entity_codes = {}
+        for sentence in instance.get("Entity Types", []):
+            # 'Luxury vehicle is a/an concept.'
+            entity, _, entity_type = sentence.rpartition(' is a/an ')
+            entity_codes[entity.lower()] = type_codes.get(entity_type.rstrip('.').lower(), self.untyped)
+        triple_codes = {}
+        for triple in instance["Triples"]:
+            subject, predicate, object_ = (element.lower() for element in triple)
+            triple_codes[(subject, predicate, object_)] = self.pack(self.relation_codes.get(predicate, self.other),
+                                                                    entity_codes.get(subject, self.untyped),
+                                                                    entity_codes.get(object_, self.untyped))
+        return triple_codes, entity_codes
+
+    def outcomes(self, index, extracted_triples, gold_counts, matches=None):
+        """Packed outcomes of every extracted triple and of every gold triple that was not extracted, counted like
+        score_instance counts tp, fp and fn. With soft `matches` (the gold triple every extracted triple matches,
+        or None), a matched triple is a true positive with the codes of its gold triple."""
+        triple_codes, entity_codes = self.instances[index]
+        relation_code = self.relation_codes.get
+        entity_code = entity_codes.get
+        other, untyped, types = self.other, self.untyped, self.types
+        outcomes = []
+        for position, triple in enumerate(extracted_triples):
+            match = triple if matches is None else matches[position]
+            if match in gold_counts:
+                outcomes.append(triple_codes[match] + TRUE_POSITIVE)
+            elif len(triple) == 3:
+                subject, predicate, object_ = triple
+                outcomes.append(((relation_code(predicate, other) * types + entity_code(subject, untyped)) * types
+                                 + entity_code(object_, untyped)) * 3 + FALSE_POSITIVE)
+            else:
+                outcomes.append(self.pack(other, untyped, untyped) + FALSE_POSITIVE)
+        extracted_set = set(extracted_triples if matches is None else matches)
+        for triple, count in gold_counts.items():
+            if triple not in extracted_set:
+                outcomes.extend([triple_codes[triple] + FALSE_NEGATIVE] * count)
+        return outcomes
+
+    def names(self, group):
+        return self.relations if group == 'relation' else self.entity_types
+
+
+def load_breakdown_codes(relations_file, entity_types_file, gold_data):
+    with open(relations_file, "r", encoding="utf-8") as f:
+        relations = [relation["Relation"] for relation in json.load(f)]
+    with open(entity_types_file, "r", encoding="utf-8") as f:
+        entity_types = list(json.load(f).values())
+    return BreakdownCodes(relations, entity_types, gold_data)
+
+
+def scores(tp, fp, fn):
+    precision = tp / (tp + fp) if tp + fp else 0
+    recall = tp / (tp + fn) if tp + fn else 0
+    f1 = 2 * (precision * recall) / (precision + recall) if precision + recall else 0
+    return {"precision": precision, "recall": recall, "f1": f1, "tp": tp, "fp": fp, "fn": fn}
+
+
+def breakdown(outcomes, codes):
+    """Precision/recall/F1 over the tp, fp and fn of every relation, subject type and object type that occurs in the
+    packed outcomes. The codes are unpacked with array arithmetic and counted with one bincount per group."""
+    outcomes = np.array(outcomes, dtype=np.int64)
+    outcome = outcomes % 3
+    rest = outcomes // 3
+    group_codes = {'object type': rest % codes.types}
+    rest //= codes.types
+    group_codes['subject type'] = rest % codes.types
+    group_codes['relation'] = rest // codes.types
+    results = {}
+    for group in GROUPS:
+        names = codes.names(group)
+        counts = np.bincount(group_codes[group] * 3 + outcome, minlength=3 * len(names)).reshape(len(names), 3)
+        results[group] = {names[code]: scores(*(int(count) for count in counts[code])) for code in np.flatnonzero(counts.any(axis=1))}
+    return results
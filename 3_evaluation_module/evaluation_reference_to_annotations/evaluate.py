@@ -1,8 +1,19 @@
+import csv
 import json
 import os
+import sys
 from tqdm import tqdm
 import argparse
 import logging
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from significance import METRICS, Resamples, confidence_intervals, paired_tests
+from breakdown import FALSE_POSITIVE, FALSE_NEGATIVE, load_breakdown_codes, breakdown
+from soft_matching import SoftMatcher, score_matches
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from triple_utils import read_triples, instance_key
 
 
 def read_json_file(file_path):
@@ -17,43 +28,336 @@ def read_jsonlines(gold_file_path):
     return data
 
 
-def read_triples(data):
-    # Try reading from a list of lists
-    if isinstance(data, list) and all(isinstance(item, list) for item in data):
-        return data
-    
-    # Try reading from a list of dicts with keys: subject, predicate, object
-    if isinstance(data, list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'predicate', 'object']) for item in data):
-        lists_data = [[item['subject'], item['predicate'], item['object']] for item in data]
-        return lists_data
-    
-        # Try reading from a list of dicts with keys: Subject, Predicate, Object
-    if isinstance(data, list) and all(isinstance(item, dict) and all(key in item for key in ['Subject', 'Predicate', 'Object']) for item in data):
-        lists_data = [[item['Subject'], item['Predicate'], item['Object']] for item in data]
-        return lists_data
-    
-        # Try reading from a list of dicts with keys: subject, relation, object
-    if isinstance(data, list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'relation', 'object']) for item in data):
-        lists_data = [[item['subject'], item['relation'], item['object']] for item in data]
-        return lists_data
-    
-    # Try reading from a dict with key "Triples" and value as a list of dicts
-    if isinstance(data, dict) and 'Triples' in data and isinstance(data['Triples'], list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'predicate', 'object']) for item in data['Triples']):
-        lists_data = [[item['subject'], item['predicate'], item['object']] for item in data['Triples']]
-        return lists_data
-    
-        # Try reading from a dict with key "Triples" and value as a list of dicts
-    if isinstance(data, dict) and 'triples' in data and isinstance(data['triples'], list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'predicate', 'object']) for item in data['triples']):
-        lists_data = [[item['subject'], item['predicate'], item['object']] for item in data['triples']]
-        return lists_data
-    
-    if isinstance(data, dict) and 'knowledge_triples' in data and isinstance(data['knowledge_triples'], list) and all(isinstance(item, dict) and all(key in item for key in ['subject', 'predicate', 'object']) for item in data['knowledge_triples']):
-        lists_data = [[item['subject'], item['predicate'], item['object']] for item in data['knowledge_triples']]
-        return lists_data
-    
-    # If none of the above conditions match
-    #print("Invalid data structure format.")
-    return None  # Return None for invalid data structures
+def build_gold_index(gold_data):
+    """Gold line number -> lower-cased gold triples of the instance, as a Counter of tuples because an instance can
+    list the same triple twice. Built once and shared by all extraction files, which are joined to it on the
+    instance key of their records."""
+    return {line: Counter(tuple(element.lower() for element in triple) for triple in instance["Triples"]) for line, instance in enumerate(gold_data)}
+
+
+def normalize_extracted(postprocessed):
+    """Lower-cased extracted triples as tuples, or None if the post-processed output has no known triple structure.
+    Triples that do not have three elements are skipped, and elements that are not strings are dropped."""
+    triples = read_triples(postprocessed)
+    if triples is None:
+        return None
+    extracted_triples = []
+    for triple in triples:
+        if len(triple) != 3:
+            continue
+        subject, predicate, object_ = triple
+        if type(subject) == str and type(predicate) == str and type(object_) == str:
+            extracted_triples.append((subject.lower(), predicate.lower(), object_.lower()))
+        else:
+            extracted_triples.append(tuple(element.lower() for element in triple if type(element) == str))
+    return extracted_triples
+
+
+def score_instance(extracted_triples, gold_counts):
+    """(tp, fp, fn) of one instance. Every extracted triple that is in the gold triples counts as a true positive
+    (duplicates too), every gold triple that was not extracted as a false negative."""
+    tp = sum(map(gold_counts.__contains__, extracted_triples))
+    extracted_set = set(extracted_triples)
+    fn = 0
+    for triple, count in gold_counts.items():
+        if triple not in extracted_set:
+            fn += count
+    return tp, len(extracted_triples) - tp, fn
+
+
+def f1_score(precision, recall):
+    if precision + recall == 0:
+        return 0
+    return 2 * (precision * recall) / (precision + recall)
+
+
+class MetricAccumulator:
+    """Per-instance scores (tp, fp, fn, precision, recall) of one extraction file, of a shard of one, or of
+    several files merged together. Instances are keyed by (source file, gold index) and averaged in key order,
+    so merging the accumulators of shards gives exactly the numbers of scoring everything at once.
+    With breakdown codes, the packed outcomes of the triples of every instance are kept as well."""
+
+    def __init__(self):
+        self.instances = {}
+        self.outcomes = {}
+
+    def add(self, source, index, tp, fp, fn, precision, recall, outcomes=None):
+        self.instances[(source, index)] = (tp, fp, fn, precision, recall)
+        if outcomes is not None:
+            self.outcomes[(source, index)] = outcomes
+
+    def merge(self, other):
+        self.instances.update(other.instances)
+        self.outcomes.update(other.outcomes)
+        return self
+
+    def counts(self):
+        """Per-instance columns in key order: tp, fp, fn, precision, recall."""
+        rows = [self.instances[key] for key in sorted(self.instances)]
+        return [list(column) for column in zip(*rows)] if rows else [[], [], [], [], []]
+
+    def subset(self, keys):
+        accumulator = MetricAccumulator()
+        accumulator.instances = {key: self.instances[key] for key in keys}
+        accumulator.outcomes = {key: self.outcomes[key] for key in keys if key in self.outcomes}
+        return accumulator
+
+    def gold_indices(self):
+        return sorted({index for _, index in self.instances})
+
+    def arrays(self, indices=None):
+        """Per-instance tp, fp, fn, precision, recall and number of scored instances as a NumPy array with one row per
+        gold index (all gold indices in order, or the given ones). The instances of several files that share a gold
+        index are summed into one row, so that the gold instance is the unit that the bootstrap resamples."""
+        indices = self.gold_indices() if indices is None else indices
+        position = {index: row for row, index in enumerate(indices)}
+        keys = [key for key in self.instances if key[1] in position]
+        arrays = np.zeros((len(indices), 6))
+        if keys:
+            rows = [position[index] for _, index in keys]
+            np.add.at(arrays[:, :5], rows, np.array([self.instances[key] for key in keys], dtype=float))
+            np.add.at(arrays[:, 5], rows, 1)
+        return arrays
+
+    def averaged_results(self):
+        """Macro-averaged precision/recall/F1 over the instances (the "Averaged results" of the per-file JSON)
+        and the number of gold matches."""
+        tp, fp, fn, precision, recall = self.counts()
+        precision = sum(precision) / len(precision)
+        recall = sum(recall) / len(recall)
+        return {"precision": precision, "recall": recall, "f1": f1_score(precision, recall)}, sum(tp)
+
+    def micro_results(self):
+        """Precision/recall/F1 over the tp, fp and fn summed over all instances."""
+        tp, fp, fn, _, _ = self.counts()
+        tp, fp, fn = sum(tp), sum(fp), sum(fn)
+        precision = tp / (tp + fp) if tp + fp else 0
+        recall = tp / (tp + fn) if tp + fn else 0
+        return {"precision": precision, "recall": recall, "f1": f1_score(precision, recall)}
+
+    def breakdown(self, codes):
+        """Micro precision/recall/F1 per relation, subject type and object type over the outcomes of all instances."""
+        return breakdown([outcome for key in sorted(self.outcomes) for outcome in self.outcomes[key]], codes)
+
+
+def score_file(extractions, gold_index, source='', start=0, codes=None, missing='skip', matcher=None):
+    """Score every instance of one extraction file, or of a shard of it whose records begin at position `start`.
+    Every record is joined to its gold instance on its instance key (the 'index' it carries, its position if it
+    has none), so records can come in any order and files can be shards or partial. An instance without triples
+    gets precision and recall 0 (and all its gold triples count as false negatives). Gold instances without a
+    record are left out, or scored as instances without triples with missing='empty'. With a SoftMatcher, extracted
+    triples also count as true positives if they match a gold triple softly. With breakdown codes, tp, fp and fn are
+    counted from the outcomes of the triples, which the accumulator keeps for the breakdown."""
+    accumulator = MetricAccumulator()
+    unknown = []
+    duplicates = []
+
+    for position, item in enumerate(extractions, start):
+        index = instance_key(item, position)
+        gold_counts = gold_index.get(index)
+        if gold_counts is None:
+            unknown.append(index)
+            continue
+        if (source, index) in accumulator.instances:
+            # The last record of an instance counts, e.g. the newer one of two overlapping shards
+            duplicates.append(index)
+        extracted_triples = normalize_extracted(item["postprocessed"])
+        matches = None if matcher is None else matcher.match(index, extracted_triples or [], gold_counts)
+        outcomes = None if codes is None else codes.outcomes(index, extracted_triples or [], gold_counts, matches)
+        if not extracted_triples:
+            accumulator.add(source, index, 0, 0, sum(gold_counts.values()), 0, 0, outcomes)
+            continue
+
+        if outcomes is None and matches is None:
+            tp, fp, fn = score_instance(extracted_triples, gold_counts)
+        elif outcomes is None:
+            tp, fp, fn = score_matches(matches, gold_counts)
+        else:
+            fp = fn = 0
+            for outcome in outcomes:
+                if outcome % 3 == FALSE_POSITIVE:
+                    fp += 1
+                elif outcome % 3 == FALSE_NEGATIVE:
+                    fn += 1
+            tp = len(outcomes) - fp - fn
+
+        if tp + fp == 0:
+            precision = 0
+        else:
+            precision = tp / (tp + fp)
+
+        if tp + fn == 0:
+            recall = 0
+        else:
+            recall = tp / (tp + fn)
+
+        accumulator.add(source, index, tp, fp, fn, precision, recall, outcomes)
+
+    if duplicates:
+        logging.warning(f'{source}: {len(duplicates)} records repeat the instance key of an earlier record, e.g. {duplicates[:5]}')
+    if unknown:
+        logging.warning(f'{source}: {len(unknown)} records have an instance key that is not in the gold file, e.g. {unknown[:5]}')
+    scored = len(accumulator.instances)
+    if scored < len(gold_index):
+        if missing == 'empty':
+            for index, gold_counts in gold_index.items():
+                if (source, index) not in accumulator.instances:
+                    outcomes = None if codes is None else codes.outcomes(index, [], gold_counts)
+                    accumulator.add(source, index, 0, 0, sum(gold_counts.values()), 0, 0, outcomes)
+        logging.warning(f"{source}: {len(gold_index) - scored} gold instances have no record, "
+                        f"{'scored without triples' if missing == 'empty' else 'left out'}")
+
+    return accumulator
+
+
+def evaluate_file(extractions, gold_index):
+    """Macro-averaged precision, recall and F1 over the instances of one extraction file, and the number of gold matches."""
+    return score_file(extractions, gold_index).averaged_results()
+
+
+# Gold index, breakdown codes and soft matcher of a pool worker, built once per process by the pool initializer
+GOLD_INDEX = None
+BREAKDOWN_CODES = None
+SOFT_MATCHER = None
+
+
+def load_gold_index(gold_file, relations_file=None, entity_types_file=None, soft_threshold=None):
+    global GOLD_INDEX, BREAKDOWN_CODES, SOFT_MATCHER
+    gold_data = read_jsonlines(gold_file)
+    GOLD_INDEX = build_gold_index(gold_data)
+    if relations_file and entity_types_file:
+        BREAKDOWN_CODES = load_breakdown_codes(relations_file, entity_types_file, gold_data)
+    if soft_threshold is not None:
+        SOFT_MATCHER = SoftMatcher(GOLD_INDEX, soft_threshold)
+
+
+def score_extraction_file(input_dir, file, missing='skip'):
+    """Pool task: score one extraction file against the gold index of this process."""
+    extractions = read_json_file(os.path.join(input_dir, file))
+    return input_dir, file, score_file(extractions, GOLD_INDEX, source=file, codes=BREAKDOWN_CODES, missing=missing, matcher=SOFT_MATCHER)
+
+
+def model_name(input_dir):
+    """'.../post_processed_Llama' -> 'Llama'"""
+    name = os.path.basename(os.path.normpath(input_dir))
+    return name[len('post_processed_'):] if name.startswith('post_processed_') else name
+
+
+def template_name(file):
+    """'post_processed_one_shot_CoT_prompts_test.json' -> 'one_shot_CoT_prompts_test'"""
+    name = file[len('post_processed_'):] if file.startswith('post_processed_') else file
+    return os.path.splitext(name)[0]
+
+
+def merged_by_model(accumulators):
+    """model -> one MetricAccumulator with the instances of all files of the model."""
+    totals = {}
+    for (model, _), accumulator in sorted(accumulators.items()):
+        totals.setdefault(model, MetricAccumulator()).merge(accumulator)
+    return totals
+
+
+def comparison_rows(accumulators, resamples=None, alpha=0.05):
+    """One row per (template, model) and one 'all templates' row per model with the merged accumulators of its files.
+    `accumulators` maps (model, template) -> MetricAccumulator. With `resamples`, every metric gets a bootstrap
+    confidence interval."""
+    rows = []
+    row_accumulators = []
+    models = sorted({model for model, _ in accumulators})
+    templates = sorted({template for _, template in accumulators})
+    totals = {model: MetricAccumulator() for model in models}
+    for template in templates + ['all templates']:
+        for model in models:
+            if template == 'all templates':
+                accumulator = totals[model]
+            elif (model, template) in accumulators:
+                accumulator = accumulators[(model, template)]
+                totals[model].merge(accumulator)
+            else:
+                continue
+            macro, nr_of_gold_matches = accumulator.averaged_results()
+            micro = accumulator.micro_results()
+            rows.append({'template': template, 'model': model, 'instances': len(accumulator.instances),
+                         'macro precision': macro['precision'], 'macro recall': macro['recall'], 'macro f1': macro['f1'],
+                         'micro precision': micro['precision'], 'micro recall': micro['recall'], 'micro f1': micro['f1'],
+                         'gold matches': nr_of_gold_matches})
+            row_accumulators.append(accumulator)
+    if resamples is not None:
+        intervals = confidence_intervals([accumulator.arrays() for accumulator in row_accumulators], resamples, alpha)
+        for row, interval in zip(rows, intervals):
+            for metric in METRICS:
+                row[f'{metric} low'], row[f'{metric} high'] = interval[metric]
+    return rows
+
+
+def breakdown_rows(accumulators, codes):
+    """One row per relation, subject type and object type of every (template, model) and of all templates of every model."""
+    rows = []
+    totals = merged_by_model(accumulators)
+    items = sorted(accumulators.items(), key=lambda item: (item[0][1], item[0][0]))
+    items += [((model, 'all templates'), accumulator) for model, accumulator in sorted(totals.items())]
+    for (model, template), accumulator in items:
+        for group, results in accumulator.breakdown(codes).items():
+            for name, result in results.items():
+                rows.append({'template': template, 'model': model, 'group': group, 'name': name, **result})
+    return rows
+
+
+def comparison_tests(accumulators, resamples, alpha=0.05, test_metrics=('macro f1', 'micro f1')):
+    """Paired significance tests of every pair of models on every template (and on all templates they share), and of
+    every pair of templates of every model. The two systems are paired on the gold instances both of them scored."""
+    comparisons = []
+    pairs = []
+    models = sorted({model for model, _ in accumulators})
+    templates = sorted({template for _, template in accumulators})
+    totals = merged_by_model(accumulators)
+
+    def add(compared, group, a, b, accumulator_a, accumulator_b):
+        indices = sorted(set(accumulator_a.gold_indices()) & set(accumulator_b.gold_indices()))
+        if indices:
+            comparisons.append((compared, group, a, b, len(indices)))
+            pairs.append((accumulator_a.arrays(indices), accumulator_b.arrays(indices)))
+
+    for k, model_a in enumerate(models):
+        for model_b in models[k + 1:]:
+            for template in templates:
+                if (model_a, template) in accumulators and (model_b, template) in accumulators:
+                    add('models', template, model_a, model_b, accumulators[(model_a, template)], accumulators[(model_b, template)])
+            # Only the files that both models have
+            shared = totals[model_a].instances.keys() & totals[model_b].instances.keys()
+            add('models', 'all templates', model_a, model_b, totals[model_a].subset(shared), totals[model_b].subset(shared))
+    for model in models:
+        model_templates = [template for template in templates if (model, template) in accumulators]
+        for k, template_a in enumerate(model_templates):
+            for template_b in model_templates[k + 1:]:
+                add('templates', model, template_a, template_b, accumulators[(model, template_a)], accumulators[(model, template_b)])
+
+    rows = []
+    for (compared, group, a, b, instances), tests in zip(comparisons, paired_tests(pairs, resamples, alpha, test_metrics)):
+        for metric in test_metrics:
+            rows.append({'compared': compared, 'group': group, 'a': a, 'b': b, 'instances': instances, 'metric': metric,
+                         **tests[metric]})
+    return rows
+
+
+def write_csv(rows, csv_file):
+    with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_comparison_table(rows, comparison_file):
+    write_csv(rows, comparison_file)
+
+    # Macro F1 per template (rows) and model (columns)
+    models = sorted({row['model'] for row in rows})
+    f1 = {(row['template'], row['model']): row['macro f1'] for row in rows}
+    templates = list(dict.fromkeys(row['template'] for row in rows))
+    print(f"{'macro F1':50}" + ''.join(f'{model:>12}' for model in models))
+    for template in templates:
+        print(f'{template:50}' + ''.join(f"{f1[(template, model)]:12.4f}" if (template, model) in f1 else f"{'-':>12}" for model in models))
+
 
 def evaluate():
     
@@ -62,109 +366,88 @@ def evaluate():
     
     parser = argparse.ArgumentParser()
     
-    parser.add_argument('--input_dir', type=str, default='2_inference_module/postprocessed_outputs/post_processed_Llama', help='Directory to read extraction files')
+    parser.add_argument('--input_dir', '--input_dirs', dest='input_dirs', type=str, nargs='+', default=['2_inference_module/postprocessed_outputs/post_processed_Llama'], help='Directories to read extraction files, one per model')
     parser.add_argument('--gold_file', type=str, default='1_data_module/1_data_preprocessing/RED-fm/test.jsonl', help='File to get the text from which the extractions were made')
-    parser.add_argument('--out_dir', type=str, default='3_evaluation_module/evaluation_reference_to_annotations/Llama_evaluation_results', help='Directory to save evaluation results')
+    parser.add_argument('--out_dir', type=str, default='3_evaluation_module/evaluation_reference_to_annotations/Llama_evaluation_results', help='Directory to save evaluation results. With several input directories, the results of each go to <out_dir>/<model>_evaluation_results')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes scoring extraction files')
+    parser.add_argument('--soft_threshold', type=float, default=None, help='Also count extracted triples as correct if subject, predicate and object each have a normalized character trigram similarity (0-1] to a gold triple of at least this value, e.g. 0.8; exact matching if not given')
+    parser.add_argument('--missing', type=str, default='skip', choices=['skip', 'empty'], help='Gold instances without a record in an extraction file: leave them out, or score them as extractions without triples')
+    parser.add_argument('--relations_file', type=str, default='1_data_module/1_data_preprocessing/relations.json', help='Gold relations for the breakdown per relation')
+    parser.add_argument('--entity_types_file', type=str, default='1_data_module/1_data_preprocessing/entity_types.json', help='Entity types for the breakdown per subject and object type')
+    parser.add_argument('--no_breakdown', action='store_true', help='Skip the breakdown per relation and entity type')
+    parser.add_argument('--breakdown_file', type=str, default=None, help='CSV file for the breakdown across models and templates (default: <out_dir>/breakdown_table.csv)')
+    parser.add_argument('--comparison_file', type=str, default=None, help='CSV file for the comparison table across models and templates (default: <out_dir>/comparison_table.csv)')
+    parser.add_argument('--resamples', type=int, default=0, help='Bootstrap resamples for confidence intervals and paired tests; 0 skips them')
+    parser.add_argument('--trials', type=int, default=10000, help='Approximate randomization trials of the paired tests')
+    parser.add_argument('--alpha', type=float, default=0.05, help='Confidence intervals cover 1 - alpha')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the resamples')
+    parser.add_argument('--significance_file', type=str, default=None, help='CSV file for the paired tests (default: <out_dir>/significance_tests.csv)')
     
     args = parser.parse_args()
-    
-    if not os.path.exists(args.input_dir):
-        print(f"'{args.input_dir}' does not exist. Please check the folder name and try again.")
-        
-    if not os.path.exists(args.out_dir):
-        os.makedirs(args.out_dir)
 
-    gold_data = read_jsonlines(args.gold_file)
+    if args.soft_threshold is not None and not 0 < args.soft_threshold <= 1:
+        parser.error('--soft_threshold must be in (0, 1]')
+    # Results and accumulators are keyed by model name, so two input dirs with the same name would overwrite each other
+    model_names = Counter(model_name(input_dir) for input_dir in args.input_dirs)
+    duplicates = sorted(name for name, count in model_names.items() if count > 1)
+    if duplicates:
+        parser.error(f"input dirs with the same model name would overwrite each other's results: {', '.join(duplicates)}")
+    gold_args = (args.gold_file, None, None, args.soft_threshold) if args.no_breakdown else (args.gold_file, args.relations_file, args.entity_types_file, args.soft_threshold)
     
-    files = os.listdir(args.input_dir)
-
-    for file in tqdm(files, desc='Reading extraction files', total=len(files)):
-        print(file)
-        input_file_path = os.path.join(args.input_dir, file)
-        with open(input_file_path, "r", encoding="utf-8") as f:
-            extractions = json.load(f)
-
-        precision = []
-        recall = []
-        nr_of_gold_matches = 0
-
-        for index, item in tqdm(enumerate(extractions), desc=f"Evaluating triples from: {file}", total=len(extractions)):
-            gold = gold_data[index]["Triples"]
-            gold_triples = []
-            for triple in gold:
-                lower_triple = [item.lower() for item in triple]
-                gold_triples.append(lower_triple)
-            
-            triples =read_triples(item["postprocessed"])
-            if triples == None:
-                #print(f"Invalid data structure format in file: {file}")
-                #print(item["postprocessed"])
-                #print(type(item["postprocessed"]))
-                #print("##############################################")
-                #if type(item["postprocessed"]) == list:
-                    #for i in item["postprocessed"]:
-                        #print(i)
-                        #print(type(i))
-                        #print("-------------------")
-                precision.append(0)
-                recall.append(0)
-                continue
-            else:
-                extracted_triples = []
-                for triple in triples:
-                    if len(triple) != 3:
-                        continue
-                    if type(triple) == None:
-                        continue
-                    else:
-                        lower_triple = []
-                        for item in triple:
-                            if type(item) == str:
-                                lower_triple.append(item.lower())
-                        extracted_triples.append(lower_triple)
-
-                if len(extracted_triples) == 0:
-                    precision.append(0)
-                    recall.append(0)
-                    continue
-
-                tp = 0
-                fp = 0
-                fn = 0
-
-                for triple in extracted_triples:
-                    if triple in gold_triples:
-                        tp += 1
-                        nr_of_gold_matches += 1
-                    else:
-                        fp += 1
-
-                for triple in gold_triples:
-                    if triple not in extracted_triples:
-                        fn += 1
-
-                if tp + fp == 0:
-                    precision.append(0)
-                else:
-                    precision.append(tp / (tp + fp))
-
-                if tp + fn == 0:
-                    recall.append(0)
-                else:
-                    recall.append(tp / (tp + fn))
+    jobs = []
+    out_dirs = {}
+    for input_dir in args.input_dirs:
+        if not os.path.exists(input_dir):
+            print(f"'{input_dir}' does not exist. Please check the folder name and try again.")
+            continue
+        out_dirs[input_dir] = args.out_dir if len(args.input_dirs) == 1 else os.path.join(args.out_dir, f'{model_name(input_dir)}_evaluation_results')
+        os.makedirs(out_dirs[input_dir], exist_ok=True)
+        jobs.extend((input_dir, file) for file in sorted(os.listdir(input_dir)))
 
-        precision = sum(precision) / len(precision)
-        recall = sum(recall) / len(recall)
+    accumulators = {}
 
-        if precision + recall == 0:
-            f1 = 0
-        else:
-            f1 = 2 * (precision * recall) / (precision + recall)
+    def write_results(input_dir, file, accumulator):
+        results, nr_of_gold_matches = accumulator.averaged_results()
+        file_results = {"Averaged results": results, "Number of gold matches": nr_of_gold_matches}
+        if args.soft_threshold is not None:
+            file_results["Soft matching threshold"] = args.soft_threshold
+        if BREAKDOWN_CODES is not None:
+            for group, group_results in accumulator.breakdown(BREAKDOWN_CODES).items():
+                file_results[f"Results per {group}"] = group_results
+        with open(os.path.join(out_dirs[input_dir], file), "w", encoding="utf-8") as f:
+            json.dump(file_results, f, indent=4, ensure_ascii=False)
+        print(f"{input_dir}/{file} Precision: {results['precision']}, Recall: {results['recall']}, F1: {results['f1']}")
+        accumulators[(model_name(input_dir), template_name(file))] = accumulator
+
+    if args.workers > 1:
+        # The main process needs the codes to write the breakdowns
+        load_gold_index(*gold_args[:3])
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=load_gold_index, initargs=gold_args) as executor:
+            futures = [executor.submit(score_extraction_file, input_dir, file, args.missing) for input_dir, file in jobs]
+            for future in tqdm(as_completed(futures), desc='Scoring extraction files', total=len(futures)):
+                write_results(*future.result())
+    else:
+        load_gold_index(*gold_args)
+        for input_dir, file in tqdm(jobs, desc='Reading extraction files', total=len(jobs)):
+            write_results(*score_extraction_file(input_dir, file, args.missing))
+
+    if accumulators:
+        resamples = Resamples(args.resamples, args.trials, args.seed) if args.resamples > 0 else None
+        comparison_file = args.comparison_file or os.path.join(args.out_dir, 'comparison_table.csv')
+        write_comparison_table(comparison_rows(accumulators, resamples, args.alpha), comparison_file)
+        logging.info(f'Comparison table saved to {comparison_file}')
 
-        with open(os.path.join(args.out_dir, file), "w", encoding="utf-8") as f:
-            json.dump({"Averaged results": {"precision": precision, "recall": recall, "f1": f1}, "Number of gold matches": nr_of_gold_matches}, f, indent=4, ensure_ascii=False)
+        if BREAKDOWN_CODES is not None:
+            breakdown_file = args.breakdown_file or os.path.join(args.out_dir, 'breakdown_table.csv')
+            write_csv(breakdown_rows(accumulators, BREAKDOWN_CODES), breakdown_file)
+            logging.info(f'Breakdown per relation and entity type saved to {breakdown_file}')
 
-        print(f"Precision: {precision}, Recall: {recall}, F1: {f1}")
+        if resamples is not None:
+            significance_file = args.significance_file or os.path.join(args.out_dir, 'significance_tests.csv')
+            tests = comparison_tests(accumulators, resamples, args.alpha)
+            write_csv(tests, significance_file)
+            significant = sum(test['bootstrap p'] < args.alpha and test['randomization p'] < args.alpha for test in tests)
+            logging.info(f'{len(tests)} paired tests, {significant} significant at {args.alpha} with both tests, saved to {significance_file}')
 
 if __name__ == "__main__":
-    evaluate()
\ No newline at end of file
+    evaluate()
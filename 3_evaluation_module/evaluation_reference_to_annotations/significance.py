@@ -0,0 +1,107 @@
+import numpy as np
+
+# Columns of the per-instance arrays: sums over the scored instances that share a gold index
+TP, FP, FN, PRECISION, RECALL, INSTANCES = range(6)
+METRICS = ['macro precision', 'macro recall', 'macro f1', 'micro precision', 'micro recall', 'micro f1']
+
+
+def divide(numerator, denominator):
+    """Element-wise numerator / denominator, 0 where the denominator is 0."""
+    numerator, denominator = np.broadcast_arrays(np.asarray(numerator, dtype=float), np.asarray(denominator, dtype=float))
+    return np.divide(numerator, denominator, out=np.zeros(numerator.shape), where=denominator != 0)
+
+
+def metrics(sums):
+    """All metrics from column sums of the per-instance arrays: sums has shape (..., 6), every metric (...)."""
+    macro_precision = divide(sums[..., PRECISION], sums[..., INSTANCES])
+    macro_recall = divide(sums[..., RECALL], sums[..., INSTANCES])
+    micro_precision = divide(sums[..., TP], sums[..., TP] + sums[..., FP])
+    micro_recall = divide(sums[..., TP], sums[..., TP] + sums[..., FN])
+    return {'macro precision': macro_precision, 'macro recall': macro_recall,
+            'macro f1': divide(2 * macro_precision * macro_recall, macro_precision + macro_recall),
+            'micro precision': micro_precision, 'micro recall': micro_recall,
+            'micro f1': divide(2 * micro_precision * micro_recall, micro_precision + micro_recall)}
+
+
+class Resamples:
+    """Bootstrap weights (how often every instance is drawn in each resample) and approximate randomization
+    swap masks, drawn once per number of instances and shared by every system and pair of that size."""
+
+    def __init__(self, resamples, trials, seed):
+        self.resamples = resamples
+        self.trials = trials
+        self.seed = seed
+        self.cache = {}
+
+    def get(self, size):
+        if size not in self.cache:
+            rng = np.random.default_rng([self.seed, size])
+            weights = rng.multinomial(size, np.full(size, 1 / size), size=self.resamples).astype(float)
+            swaps = rng.integers(0, 2, size=(self.trials, size)).astype(float)
+            self.cache[size] = weights, swaps
+        return self.cache[size]
+
+
+def chunks(items, chunk_size):
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+
+def confidence_intervals(systems, resamples, alpha=0.05, chunk_size=64):
+    """Percentile bootstrap intervals of every metric. `systems` is a list of per-instance arrays (instances, 6);
+    systems with the same number of instances are resampled together with one matrix product.
+    Returns one {metric: (low, high)} per system."""
+    intervals = [None] * len(systems)
+    by_size = {}
+    for position, arrays in enumerate(systems):
+        by_size.setdefault(len(arrays), []).append(position)
+    for size, positions in by_size.items():
+        weights, _ = resamples.get(size)
+        for chunk in chunks(positions, chunk_size):
+            # (resamples, systems, 6)
+            sums = np.tensordot(weights, np.stack([systems[position] for position in chunk], axis=1), axes=1)
+            for metric, values in metrics(sums).items():
+                low, high = np.percentile(values, [50 * alpha, 100 - 50 * alpha], axis=0)
+                for k, position in enumerate(chunk):
+                    intervals[position] = intervals[position] or {}
+                    intervals[position][metric] = (float(low[k]), float(high[k]))
+    return intervals
+
+
+def paired_tests(pairs, resamples, alpha=0.05, test_metrics=METRICS, chunk_size=64):
+    """Paired bootstrap and approximate randomization tests of the difference of every metric between system a and
+    system b. `pairs` is a list of (arrays a, arrays b) whose rows are the same instances in the same order.
+    Both tests are two-sided; the bootstrap p-value is the share of resampled differences that are at least as far
+    from the observed difference as the observed difference is from 0.
+    Returns one {metric: {'a value', 'b value', 'delta', 'delta low', 'delta high', 'bootstrap p', 'randomization p'}} per pair."""
+    results = [None] * len(pairs)
+    by_size = {}
+    for position, (arrays_a, arrays_b) in enumerate(pairs):
+        by_size.setdefault(len(arrays_a), []).append(position)
+    for size, positions in by_size.items():
+        weights, swaps = resamples.get(size)
+        for chunk in chunks(positions, chunk_size):
+            # (instances, pairs, 6)
+            arrays_a = np.stack([pairs[position][0] for position in chunk], axis=1)
+            arrays_b = np.stack([pairs[position][1] for position in chunk], axis=1)
+            observed_a = metrics(arrays_a.sum(axis=0))
+            observed_b = metrics(arrays_b.sum(axis=0))
+            bootstrap_a = metrics(np.tensordot(weights, arrays_a, axes=1))
+            bootstrap_b = metrics(np.tensordot(weights, arrays_b, axes=1))
+            # Swapping the outputs of a and b on an instance moves its difference from the sums of a to those of b
+            shifted = np.tensordot(swaps, arrays_b - arrays_a, axes=1)
+            randomized_a = metrics(arrays_a.sum(axis=0) + shifted)
+            randomized_b = metrics(arrays_b.sum(axis=0) - shifted)
+            for metric in test_metrics:
+                delta = observed_a[metric] - observed_b[metric]
+                bootstrap_delta = bootstrap_a[metric] - bootstrap_b[metric]
+                randomized_delta = randomized_a[metric] - randomized_b[metric]
+                low, high = np.percentile(bootstrap_delta, [50 * alpha, 100 - 50 * alpha], axis=0)
+                bootstrap_p = ((np.abs(bootstrap_delta - delta) >= np.abs(delta)).sum(axis=0) + 1) / (resamples.resamples + 1)
+                randomization_p = ((np.abs(randomized_delta) >= np.abs(delta) - 1e-12).sum(axis=0) + 1) / (resamples.trials + 1)
+                for k, position in enumerate(chunk):
+                    results[position] = results[position] or {}
+                    results[position][metric] = {'a value': float(observed_a[metric][k]), 'b value': float(observed_b[metric][k]),
+                                                 'delta': float(delta[k]), 'delta low': float(low[k]), 'delta high': float(high[k]),
+                                                 'bootstrap p': float(bootstrap_p[k]), 'randomization p': float(randomization_p[k])}
+    return results
@@ -0,0 +1,139 @@
+import re
+import unicodedata
+from functools import lru_cache, reduce
+from itertools import repeat
+from operator import or_
+
+NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_component(text):
+    """Unicode-normalized (NFKC), case-folded, punctuation-free text with its tokens sorted:
+    'Country of Citizenship' and 'citizenship, country of' become 'citizenship country of'."""
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    return ' '.join(sorted(NON_WORD.sub(' ', text.casefold()).split()))
+
+
+@lru_cache(maxsize=1 << 16)
+def component_grams(text):
+    """Character trigrams of the normalized text, padded with a space on both sides so short texts have some too.
+    A text that normalizes to nothing gets the empty string as its only gram, so it matches only such texts."""
+    padded = f' {normalize_component(text)} '
+    return frozenset(map(''.join, zip(padded, padded[1:], padded[2:]))) or frozenset([''])
+
+
+def dice(grams_a, grams_b):
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+class SoftGold:
+    """Trigrams of the components of the gold triples of one instance, blocking indexes from every trigram of a
+    subject (object) to the gold triples that have it as a bitmask of their positions, and the gold triples every
+    extracted subject, predicate and object seen so far is similar enough to."""
+
+    def __init__(self, gold_triples, threshold):
+        self.threshold = threshold
+        self.triples = list(gold_triples)
+        self.grams = [tuple(component_grams(element) for element in triple) for triple in self.triples]
+        self.blocks = ({}, None, {})
+        for position, triple_grams in enumerate(self.grams):
+            for component in (0, 2):
+                block = self.blocks[component]
+                for gram in triple_grams[component]:
+                    block[gram] = block.get(gram, 0) | 1 << position
+        self.similar = ({}, {}, {})
+
+    def similar_positions(self, component, text):
+        """{position: similarity} of the gold triples whose subject (0), predicate (1) or object (2) is at least
+        `threshold` similar to the text. Subjects and objects are only compared with the gold triples that share a
+        trigram with them: two texts without a shared trigram have similarity 0, which is below any threshold."""
+        similar = self.similar[component]
+        if text not in similar:
+            grams = component_grams(text)
+            block = self.blocks[component]
+            if block is None:
+                positions = range(len(self.triples))
+            else:
+                positions = bit_positions(reduce(or_, map(block.get, grams, repeat(0)), 0))
+            similar[text] = {}
+            for position in positions:
+                similarity = dice(grams, self.grams[position][component])
+                if similarity >= self.threshold:
+                    similar[text][position] = similarity
+        return similar[text]
+
+
+def bit_positions(mask):
+    positions = []
+    while mask:
+        low = mask & -mask
+        positions.append(low.bit_length() - 1)
+        mask ^= low
+    return positions
+
+
+class SoftMatcher:
+    """Soft matching of extracted triples to the gold triples of their instance: an extracted triple matches a gold
+    triple if the similarity (Dice coefficient of character trigrams of the normalized texts) of its subject,
+    predicate and object to those of the gold triple is each at least `threshold` (> 0); of several such gold
+    triples it matches the one with the highest sum of similarities. Exact matches are found first with a hash
+    lookup. For the other triples, the subject is compared with the candidates of the blocking index, the object
+    only if the subject has similar gold triples, and the predicate only for those similar in subject and object.
+    Results per text are kept per instance, since the same texts come back in the outputs of every template.
+    With blocking=False every pair is compared (the reference for the benchmark)."""
+
+    def __init__(self, gold_index, threshold, blocking=True):
+        self.threshold = threshold
+        self.blocking = blocking
+        self.gold = {index: SoftGold(gold_counts, threshold) for index, gold_counts in gold_index.items()}
+
+    def best_match(self, triple, soft_gold):
+        if len(triple) != 3:
+            return None
+        subject, predicate, object_ = triple
+        if not self.blocking:
+            return self.best_match_all_pairs(triple, soft_gold)
+        subjects = soft_gold.similar_positions(0, subject)
+        if not subjects:
+            return None
+        objects = soft_gold.similar_positions(2, object_)
+        if not objects:
+            return None
+        candidates = subjects.keys() & objects.keys()
+        if not candidates:
+            return None
+        predicates = soft_gold.similar_positions(1, predicate)
+        best, best_score = None, 0
+        for position in sorted(candidates):
+            if position in predicates:
+                score = subjects[position] + predicates[position] + objects[position]
+                if score > best_score:
+                    best, best_score = soft_gold.triples[position], score
+        return best
+
+    def best_match_all_pairs(self, triple, soft_gold):
+        grams = [component_grams(element) for element in triple]
+        best, best_score = None, 0
+        for position, gold_grams in enumerate(soft_gold.grams):
+            similarities = [dice(extracted, gold) for extracted, gold in zip(grams, gold_grams)]
+            if min(similarities) >= self.threshold and sum(similarities) > best_score:
+                best, best_score = soft_gold.triples[position], sum(similarities)
+        return best
+
+    def match(self, index, extracted_triples, gold_counts):
+        """The gold triple every extracted triple matches (itself if it is in the gold triples), or None."""
+        soft_gold = self.gold[index]
+        return [triple if triple in gold_counts else self.best_match(triple, soft_gold) for triple in extracted_triples]
+
+
+def score_matches(matches, gold_counts):
+    """(tp, fp, fn) of one instance from the soft matches: counted like score_instance, with 'is in the gold triples'
+    replaced by 'matches a gold triple'."""
+    tp = len(matches) - matches.count(None)
+    matched = set(matches)
+    fn = 0
+    for triple, count in gold_counts.items():
+        if triple not in matched:
+            fn += count
+    return tp, len(matches) - tp, fn
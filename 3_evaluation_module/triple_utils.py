@@ -0,0 +1,88 @@
+import logging
+
+# Keys (in any case) of a dict that holds the triples, and the keys of a triple written as a dict
+CONTAINER_KEYS = ('triples', 'knowledge_triples', 'triple')
+PREDICATE_KEYS = ('predicate', 'relation')
+# Keys of the subject, predicate and object (or None) per key order of the dicts that miss the lower-case keys
+TRIPLE_KEYS = {}
+
+
+def triple_keys(keys):
+    """The keys of a dict with these keys that hold its subject, predicate and object, matched in any case
+    (a later key wins over an earlier one that is the same in lower case), or None if it is not a triple."""
+    lowered = {key.lower() if isinstance(key, str) else key: key for key in keys}
+    if 'subject' not in lowered or 'object' not in lowered:
+        return None
+    for key in PREDICATE_KEYS:
+        if key in lowered:
+            return (lowered['subject'], lowered[key], lowered['object'])
+    return None
+
+
+def dict_triple(item):
+    """(subject, predicate, object) of a triple written as a dict with keys in any case, 'relation' instead of
+    'predicate' too, or None if the dict is not a triple. Keys besides these three are ignored."""
+    if 'subject' in item and 'object' in item:
+        for key in PREDICATE_KEYS:
+            if key in item:
+                return (item['subject'], item[key], item['object'])
+    keys = tuple(item)
+    if keys not in TRIPLE_KEYS:
+        TRIPLE_KEYS[keys] = triple_keys(keys)
+    keys = TRIPLE_KEYS[keys]
+    if keys is None:
+        return None
+    return (item[keys[0]], item[keys[1]], item[keys[2]])
+
+
+def container_items(data):
+    """The items of a dict that holds the triples: the list (or single triple) under a container key,
+    the dict itself if it is one triple, otherwise its dict values (e.g. {"triple1": {...}, "triple2": {...}}).
+    None if it has none of these, so a dict of other lists (e.g. {"entities": [...]}) gives no triples."""
+    for key, value in data.items():
+        if isinstance(key, str) and key.lower() in CONTAINER_KEYS:
+            return value if isinstance(value, list) else [value]
+    if dict_triple(data) is not None:
+        return [data]
+    values = [value for value in data.values() if isinstance(value, dict)]
+    return values or None
+
+
+def read_triples(data):
+    """Triples of a post-processed extraction as a list, read in a single pass over the items. Lists and tuples
+    are kept as they are (of any length, not copied), dicts become (subject, predicate, object) tuples. Items of
+    another shape are skipped, so a list that mixes lists, dicts and broken items keeps the triples it has.
+    Returns None if the data has items but none of them is a triple; an empty list gives an empty list."""
+    if isinstance(data, dict):
+        data = container_items(data)
+        if data is None:
+            return None
+    elif not isinstance(data, list):
+        return None
+
+    triples = []
+    for item in data:
+        if isinstance(item, (list, tuple)):
+            triples.append(item)
+        elif isinstance(item, dict):
+            triple = dict_triple(item)
+            if triple is not None:
+                triples.append(triple)
+
+    if data and not triples:
+        return None
+    return triples
+
+
+def instance_key(record, position):
+    """Gold line number of an extraction record: its 'index' (the position of its prompt in the prompt file, which
+    follows the lines of the gold file), or its position in the extraction file for records written without one or
+    with one that is not a number."""
+    index = record.get('index')
+    if index is None:
+        return position
+    try:
+        return int(index)
+    except (TypeError, ValueError):
+        logging.warning(f'Record {position} has a non-numeric index {index!r}, using its position in the file instead')
+        return position
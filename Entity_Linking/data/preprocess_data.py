@@ -4,10 +4,13 @@ import json
 import os
 import random
 import argparse 
-from retry import retry
 import requests
 import requests_cache
 from tqdm import tqdm
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from resilient_http import resilient_get
 
 # Enable cache and specify the cache name (it will be stored in a file with this name)
 requests_cache.install_cache('wikidata_cache', backend='sqlite', expire_after=172800)  # Cache expires after 48 hours (in seconds)
@@ -38,7 +41,6 @@ def lookup_relations(relations, search_value, search_key='Relation'):
             return relation[search_key]
 
 # Get an answer from Wikidata API
-@retry(tries=3, delay=2, max_delay=25)       
 def get_wikidata_label_and_description(wikidata_id):
     url = "https://www.wikidata.org/w/api.php"
     params = {
@@ -49,7 +51,7 @@ def get_wikidata_label_and_description(wikidata_id):
         "props": "labels|descriptions"
     }
 
-    response = requests.get(url, params=params)
+    response = resilient_get(url, params=params)
     data = response.json()
 
     if "entities" in data and wikidata_id in data["entities"]:
@@ -6,6 +6,10 @@ import argparse
 import logging
 import requests
 from tqdm import tqdm
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from resilient_http import resilient_get
 
 logging.basicConfig(level=logging.INFO)
 logging.info('Start Logging')
@@ -63,7 +67,7 @@ def get_wikidata_candidates(query_string, quert_type="entity"):
             'props': 'info|labels|descriptions|aliases'
         }
 
-    response = requests.get(url, params=params)
+    response = resilient_get(url, params=params)
     data = response.json()
 
     if "search" in data and len(data["search"]) > 0:
@@ -101,7 +105,7 @@ def search_wikidata_pages(search_term, limit=10):
     }
     
     # Make the request
-    response = requests.get(url, params=params)
+    response = resilient_get(url, params=params)
     
     # Parse the JSON response
     data = response.json()
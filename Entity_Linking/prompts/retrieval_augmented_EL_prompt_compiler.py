@@ -18,9 +18,12 @@ import os
 import argparse
 import logging
 from tqdm import tqdm
-from retry import retry
 import requests
 import requests_cache
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from resilient_http import resilient_get
 
 # Enable cache and specify the cache name (it will be stored in a file with this name)
 requests_cache.install_cache('wikidata_cache', backend='sqlite', expire_after=172800)  # Cache expires after 48 hours (in seconds)
@@ -67,7 +70,6 @@ def get_fixed_prompt_components(path_to_prompt_components):
         
     return prompt_dict
 
-@retry(tries=3, delay=2, max_delay=25) 
 def wikidata_string_search(query_string, query_type="entity"):
     url = "https://www.wikidata.org/w/api.php"
     if query_type == "entity":
@@ -95,7 +97,7 @@ def wikidata_string_search(query_string, query_type="entity"):
             'props': 'info|labels|descriptions|aliases'
         }
 
-    response = requests.get(url, params=params)
+    response = resilient_get(url, params=params)
     data = response.json()
 
     if "search" in data and len(data["search"]) > 0:
@@ -111,7 +113,6 @@ def wikidata_string_search(query_string, query_type="entity"):
         return None
 
 
-@retry(tries=3, delay=2, max_delay=25) 
 def get_label_and_description_for_id(wikidata_id):
     """
     Get the label and description for a single Wikidata entity ID.
@@ -129,7 +130,7 @@ def get_label_and_description_for_id(wikidata_id):
     }
 
     # Make the request to the Wikidata API
-    response = requests.get(base_url, params=params)
+    response = resilient_get(base_url, params=params)
     data = response.json()
 
     # Extract the entity information from the response
@@ -144,7 +145,6 @@ def get_label_and_description_for_id(wikidata_id):
     return result
 
 
-@retry(tries=3, delay=2, max_delay=25) 
 def search_wikidata_pages(search_term, limit=10):
     """
     Search for pages on Wikidata based on the given search term using the MediaWiki API.
@@ -168,7 +168,7 @@ def search_wikidata_pages(search_term, limit=10):
     }
     
     # Make the request
-    response = requests.get(url, params=params)
+    response = resilient_get(url, params=params)
     
     # Parse the JSON response
     data = response.json()
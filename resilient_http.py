@@ -0,0 +1,145 @@
+import time
+import random
+import logging
+import threading
+import functools
+from email.utils import parsedate_to_datetime
+import requests
+
+# (connect, read) timeouts in seconds for the Wikidata API and SPARQL endpoint
+DEFAULT_TIMEOUT = (5, 60)
+# LLM completions can legitimately take minutes
+LLM_TIMEOUT = 180
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without calling the endpoint while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failed calls, so that a dead or throttling endpoint fails fast
+    instead of stalling every caller. A call counts as failed once it has used up its retries, not per attempt, so
+    one unlucky call cannot open the breaker on its own. After `reset_timeout` seconds one trial call is let through (half-open):
+    success closes the breaker again, failure re-opens it."""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f'Circuit breaker for {self.name} is open')
+            # Half-open: let this call through, a failure re-opens the breaker immediately
+            self.failures = self.failure_threshold - 1
+            self.opened_at = None
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                logging.warning(f'Circuit breaker for {self.name} opened after {self.failures} consecutive failures')
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def parse_retry_after(value):
+    """Retry-After is either a number of seconds or an HTTP date."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_from_exception(e):
+    """Retry-After of a failed call, from a requests response or an OpenAI error (both expose the headers)."""
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None) or getattr(e, 'headers', None) or {}
+    return parse_retry_after(headers.get('Retry-After') or headers.get('retry-after'))
+
+
+def backoff_delay(attempt, base_delay=1, max_delay=30, retry_after=None):
+    """Delay before retry number `attempt` (1-based): the server's Retry-After if it sent one,
+    otherwise exponential backoff with full jitter."""
+    if retry_after is not None:
+        return min(retry_after, max_delay)
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+def call_with_backoff(fn, tries=5, base_delay=1, max_delay=30, breaker=None, retry_on=(Exception,)):
+    """Call `fn()` and retry failures with jittered exponential backoff, honoring Retry-After.
+    Calls are refused with CircuitOpenError while `breaker` is open."""
+    for attempt in range(1, tries + 1):
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = fn()
+        except retry_on as e:
+            if isinstance(e, CircuitOpenError):
+                raise
+            if attempt == tries:
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay, retry_after_from_exception(e))
+            logging.warning(f'Call failed ({e}). Retrying in {delay:.1f} seconds (attempt {attempt}/{tries}).')
+            time.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+def resilient(tries=5, base_delay=1, max_delay=30, breaker_name=None):
+    """Decorator version of call_with_backoff, a drop-in replacement for @retry(tries, delay, max_delay)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            breaker = get_breaker(breaker_name) if breaker_name else None
+            return call_with_backoff(lambda: fn(*args, **kwargs), tries=tries, base_delay=base_delay, max_delay=max_delay, breaker=breaker)
+        return wrapper
+    return decorator
+
+
+def resilient_get(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT, tries=5, base_delay=1, max_delay=30):
+    """requests.get with connect/read timeouts, retries on connection errors, timeouts, 429 and 5xx responses,
+    and a circuit breaker per host. Other HTTP errors are returned to the caller as before."""
+    breaker = get_breaker(requests.utils.urlparse(url).netloc)
+
+    def get():
+        response = requests.get(url, params=params, headers=headers, timeout=timeout)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            response.raise_for_status()
+        return response
+
+    return call_with_backoff(get, tries=tries, base_delay=base_delay, max_delay=max_delay, breaker=breaker,
+                             retry_on=(requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError))